@@ -2,21 +2,21 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_migrate import Migrate
-from flask_wtf.csrf import CSRFProtect
 import os
+from app.csrf_masking import MaskedCSRFProtect
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 mail = Mail()
-migrate = Migrate()
-csrf = CSRFProtect()
+csrf = MaskedCSRFProtect()
 
 
 def create_app():
     app = Flask(__name__)
     
     # Configuration
+    from app.config import Config
+    app.config.from_object(Config)
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///bookbazaar.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -29,10 +29,12 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     
     # Initialize extensions
+    from app.utils.sqlite_tuning import sqlite_engine_options, init_sqlite
+    sqlite_engine_options(app)
     db.init_app(app)
+    init_sqlite(app)
     login_manager.init_app(app)
     mail.init_app(app)
-    migrate.init_app(app, db)
     csrf.init_app(app)
     
     login_manager.login_view = 'auth.login'
@@ -41,11 +43,15 @@ def create_app():
     # Import models
     from app.models import User, Book, Category, Order, OrderItem, Cart, CartItem
     
+    from app.utils.invalidation import LocalCache
+    user_cache = LocalCache('user', ttl=app.config.get('USER_CACHE_SECONDS', 300))
+    
     @login_manager.user_loader
     def load_user(user_id):
         if app.config.get('USE_AWS'):
             from app.utils.dynamo_repo import UserRepository
-            user_data = UserRepository().get_by_id(user_id)
+            # Saves publish a 'user' invalidation, so every worker rereads the item after a change
+            user_data = user_cache.get(str(user_id), lambda: UserRepository().get_by_id(user_id))
             if user_data:
                 # Reconstruct User object from dict without DB session
                 user = User()
@@ -61,25 +67,66 @@ def create_app():
     from app.routes.customer import customer_bp
     from app.routes.seller import seller_bp
     from app.routes.admin import admin_bp
+    from app.routes.api import api_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(customer_bp, url_prefix='/customer')
     app.register_blueprint(seller_bp, url_prefix='/seller')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    
+    from app.commands import register_commands
+    register_commands(app)
+    
+    from app.utils.query_stats import init_query_stats
+    init_query_stats(app)
+    
+    from app.utils.access_log import init_access_log
+    init_access_log(app)
+    
+    from app.utils.cdc import init_cdc
+    init_cdc(app)
+    
+    from app.utils.invalidation import init_invalidation_bus
+    init_invalidation_bus(app)
+    
+    from app.utils.reference_data import init_reference_data
+    init_reference_data(app)
     
-    # Create tables
-    if not app.config.get('USE_AWS'):
+    from app.utils.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+    
+    from app.utils.static_assets import init_static_assets
+    init_static_assets(app)
+    
+    from app.utils.compression import init_compression
+    init_compression(app)
+    
+    # Tables and default rows come from `flask init-db`, run once per database rather than on every boot
+    if app.config.get('INIT_DB_ON_START') and not app.config.get('USE_AWS'):
         with app.app_context():
-            db.create_all()
-            # Create default admin if not exists
-            create_default_admin()
-            # Create default categories
-            create_default_categories()
+            init_database()
+    
+    from app.utils.reservations import init_reservation_sweeper
+    init_reservation_sweeper(app)
     
     return app
 
 
+def init_database():
+    """Create missing tables, upgrade existing ones, add the default admin and categories; safe to run again.
+    
+    Returns the columns and indexes the upgrade added.
+    """
+    from app.utils.schema import upgrade_schema
+    db.create_all()
+    changes = upgrade_schema()
+    create_default_admin()
+    create_default_categories()
+    return changes
+
+
 def create_default_admin():
     from app.models import User
     from werkzeug.security import generate_password_hash
@@ -112,8 +159,9 @@ def create_default_categories():
         ('Comics & Graphic Novels', 'Comics, manga, and graphic novels')
     ]
     
+    existing = {name for name, in db.session.query(Category.category_name)}
     for name, description in categories:
-        if not Category.query.filter_by(category_name=name).first():
+        if name not in existing:
             category = Category(category_name=name, description=description)
             db.session.add(category)
     
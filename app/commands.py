@@ -0,0 +1,252 @@
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db
+
+
+def register_commands(app):
+    """Attach BookBazaar maintenance commands to the `flask` CLI"""
+    app.cli.add_command(check_carts)
+    app.cli.add_command(sweep_reservations)
+    app.cli.add_command(import_books)
+    app.cli.add_command(build_recommendations)
+    app.cli.add_command(build_similar)
+    app.cli.add_command(build_bestsellers)
+    app.cli.add_command(catalog_snapshot)
+    app.cli.add_command(changes)
+    app.cli.add_command(compile_templates)
+    app.cli.add_command(build_assets)
+    app.cli.add_command(init_db)
+    app.cli.add_command(MigrateGroup('db', help='Database migrations (Flask-Migrate).'))
+    app.cli.add_command(startup_profile)
+
+
+class MigrateGroup(click.Group):
+    """`flask db`: Flask-Migrate's commands, importing it (and Alembic) only when one of them runs"""
+    
+    def _group(self, ctx):
+        from flask.cli import ScriptInfo
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as group
+        app = ctx.ensure_object(ScriptInfo).load_app()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return group
+    
+    def list_commands(self, ctx):
+        return self._group(ctx).list_commands(ctx)
+    
+    def get_command(self, ctx, name):
+        return self._group(ctx).get_command(ctx, name)
+
+
+@click.command('check-carts')
+@click.option('--fix', is_flag=True, help='Rewrite summaries that disagree with the cart lines.')
+@with_appcontext
+def check_carts(fix):
+    """Recompute cart item counts and subtotals from the cart lines (DynamoDB carts: item counts only)"""
+    checked = 0
+    mismatched = 0
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import CartRepository
+        cart_repo = CartRepository()
+        for cart_data in cart_repo.get_all():
+            checked += 1
+            if not cart_repo.check_consistency(cart_data):
+                mismatched += 1
+                click.echo(f"Cart {cart_data['id']} summary is stale")
+                if fix:
+                    cart_repo.save_cart(cart_data)
+    else:
+        from app.models import Cart
+        for cart in Cart.query.order_by(Cart.id).all():
+            checked += 1
+            if not cart.check_consistency(fix=fix):
+                mismatched += 1
+                click.echo(f'Cart {cart.id} summary is stale')
+        if fix:
+            db.session.commit()
+    click.echo(f'Checked {checked} carts, {mismatched} inconsistent' + (' (fixed)' if fix and mismatched else ''))
+
+
+@click.command('sweep-reservations')
+@with_appcontext
+def sweep_reservations():
+    """Delete expired stock reservations"""
+    from app.models import StockReservation
+    batch_size = current_app.config.get('RESERVATION_SWEEP_BATCH', 500)
+    purged = StockReservation.purge_expired(batch_size)
+    click.echo(f'Reclaimed {purged} expired reservations')
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--seller', 'seller_email', required=True, help='Email of the seller who will own the books.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, help='Rows validated and written per batch.')
+@with_appcontext
+def import_books(path, seller_email, fmt, chunk_size):
+    """Bulk import a CSV/JSONL catalog file for a seller"""
+    import time
+    from app.utils.catalog_import import CatalogImporter, detect_format
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import UserRepository
+        seller = UserRepository().get_by_email(seller_email.lower())
+        seller_id = seller['id'] if seller and seller.get('role') == 'seller' else None
+    else:
+        from app.models import User
+        seller = User.query.filter_by(email=seller_email.lower(), role='seller').first()
+        seller_id = seller.id if seller else None
+    if seller_id is None:
+        raise click.ClickException(f'No seller with email {seller_email}')
+    
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        report = CatalogImporter(seller_id, chunk_size).run(stream, fmt or detect_format(path))
+    elapsed = time.perf_counter() - started
+    for line, message in report.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    click.echo(f'Imported {report.imported} of {report.processed} rows '
+               f'({report.error_count} errors) in {elapsed:.1f}s')
+
+
+@click.command('build-recommendations')
+@click.option('--full', is_flag=True, help='Recount every order instead of only those since the last run.')
+@with_appcontext
+def build_recommendations(full):
+    """Refresh the precomputed "customers also bought" lists from new orders"""
+    from app.utils.copurchase import CoPurchaseRecommender
+    stats = CoPurchaseRecommender().run(full=full)
+    click.echo(f"Co-purchase: {stats['orders']} orders, {stats['pairs']} pairs, "
+               f"{stats['books']} books updated in {stats['seconds']}s")
+
+
+@click.command('build-similar')
+@click.option('--chunk-size', type=int, default=5000, help='Books read per batch from the catalog.')
+@with_appcontext
+def build_similar(chunk_size):
+    """Rebuild the TF-IDF index and every book's "similar titles" list"""
+    from app.utils.content_similarity import ContentSimilarityBuilder
+    stats = ContentSimilarityBuilder(chunk_size=chunk_size).run()
+    click.echo(f"Content similarity: {stats['books']} books, {stats['terms']} terms, "
+               f"{stats['stored']} lists stored in {stats['seconds']}s")
+
+
+@click.command('build-bestsellers')
+@with_appcontext
+def build_bestsellers():
+    """Recount the bestseller counters from order history (checkout keeps them current afterwards)"""
+    from app.utils.bestsellers import rebuild_sales
+    stats = rebuild_sales()
+    click.echo(f"Bestsellers: {stats['books']} books sold, {stats['recent']} in the last 30 days, "
+               f"rebuilt in {stats['seconds']}s")
+
+
+@click.command('catalog-snapshot')
+@click.option('--write', is_flag=True, help='Also publish it as the shared snapshot file workers map.')
+@with_appcontext
+def catalog_snapshot(write):
+    """Load the AWS-mode catalog snapshot once and report its size and build time"""
+    if not current_app.config.get('USE_AWS'):
+        raise click.ClickException('The catalog snapshot only serves AWS mode; SQL mode reads the database.')
+    from app.utils.catalog_snapshot import CatalogSnapshot
+    from app.utils.dynamo_repo import BookRepository, CategoryRepository
+    started = time.perf_counter()
+    snapshot = CatalogSnapshot.build(BookRepository().iter_all(), CategoryRepository().get_all())
+    stats = snapshot.stats()
+    budget = current_app.config.get('CATALOG_SNAPSHOT_MAX_MB', 256)
+    click.echo(f"Catalog snapshot: {stats['books']} books ({stats['active']} active), {stats['memory_mb']} MB "
+               f"of a {budget} MB budget, built in {time.perf_counter() - started:.2f}s")
+    if write:
+        from app.utils.catalog_file import write_catalog
+        from app.utils.catalog_snapshot import CatalogService
+        path = write_catalog(snapshot, CatalogService(current_app).directory)
+        click.echo(f'Wrote {path} ({os.path.getsize(path) / 2 ** 20:.1f} MB)')
+
+
+@click.command('changes')
+@click.option('--consumer', help='Read from this consumer\'s offset and advance it.')
+@click.option('--offset', type=int, default=0, help='Byte offset to start from when no consumer is given.')
+@click.option('--limit', type=int, default=100, help='Most events to print.')
+@with_appcontext
+def changes(consumer, offset, limit):
+    """Print events from the change log and how far behind each consumer is"""
+    from app.utils.cdc import get_change_log
+    log = get_change_log()
+    if log is None:
+        raise click.ClickException('The change log is off (CDC_LOG=false).')
+    show = lambda change: click.echo(f'{change.at} {change.source} {change.op} {change.entity} {change.key} '
+                                     f'{",".join(change.changed)}')
+    if consumer:
+        handled = log.consume(consumer, show, limit)
+        click.echo(f'{handled} events; {consumer} is now at offset {log.offset(consumer)}')
+    else:
+        for _, change in log.read(offset, limit):
+            show(change)
+    for name, behind in log.lag().items():
+        click.echo(f'{name}: {behind} bytes behind')
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates():
+    """Compile every template into the Jinja bytecode cache (run at deploy time)"""
+    from app.utils.fragment_cache import compile_templates as compile_all
+    app = current_app._get_current_object()
+    if app.jinja_env.bytecode_cache is None:
+        click.echo('JINJA_BYTECODE_CACHE is off; nothing to do')
+        return
+    started = time.perf_counter()
+    count = compile_all(app)
+    click.echo(f'Compiled {count} templates in {time.perf_counter() - started:.2f}s')
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets():
+    """Write fingerprinted, pre-compressed copies of the static files (run at deploy time, before workers start)"""
+    from app.utils.static_assets import BUILD_DIR, build_assets as build
+    manifest = build(current_app.static_folder)
+    click.echo(f'Built {len(manifest)} assets into static/{BUILD_DIR}; restart workers to serve them')
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create missing tables, upgrade existing ones, add the default admin and categories (safe to run again)"""
+    if current_app.config.get('USE_AWS'):
+        raise click.ClickException('AWS mode keeps its data in DynamoDB; create the tables with aws_init.py.')
+    from app import init_database
+    started = time.perf_counter()
+    for change in init_database():
+        click.echo(f'Added {change}')
+    click.echo(f'Database ready in {time.perf_counter() - started:.2f}s')
+
+
+@click.command('startup-profile')
+@click.option('--runs', type=int, default=3, help='Fresh interpreters to time create_app in.')
+@click.option('--top', type=int, default=15, help='Packages and modules to list.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write the report as JSON.')
+@click.option('--max-ms', type=float, help='Exit with an error if the median startup exceeds this.')
+@with_appcontext
+def startup_profile(runs, top, output, max_ms):
+    """Time create_app in fresh interpreters and summarize `python -X importtime`"""
+    from app.utils.startup_profile import profile_startup
+    report = profile_startup(runs, top)
+    click.echo(f"create_app: {report['startup_ms']} ms median of {runs} ({report['modules']} modules, "
+               f"{report['import_ms']} ms importing; boto3 {'loaded' if report['aws_loaded'] else 'not loaded'})")
+    click.echo(f"{'package':32} {'self ms':>9}")
+    for name, ms in report['packages'].items():
+        click.echo(f'{name:32} {ms:>9}')
+    click.echo(f"{'module':48} {'cumulative ms':>14}")
+    for module in report['slowest']:
+        click.echo(f"{module['module']:48} {module['cumulative_ms']:>14}")
+    if output:
+        import json
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f'Report written to {output}')
+    if max_ms is not None and report['startup_ms'] > max_ms:
+        raise click.ClickException(f"Startup took {report['startup_ms']} ms, over the {max_ms:g} ms budget")
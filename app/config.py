@@ -17,12 +17,108 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@bookbazaar.com')
     
+    # Guest (anonymous) carts are kept in a signed cookie
+    GUEST_CART_COOKIE = 'bb_guest_cart'
+    GUEST_CART_MAX_LINES = int(os.environ.get('GUEST_CART_MAX_LINES', 50))
+    GUEST_CART_MAX_AGE = 30 * 24 * 3600
+    
+    # Stock holds taken on entering checkout, and the sweeper that reclaims them
+    RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 15 * 60))
+    RESERVATION_SWEEPER = os.environ.get('RESERVATION_SWEEPER', 'True').lower() == 'true'
+    RESERVATION_SWEEP_INTERVAL = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 60))
+    RESERVATION_SWEEP_BATCH = int(os.environ.get('RESERVATION_SWEEP_BATCH', 500))
+    
+    # Rows validated and written per batch by the bulk catalog import
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+    
+    # Add an X-Query-Count header (SQL statements / DynamoDB calls) to every response
+    QUERY_STATS = os.environ.get('QUERY_STATS', 'False').lower() == 'true'
+    
+    # Neighbours kept per book by the recommendation jobs (`flask build-recommendations`)
+    RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', 10))
+    # TF-IDF index written by `flask build-similar` (defaults to instance/content_index)
+    CONTENT_INDEX_DIR = os.environ.get('CONTENT_INDEX_DIR')
+    # How long AWS-mode bestseller lists (summed from a month of day buckets) are reused
+    BESTSELLERS_CACHE_SECONDS = int(os.environ.get('BESTSELLERS_CACHE_SECONDS', 60))
+    
+    # Append sanitized request traces here (see replay.py); unset disables capture
+    ACCESS_LOG_PATH = os.environ.get('ACCESS_LOG_PATH')
+    
+    # AWS-mode catalog reads come from an in-memory snapshot of the Books table, refreshed from
+    # updated_at deltas and fully reloaded now and then (deletions only show up on a full reload)
+    CATALOG_SNAPSHOT = os.environ.get('CATALOG_SNAPSHOT', 'True').lower() == 'true'
+    CATALOG_SNAPSHOT_MAX_MB = int(os.environ.get('CATALOG_SNAPSHOT_MAX_MB', 256))
+    CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', 5))
+    CATALOG_FULL_RELOAD_INTERVAL = int(os.environ.get('CATALOG_FULL_RELOAD_INTERVAL', 600))
+    # Share one snapshot per host: an elected worker writes it to a file every worker maps read-only
+    CATALOG_SNAPSHOT_SHARED = os.environ.get('CATALOG_SNAPSHOT_SHARED', 'False').lower() == 'true'
+    CATALOG_SNAPSHOT_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR')
+    
+    # SQL-mode bitmaps over books (active, in stock, category, genre) answer catalog totals and filter
+    # counts; they follow updated_at at most this many seconds behind
+    BITMAP_INDEX = os.environ.get('BITMAP_INDEX', 'True').lower() == 'true'
+    BITMAP_REFRESH_INTERVAL = int(os.environ.get('BITMAP_REFRESH_INTERVAL', 5))
+    
+    # Committed changes to books, orders, carts and users go to in-process subscribers and,
+    # with CDC_LOG, to an append-only log under CDC_LOG_DIR (default instance/cdc) for offline consumers
+    CDC_ENABLED = os.environ.get('CDC_ENABLED', 'True').lower() == 'true'
+    CDC_LOG = os.environ.get('CDC_LOG', 'True').lower() == 'true'
+    CDC_LOG_DIR = os.environ.get('CDC_LOG_DIR')
+    # The log is written in segments of this size; a segment every consumer has read past is deleted
+    CDC_LOG_SEGMENT_MB = int(os.environ.get('CDC_LOG_SEGMENT_MB', 64))
+    
+    # Committed changes also bump shared-memory counters in INVALIDATION_BUS_PATH (default
+    # instance/invalidation.bus) so every worker on the host drops its cached copies
+    INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'True').lower() == 'true'
+    INVALIDATION_BUS_PATH = os.environ.get('INVALIDATION_BUS_PATH')
+    USER_CACHE_SECONDS = int(os.environ.get('USER_CACHE_SECONDS', 300))
+    # Categories and per-category active counts shared by most templates (see reference_data.py)
+    CATEGORY_CACHE_SECONDS = int(os.environ.get('CATEGORY_CACHE_SECONDS', 300))
+    CATEGORY_COUNTS_SECONDS = int(os.environ.get('CATEGORY_COUNTS_SECONDS', 60))
+    
+    # {% cache %} blocks (book cards, navigation) keep their markup per process, keyed by content;
+    # compiled templates go to JINJA_BYTECODE_CACHE_DIR (default instance/jinja_cache)
+    FRAGMENT_CACHE = os.environ.get('FRAGMENT_CACHE', 'True').lower() == 'true'
+    FRAGMENT_CACHE_SECONDS = int(os.environ.get('FRAGMENT_CACHE_SECONDS', 600))
+    FRAGMENT_CACHE_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_ENTRIES', 5000))
+    JINJA_BYTECODE_CACHE = os.environ.get('JINJA_BYTECODE_CACHE', 'True').lower() == 'true'
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    # Max-age of /api/v1 responses; clients revalidate with If-None-Match after it
+    API_CACHE_SECONDS = int(os.environ.get('API_CACHE_SECONDS', 30))
+    # On-the-fly gzip/brotli for dynamic responses of at least COMPRESSION_MIN_SIZE bytes
+    # (pages carry a freshly masked CSRF token each time, so compression cannot reveal it)
+    COMPRESSION = os.environ.get('COMPRESSION', 'True').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))
+    COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+    # Serve the fingerprinted copies `flask build-assets` writes to app/static/dist, when they exist
+    STATIC_FINGERPRINT = os.environ.get('STATIC_FINGERPRINT', 'True').lower() == 'true'
+    # serve.py: the pre-forking production server (worker class 'sync' or 'threaded')
+    SERVER_BIND = os.environ.get('SERVER_BIND', '0.0.0.0:5000')
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 2))
+    SERVER_WORKER_CLASS = os.environ.get('SERVER_WORKER_CLASS', 'sync')
+    SERVER_PRELOAD = os.environ.get('SERVER_PRELOAD', 'True').lower() == 'true'
+    SERVER_GRACEFUL_TIMEOUT = float(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+    SERVER_METRICS_PATH = os.environ.get('SERVER_METRICS_PATH', '/_server/metrics')
+    # Run `flask init-db` work (create_all, default admin and categories) in create_app; off outside throwaway setups
+    INIT_DB_ON_START = os.environ.get('INIT_DB_ON_START', 'False').lower() == 'true'
+    # SQLite file databases in production: WAL and the pragmas below, writes queued for one writer connection per
+    # process (waiting up to SQLITE_WRITE_TIMEOUT seconds), reads on a pool of SQLITE_READERS read-only connections
+    SQLITE_TUNING = os.environ.get('SQLITE_TUNING', 'False').lower() == 'true'
+    SQLITE_READERS = int(os.environ.get('SQLITE_READERS', 4))
+    SQLITE_WRITE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_TIMEOUT', 30))
+    SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+    SQLITE_MMAP_MB = int(os.environ.get('SQLITE_MMAP_MB', 256))
+    SQLITE_CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB', 16))
+    
     # AWS Settings
     USE_AWS = os.environ.get('USE_AWS', 'False').lower() == 'true'
     AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
     SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN')
+    # e.g. http://localhost:8000 for DynamoDB Local
+    AWS_ENDPOINT_URL = os.environ.get('AWS_ENDPOINT_URL')
     
     # DynamoDB Table Names
     DYNAMODB_USERS_TABLE = os.environ.get('DYNAMODB_USERS_TABLE', 'Users')
@@ -30,6 +126,8 @@ class Config:
     DYNAMODB_ORDERS_TABLE = os.environ.get('DYNAMODB_ORDERS_TABLE', 'Orders')
     DYNAMODB_CATEGORIES_TABLE = os.environ.get('DYNAMODB_CATEGORIES_TABLE', 'Categories')
     DYNAMODB_CARTS_TABLE = os.environ.get('DYNAMODB_CARTS_TABLE', 'Carts')
+    DYNAMODB_RECOMMENDATIONS_TABLE = os.environ.get('DYNAMODB_RECOMMENDATIONS_TABLE', 'Recommendations')
+    DYNAMODB_SALES_TABLE = os.environ.get('DYNAMODB_SALES_TABLE', 'BookSales')
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,54 @@
+import base64
+import binascii
+import os
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+
+
+def mask_token(token):
+    """The token XORed with a fresh random pad of the same length, sent pad first"""
+    raw = token.encode()
+    pad = os.urandom(len(raw))
+    masked = (int.from_bytes(pad, 'big') ^ int.from_bytes(raw, 'big')).to_bytes(len(raw), 'big')
+    return base64.urlsafe_b64encode(pad + masked).decode().rstrip('=')
+
+
+def unmask_token(value):
+    """The token a masked value was made from; anything else comes back as it is, to be rejected or accepted"""
+    # Flask-WTF's own signed tokens contain dots, which the masked form never does
+    if not value or '.' in value:
+        return value
+    try:
+        data = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    except (ValueError, binascii.Error):
+        return value
+    half = len(data) // 2
+    if not half or len(data) % 2:
+        return value
+    raw = (int.from_bytes(data[:half], 'big') ^ int.from_bytes(data[half:], 'big')).to_bytes(half, 'big')
+    try:
+        return raw.decode('ascii')
+    except UnicodeDecodeError:
+        return value
+
+
+def masked_csrf_token():
+    return mask_token(generate_csrf())
+
+
+class MaskedCSRFProtect(CSRFProtect):
+    """CSRFProtect whose templates get a differently masked token on every call.
+    
+    HTML responses are compressed and may reflect request input next to
+    the token; a token that never repeats byte for byte cannot be guessed
+    from how well a page compresses (BREACH). Submitted tokens are
+    unmasked before Flask-WTF checks them, and unmasked ones still work.
+    """
+    
+    def init_app(self, app):
+        super().init_app(app)
+        # Flask-WTF sets it both as a global and through a context processor; replace both
+        app.jinja_env.globals['csrf_token'] = masked_csrf_token
+        app.context_processor(lambda: {'csrf_token': masked_csrf_token})
+    
+    def _get_csrf_token(self):
+        return unmask_token(super()._get_csrf_token())
@@ -3,5 +3,10 @@ from app.models.category import Category
 from app.models.book import Book
 from app.models.order import Order, OrderItem
 from app.models.cart import Cart, CartItem
+from app.models.reservation import StockReservation
+from app.models.checkpoint import Checkpoint
+from app.models.recommendation import BookRecommendation, CoPurchaseCount
+from app.models.sales import BookSales, SalesBucket
 
-__all__ = ['User', 'Category', 'Book', 'Order', 'OrderItem', 'Cart', 'CartItem']
+__all__ = ['User', 'Category', 'Book', 'Order', 'OrderItem', 'Cart', 'CartItem', 'StockReservation', 'Checkpoint',
+           'BookRecommendation', 'CoPurchaseCount', 'BookSales', 'SalesBucket']
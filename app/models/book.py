@@ -17,6 +17,8 @@ class Book(db.Model):
     description = db.Column(db.Text, nullable=True)
     image_url = db.Column(db.String(500), nullable=True)
     is_active = db.Column(db.Boolean, default=True)
+    # All-time copies sold, on the row itself so sort=bestselling costs what sorting by price does
+    units_sold = db.Column(db.Integer, nullable=False, default=0, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -32,10 +34,14 @@ class Book(db.Model):
         return self.stock_quantity > 0
     
     def reduce_stock(self, quantity):
-        if self.stock_quantity >= quantity:
-            self.stock_quantity -= quantity
-            return True
-        return False
+        # Guarded in SQL so concurrent checkouts can never drive stock negative
+        updated = Book.query.filter(Book.id == self.id, Book.stock_quantity >= quantity).update(
+            {Book.stock_quantity: Book.stock_quantity - quantity}, synchronize_session='fetch')
+        if updated:
+            from app.utils.cdc import record_change
+            record_change('book', 'update', self.id, ['stock_quantity', 'updated_at'],
+                          {'stock_quantity': self.stock_quantity})
+        return updated == 1
     
     def __repr__(self):
         return f'<Book {self.title}>'
@@ -7,6 +7,9 @@ class Cart(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    # Denormalized summary of the cart lines, kept in step by the item helpers below
+    item_count = db.Column(db.Integer, default=0, nullable=False)
+    subtotal = db.Column(db.Float, default=0.0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -14,14 +17,98 @@ class Cart(db.Model):
     items = db.relationship('CartItem', backref='cart', lazy='dynamic', cascade='all, delete-orphan')
     
     def get_total(self):
-        return sum(item.quantity * item.book.price for item in self.items if item.book)
+        return self.subtotal or 0.0
     
     def get_item_count(self):
-        return sum(item.quantity for item in self.items)
+        return self.item_count or 0
+    
+    def _adjust_summary(self, quantity, price):
+        self.item_count = (self.item_count or 0) + quantity
+        self.subtotal = round((self.subtotal or 0.0) + quantity * price, 2)
+    
+    def add_item(self, book, quantity=1):
+        """Add a book to the cart (or bump its quantity) and update the summary"""
+        cart_item = self.items.filter_by(book_id=book.id).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(cart=self, book=book, quantity=quantity)
+            db.session.add(cart_item)
+        self._adjust_summary(quantity, book.price)
+        return cart_item
+    
+    def update_item(self, cart_item, quantity):
+        """Set a line's quantity, removing the line when quantity drops to zero"""
+        if quantity <= 0:
+            self.remove_item(cart_item)
+            return
+        price = cart_item.book.price if cart_item.book else 0
+        self._adjust_summary(quantity - cart_item.quantity, price)
+        cart_item.quantity = quantity
+    
+    def remove_item(self, cart_item):
+        """Delete a line from the cart and update the summary"""
+        price = cart_item.book.price if cart_item.book else 0
+        self._adjust_summary(-cart_item.quantity, price)
+        db.session.delete(cart_item)
+    
+    def compute_summary(self):
+        """Recompute (item_count, subtotal) from the cart lines"""
+        from app.models.book import Book
+        count, subtotal = db.session.query(
+            db.func.coalesce(db.func.sum(CartItem.quantity), 0),
+            db.func.coalesce(db.func.sum(CartItem.quantity * Book.price), 0.0)
+        ).join(Book, CartItem.book_id == Book.id).filter(CartItem.cart_id == self.id).one()
+        return int(count), round(float(subtotal), 2)
+    
+    def check_consistency(self, fix=False):
+        """Compare the stored summary against the lines, optionally repairing it"""
+        count, subtotal = self.compute_summary()
+        consistent = count == self.get_item_count() and abs(subtotal - self.get_total()) < 0.005
+        if not consistent and fix:
+            self.item_count = count
+            self.subtotal = subtotal
+        return consistent
+    
+    @staticmethod
+    def refresh_for_book(book_id):
+        """Recompute the summary of every cart holding a book whose price changed"""
+        carts = Cart.query.join(CartItem).filter(CartItem.book_id == book_id).all()
+        for cart in carts:
+            cart.check_consistency(fix=True)
+        return len(carts)
+    
+    @staticmethod
+    def refresh_for_books(book_ids):
+        """refresh_for_book for many books at once, as one UPDATE; for bulk writes that bypass the session"""
+        from app.models.book import Book
+        from app.utils.cdc import record_change
+        if not book_ids:
+            return 0
+        cart_ids = [cart_id for cart_id, in db.session.query(CartItem.cart_id).filter(
+            CartItem.book_id.in_(book_ids)).distinct()]
+        if not cart_ids:
+            return 0
+        lines = db.session.query(CartItem).join(Book, CartItem.book_id == Book.id).filter(
+            CartItem.cart_id == Cart.id)
+        count = lines.with_entities(db.func.coalesce(db.func.sum(CartItem.quantity), 0)).scalar_subquery()
+        subtotal = lines.with_entities(
+            db.func.round(db.cast(db.func.coalesce(db.func.sum(CartItem.quantity * Book.price), 0.0), db.Numeric), 2)
+        ).scalar_subquery()
+        db.session.execute(db.update(Cart).where(Cart.id.in_(cart_ids)).values(item_count=count, subtotal=subtotal)
+                           .execution_options(synchronize_session=False))
+        # The UPDATE does not go through the session, so the new summaries are recorded for CDC here
+        for cart_id, item_count, total in db.session.query(Cart.id, Cart.item_count, Cart.subtotal).filter(
+                Cart.id.in_(cart_ids)).populate_existing():
+            record_change('cart', 'update', cart_id, ['item_count', 'subtotal'],
+                          {'item_count': item_count, 'subtotal': total})
+        return len(cart_ids)
     
     def clear(self):
         for item in self.items:
             db.session.delete(item)
+        self.item_count = 0
+        self.subtotal = 0.0
         db.session.commit()
     
     def __repr__(self):
@@ -30,6 +117,9 @@ class Cart(db.Model):
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        db.UniqueConstraint('cart_id', 'book_id', name='uq_cart_items_cart_book'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     cart_id = db.Column(db.Integer, db.ForeignKey('carts.id'), nullable=False)
@@ -0,0 +1,24 @@
+from app import db
+from datetime import datetime
+
+
+class Checkpoint(db.Model):
+    """How far an incremental job has got, e.g. the last order item it processed"""
+    __tablename__ = 'checkpoints'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    position = db.Column(db.String(100), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @staticmethod
+    def get(name, default=None):
+        checkpoint = db.session.get(Checkpoint, name)
+        return checkpoint.position if checkpoint else default
+    
+    @staticmethod
+    def set(name, position):
+        """Record progress; committed together with the job's own writes"""
+        db.session.merge(Checkpoint(name=name, position=str(position), updated_at=datetime.utcnow()))
+    
+    def __repr__(self):
+        return f'<Checkpoint {self.name}={self.position}>'
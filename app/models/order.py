@@ -4,6 +4,9 @@ from datetime import datetime
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_user_order_number', 'user_id', 'order_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(50), unique=True, nullable=False)
@@ -22,11 +25,9 @@ class Order(db.Model):
     
     @staticmethod
     def generate_order_number():
-        import random
-        import string
-        timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-        random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        return f'ORD-{timestamp}-{random_str}'
+        # Time-sortable and unique across threads/processes, so it doubles as the listing sort key
+        from app.utils.ids import new_order_number
+        return new_order_number()
     
     def calculate_total(self):
         total = sum(item.quantity * item.price for item in self.items)
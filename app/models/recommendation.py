@@ -0,0 +1,27 @@
+from app import db
+from datetime import datetime
+
+
+class BookRecommendation(db.Model):
+    """Precomputed neighbours of one book, so the detail page needs a single key lookup"""
+    __tablename__ = 'book_recommendations'
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    also_bought = db.Column(db.JSON, nullable=False, default=list)  # book ids, most co-purchased first
+    similar = db.Column(db.JSON, nullable=False, default=list)  # book ids, most similar text first
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<BookRecommendation {self.book_id}>'
+
+
+class CoPurchaseCount(db.Model):
+    """How many orders contained both books; kept so new orders can be folded in incrementally"""
+    __tablename__ = 'co_purchase_counts'
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    other_book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CoPurchaseCount {self.book_id}-{self.other_book_id}: {self.count}>'
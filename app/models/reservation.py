@@ -0,0 +1,90 @@
+from app import db
+from datetime import datetime, timedelta
+
+
+class StockReservation(db.Model):
+    """A time-bounded hold on stock taken when a customer enters checkout"""
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.Index('ix_stock_reservations_book_expires', 'book_id', 'expires_at'),
+        db.UniqueConstraint('user_id', 'book_id', name='uq_stock_reservations_user_book'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def available_stock(book_ids, exclude_user_id=None, now=None):
+        """Return {book_id: stock_quantity - active reservations} for the given books"""
+        from app.models.book import Book
+        now = now or datetime.utcnow()
+        held = db.session.query(
+            StockReservation.book_id.label('book_id'),
+            db.func.sum(StockReservation.quantity).label('reserved')
+        ).filter(StockReservation.book_id.in_(book_ids), StockReservation.expires_at > now)
+        if exclude_user_id is not None:
+            held = held.filter(StockReservation.user_id != exclude_user_id)
+        held = held.group_by(StockReservation.book_id).subquery()
+        rows = db.session.query(
+            Book.id, Book.stock_quantity - db.func.coalesce(held.c.reserved, 0)
+        ).outerjoin(held, held.c.book_id == Book.id).filter(Book.id.in_(book_ids)).all()
+        return {book_id: available for book_id, available in rows}
+    
+    @staticmethod
+    def reserve(user_id, quantities, ttl):
+        """Hold stock for a user's cart lines ({book_id: quantity}) for `ttl` seconds.
+        
+        Any previous holds by the user are replaced. Returns the list of book
+        ids that could not be held; nothing is reserved in that case.
+        """
+        from app.models.book import Book
+        # Lock the books first (in id order, so two carts cannot deadlock) so that checking availability and
+        # inserting the holds happen as one step: a concurrent reserve for the same books waits here. SQLite
+        # has no row locks; there the database write lock serializes reserves, taken by the DELETE below or,
+        # with SQLITE_TUNING, by this locking read, which goes to the writer connection.
+        db.session.query(Book.id).filter(Book.id.in_(list(quantities))).order_by(Book.id).with_for_update().all()
+        StockReservation.release(user_id)
+        available = StockReservation.available_stock(list(quantities), exclude_user_id=user_id)
+        short = [book_id for book_id, quantity in quantities.items() if available.get(book_id, 0) < quantity]
+        if short:
+            return short
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+        db.session.add_all([
+            StockReservation(book_id=book_id, user_id=user_id, quantity=quantity, expires_at=expires_at)
+            for book_id, quantity in quantities.items()
+        ])
+        return []
+    
+    @staticmethod
+    def holds_for(user_id, now=None):
+        """Return {book_id: quantity} for the user's unexpired holds"""
+        now = now or datetime.utcnow()
+        rows = db.session.query(StockReservation.book_id, StockReservation.quantity).filter(
+            StockReservation.user_id == user_id, StockReservation.expires_at > now).all()
+        return dict(rows)
+    
+    @staticmethod
+    def release(user_id):
+        return StockReservation.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+    
+    @staticmethod
+    def purge_expired(batch_size=500, now=None):
+        """Delete expired holds in batches so the sweeper never holds a long write lock"""
+        now = now or datetime.utcnow()
+        purged = 0
+        while True:
+            ids = [row_id for (row_id,) in db.session.query(StockReservation.id).filter(
+                StockReservation.expires_at <= now).limit(batch_size)]
+            if not ids:
+                break
+            StockReservation.query.filter(StockReservation.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            purged += len(ids)
+        return purged
+    
+    def __repr__(self):
+        return f'<StockReservation book={self.book_id} qty={self.quantity}>'
@@ -0,0 +1,27 @@
+from app import db
+from datetime import datetime
+
+
+class BookSales(db.Model):
+    """Copies of a book sold over the trailing windows, kept current at checkout"""
+    __tablename__ = 'book_sales'
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    sold_7d = db.Column(db.Integer, nullable=False, default=0, index=True)
+    sold_30d = db.Column(db.Integer, nullable=False, default=0, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<BookSales {self.book_id}: {self.sold_7d}/{self.sold_30d}>'
+
+
+class SalesBucket(db.Model):
+    """Copies of a book sold on one day; subtracted from the windows once the day falls out of them"""
+    __tablename__ = 'sales_buckets'
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SalesBucket {self.book_id} {self.day}: {self.quantity}>'
@@ -1,9 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app import db
 from app.models import User, Book, Category, Order
 from app.utils.decorators import admin_required
 from app.utils.email import send_seller_approval_notification, send_order_status_update
+from app.utils.bestsellers import record_sales
+from app.utils.bitmaps import get_bitmaps
+from app.utils.reference_data import invalidate_categories
+from app.utils.exports import (FORMATS, ORDER_FIELDS, USER_FIELDS, StreamedListing, export_response, iter_orders,
+                               iter_users, stream_listing)
 from flask import current_app
 from app.utils.dynamo_repo import UserRepository, BookRepository, OrderRepository, CategoryRepository
 
@@ -32,7 +38,7 @@ def dashboard():
         
         total_revenue = sum(float(o.get('total_price', 0)) for o in all_orders if o.get('status') in ['confirmed', 'shipped', 'delivered'])
         
-        recent_orders = sorted(all_orders, key=lambda x: x.get('created_at', ''), reverse=True)[:10]
+        recent_orders = sorted(all_orders, key=lambda x: x.get('order_number', ''), reverse=True)[:10]
         recent_users = sorted(all_users, key=lambda x: x.get('created_at', ''), reverse=True)[:10]
     else:
         # Statistics
@@ -50,7 +56,7 @@ def dashboard():
         ).scalar() or 0
         
         # Recent orders
-        recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
+        recent_orders = Order.query.order_by(Order.order_number.desc()).limit(10).all()
         
         # Recent users
         recent_users = User.query.order_by(User.created_at.desc()).limit(10).all()
@@ -76,6 +82,12 @@ def users():
     role = request.args.get('role', '')
     search_query = request.args.get('search', '')
     
+    if request.args.get('view') == 'all':
+        # Every matching user, streamed as the rows are read (the export rows carry every column shown)
+        rows = iter_users(role or None, search_query or None)
+        return stream_listing('admin/users.html', users=StreamedListing(rows), current_role=role,
+                              search=search_query, streamed=True)
+    
     if current_app.config.get('USE_AWS'):
         user_repo = UserRepository()
         all_users = user_repo.get_all()
@@ -113,6 +125,17 @@ def users():
     return render_template('admin/users.html', users=users_paginated, current_role=role, search=search_query)
 
 
+@admin_bp.route('/users/export.<fmt>')
+@login_required
+@admin_required
+def export_users(fmt):
+    """Download every matching user as CSV or NDJSON, streamed"""
+    if fmt not in FORMATS:
+        abort(404)
+    rows = iter_users(request.args.get('role') or None, request.args.get('search') or None)
+    return export_response(rows, USER_FIELDS, 'users', fmt)
+
+
 @admin_bp.route('/users/toggle/<int:user_id>', methods=['POST'])
 @admin_bp.route('/users/toggle/<user_id>', methods=['POST'])
 @login_required
@@ -251,6 +274,7 @@ def add_category():
     category = Category(category_name=name, description=description)
     db.session.add(category)
     db.session.commit()
+    invalidate_categories()
     
     flash(f'Category "{name}" added successfully!', 'success')
     return redirect(url_for('admin.categories'))
@@ -279,6 +303,7 @@ def edit_category(category_id):
     category.category_name = name
     category.description = description
     db.session.commit()
+    invalidate_categories()
     
     flash(f'Category "{name}" updated successfully!', 'success')
     return redirect(url_for('admin.categories'))
@@ -299,6 +324,7 @@ def delete_category(category_id):
     name = category.category_name
     db.session.delete(category)
     db.session.commit()
+    invalidate_categories()
     
     flash(f'Category "{name}" deleted successfully!', 'success')
     return redirect(url_for('admin.categories'))
@@ -316,12 +342,28 @@ def orders():
     
     if status:
         query = query.filter_by(status=status)
+    query = query.order_by(Order.order_number.desc())
+    
+    if request.args.get('view') == 'all':
+        # Every matching order, streamed; customers are joined in rather than loaded row by row
+        rows = query.options(joinedload(Order.customer)).yield_per(500)
+        return stream_listing('admin/orders.html', orders=StreamedListing(rows), current_status=status, streamed=True)
     
-    orders = query.order_by(Order.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
+    orders = query.paginate(page=page, per_page=20, error_out=False)
     
     return render_template('admin/orders.html', orders=orders, current_status=status)
 
 
+@admin_bp.route('/orders/export.<fmt>')
+@login_required
+@admin_required
+def export_orders(fmt):
+    """Download every matching order as CSV or NDJSON, streamed"""
+    if fmt not in FORMATS:
+        abort(404)
+    return export_response(iter_orders(request.args.get('status') or None), ORDER_FIELDS, 'orders', fmt)
+
+
 @admin_bp.route('/orders/<int:order_id>')
 @login_required
 @admin_required
@@ -347,6 +389,11 @@ def update_order_status(order_id):
     
     old_status = order.status
     order.status = new_status
+    # Cancelled orders stop counting towards the bestseller lists (and count again if reinstated)
+    if (old_status == 'cancelled') != (new_status == 'cancelled'):
+        sign = -1 if new_status == 'cancelled' else 1
+        record_sales([(item.book_id, item.book.category_id, sign * item.quantity) for item in order.items],
+                     sold_at=order.created_at)
     db.session.commit()
     
     # Send notification
@@ -364,13 +411,29 @@ def books():
     """All books"""
     page = request.args.get('page', 1, type=int)
     category_id = request.args.get('category', type=int)
+    status = request.args.get('status', '')
+    stock = request.args.get('stock', '')
+    active = {'active': True, 'inactive': False}.get(status)
+    in_stock = {'in': True, 'out': False}.get(stock)
     
     query = Book.query
     
     if category_id:
         query = query.filter_by(category_id=category_id)
+    if active is not None:
+        query = query.filter_by(is_active=active)
+    if in_stock is not None:
+        query = query.filter(Book.stock_quantity > 0 if in_stock else Book.stock_quantity <= 0)
+    
+    query = query.order_by(Book.created_at.desc())
+    bitmaps = get_bitmaps()
+    category_counts = None
+    if bitmaps is not None:
+        books = query.paginate(page=page, per_page=20, error_out=False, count=False)
+        books.total = bitmaps.count(bitmaps.select(active=active, in_stock=in_stock, category_id=category_id))
+        category_counts = bitmaps.facets('category', bitmaps.select(active=active, in_stock=in_stock))
+    else:
+        books = query.paginate(page=page, per_page=20, error_out=False)
     
-    books = query.order_by(Book.created_at.desc()).paginate(page=page, per_page=20, error_out=False)
-    categories = Category.query.all()
-    
-    return render_template('admin/books.html', books=books, categories=categories, current_category=category_id)
+    return render_template('admin/books.html', books=books, current_category=category_id,
+                           status=status, stock=stock, category_counts=category_counts)
@@ -0,0 +1,270 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Blueprint, abort, current_app, jsonify, request
+from werkzeug.exceptions import HTTPException
+from app import db
+from app.models import Book
+from app.utils.catalog_snapshot import get_catalog
+from app.utils.bitmaps import get_bitmaps
+from app.utils.reference_data import active_book_counts, get_categories
+
+api_bp = Blueprint('api', __name__)
+
+# Book attributes a client may ask for with ?fields=; id is always sent
+FIELDS = ('id', 'title', 'author', 'genre', 'publisher', 'publication_date', 'isbn', 'price', 'stock_quantity',
+          'units_sold', 'description', 'image_url', 'category_id', 'seller_id', 'created_at', 'updated_at')
+# What a listing carries when no fields are given: enough for a book card
+DEFAULT_FIELDS = ('id', 'title', 'author', 'price', 'image_url', 'stock_quantity')
+# sort name -> (column, descending); ties are broken on id in the same direction
+SORTS = {
+    'newest': ('created_at', True),
+    'price_low': ('price', False),
+    'price_high': ('price', True),
+    'title': ('title', False),
+    'bestselling': ('units_sold', True),
+}
+SEARCH_FIELDS = ('title', 'author', 'description', 'genre')
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _fields():
+    """The requested book attributes, id first"""
+    text = request.args.get('fields')
+    if not text:
+        return DEFAULT_FIELDS
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        abort(400, f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(FIELDS)}")
+    return tuple(dict.fromkeys(['id'] + names))
+
+
+def _limit():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+def _encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position, default=_plain).encode()).decode().rstrip('=')
+
+
+def _decode_cursor():
+    """The position a `cursor` parameter points at, or None for the first page"""
+    text = request.args.get('cursor')
+    if not text:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(text + '=' * (-len(text) % 4)))
+    except ValueError:
+        abort(400, 'Invalid cursor')
+
+
+def _project(book, fields):
+    """A dict of `fields` from an ORM row, a snapshot record or a DynamoDB item"""
+    if isinstance(book, dict):
+        return {field: _plain(book.get(field)) for field in fields}
+    return {field: _plain(getattr(book, field, None)) for field in fields}
+
+
+def _respond(payload):
+    """JSON with a weak ETag, so repeat requests with If-None-Match get an empty 304"""
+    response = jsonify(payload)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('API_CACHE_SECONDS', 30)
+    response.add_etag(weak=True)
+    return response.make_conditional(request)
+
+
+def _filters():
+    return {
+        'category_id': request.args.get('category', type=int),
+        'genre': request.args.get('genre') or None,
+        'in_stock': request.args.get('in_stock', type=int) == 1,
+    }
+
+
+def _sql_page(fields, sort, limit, cursor, category_id=None, genre=None, in_stock=False, text=None):
+    """(rows, next cursor) selecting only `fields` plus the sort key, seeking past `cursor` on (sort key, id)"""
+    name, descending = SORTS[sort]
+    column = getattr(Book, name)
+    query = db.session.query(*(getattr(Book, field) for field in dict.fromkeys(fields + (name,)))).filter(
+        Book.is_active == True)
+    if category_id:
+        query = query.filter(Book.category_id == category_id)
+    if genre:
+        query = query.filter(Book.genre == genre)
+    if in_stock:
+        query = query.filter(Book.stock_quantity > 0)
+    if text:
+        query = query.filter(db.or_(*(getattr(Book, field).ilike(f'%{text}%') for field in SEARCH_FIELDS)))
+    if cursor is not None:
+        try:
+            value, last_id = cursor
+            if name == 'created_at':
+                value = datetime.fromisoformat(value)
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            abort(400, 'Invalid cursor')
+        if descending:
+            query = query.filter(db.or_(column < value, db.and_(column == value, Book.id < last_id)))
+        else:
+            query = query.filter(db.or_(column > value, db.and_(column == value, Book.id > last_id)))
+    order = (column.desc(), Book.id.desc()) if descending else (column.asc(), Book.id.asc())
+    # One row past the page says whether there is a next one without a COUNT
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor([getattr(rows[-1], name), rows[-1].id])
+    return rows, next_cursor
+
+
+def _dynamo_page(fields, limit, cursor, keep=None, **scan):
+    """(items, next cursor) from Scan pages that return only `fields`, in table order.
+    
+    Each call asks for at most the rows still missing, so LastEvaluatedKey
+    is exactly where the next page starts.
+    """
+    from app.utils.dynamo_repo import BookRepository
+    names = {f'#p{i}': field for i, field in enumerate(fields)}
+    scan.update(ProjectionExpression=', '.join(names), ExpressionAttributeNames=names)
+    if cursor is not None:
+        if not isinstance(cursor, dict) or not isinstance(cursor.get('id'), str):
+            abort(400, 'Invalid cursor')
+        scan['ExclusiveStartKey'] = {'id': cursor['id']}
+    table = BookRepository().table
+    items = []
+    while len(items) < limit:
+        response = table.scan(Limit=limit - len(items), **scan)
+        items.extend(item for item in response.get('Items', []) if keep is None or keep(item))
+        if 'LastEvaluatedKey' not in response:
+            return items, None
+        scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return items, _encode_cursor({'id': scan['ExclusiveStartKey']['id']})
+
+
+def _dynamo_filter(category_id=None, genre=None, in_stock=False):
+    from boto3.dynamodb.conditions import Attr
+    condition = Attr('is_active').ne(False)
+    if category_id:
+        condition &= Attr('category_id').eq(str(category_id))
+    if genre:
+        condition &= Attr('genre').eq(genre)
+    if in_stock:
+        condition &= Attr('stock_quantity').gt(0)
+    return condition
+
+
+def _offset(cursor):
+    if cursor is None:
+        return 0
+    if not isinstance(cursor, dict) or not isinstance(cursor.get('offset'), int) or cursor['offset'] < 0:
+        abort(400, 'Invalid cursor')
+    return cursor['offset']
+
+
+@api_bp.route('/books')
+def books():
+    """Active books in a listing order, `limit` at a time"""
+    fields, limit, cursor = _fields(), _limit(), _decode_cursor()
+    sort = request.args.get('sort', 'newest')
+    if sort not in SORTS:
+        abort(400, f"Unknown sort: {sort}. Available: {', '.join(SORTS)}")
+    filters = _filters()
+    payload = {}
+    catalog = get_catalog()
+    if catalog is not None:
+        offset = _offset(cursor)
+        items, total = catalog.page(sort, per_page=limit, offset=offset, **filters)
+        next_cursor = _encode_cursor({'offset': offset + limit}) if offset + limit < total else None
+        payload['total'] = total
+    elif current_app.config.get('USE_AWS'):
+        # Without the snapshot there is no index to sort by: pages follow table order
+        items, next_cursor = _dynamo_page(fields, limit, cursor, FilterExpression=_dynamo_filter(**filters))
+    else:
+        items, next_cursor = _sql_page(fields, sort, limit, cursor, **filters)
+        bitmaps = get_bitmaps()
+        if bitmaps is not None:
+            payload['total'] = bitmaps.count(bitmaps.select(in_stock=filters['in_stock'] or None,
+                                                            category_id=filters['category_id'],
+                                                            genre=filters['genre']))
+    payload.update(data=[_project(book, fields) for book in items], next_cursor=next_cursor)
+    return _respond(payload)
+
+
+@api_bp.route('/books/<book_id>')
+def book_detail(book_id):
+    """One active book"""
+    fields = _fields() if request.args.get('fields') else FIELDS
+    if current_app.config.get('USE_AWS'):
+        catalog = get_catalog()
+        book = catalog and catalog.get(book_id)
+        if book is None:
+            from app.utils.dynamo_repo import BookRepository
+            names = {f'#p{i}': field for i, field in enumerate(fields + ('is_active',))}
+            book = BookRepository().table.get_item(Key={'id': str(book_id)}, ProjectionExpression=', '.join(names),
+                                                   ExpressionAttributeNames=names).get('Item')
+        if not book or book.get('is_active', True) is False:
+            abort(404)
+    else:
+        if not book_id.isdigit():
+            abort(404)
+        book = db.session.query(*(getattr(Book, field) for field in fields)).filter(
+            Book.id == int(book_id), Book.is_active == True).first()
+        if book is None:
+            abort(404)
+    return _respond({'data': _project(book, fields)})
+
+
+@api_bp.route('/categories')
+def categories():
+    """Every category with its active book count, from the reference-data cache"""
+    counts = active_book_counts()
+    return _respond({'data': [{
+        'id': _plain(category['id']),
+        'name': category['category_name'],
+        'description': category.get('description'),
+        'active_books': counts.get(str(category['id']), 0),
+    } for category in get_categories()]})
+
+
+@api_bp.route('/search')
+def search():
+    """Active books whose title, author, description or genre contains `q`, newest first"""
+    fields, limit, cursor = _fields(), _limit(), _decode_cursor()
+    text = request.args.get('q', '').strip()
+    payload = {}
+    catalog = get_catalog()
+    if catalog is not None:
+        offset = _offset(cursor)
+        items, total = catalog.search(text, per_page=limit, offset=offset)
+        next_cursor = _encode_cursor({'offset': offset + limit}) if offset + limit < total else None
+        payload['total'] = total
+    elif current_app.config.get('USE_AWS'):
+        needle = text.lower()
+        # DynamoDB `contains` is case-sensitive, so the text fields come back and are matched here
+        keep = (lambda item: any(needle in str(item.get(field) or '').lower() for field in SEARCH_FIELDS)
+                ) if needle else None
+        items, next_cursor = _dynamo_page(tuple(dict.fromkeys(fields + SEARCH_FIELDS)), limit, cursor, keep=keep,
+                                          FilterExpression=_dynamo_filter())
+    else:
+        items, next_cursor = _sql_page(fields, 'newest', limit, cursor, text=text)
+    payload.update(data=[_project(book, fields) for book in items], next_cursor=next_cursor)
+    return _respond(payload)
+
+
+@api_bp.errorhandler(HTTPException)
+def json_error(error):
+    """Errors as JSON rather than the HTML error pages"""
+    return jsonify(error={'code': error.code, 'message': error.description}), error.code
@@ -5,6 +5,7 @@ from app import db
 from app.models import User, Cart
 from app.utils.email import send_welcome_email
 from app.utils.dynamo_repo import UserRepository
+from app.utils.guest_cart import merge_guest_cart
 from flask import current_app
 
 auth_bp = Blueprint('auth', __name__)
@@ -147,6 +148,10 @@ def login():
                 db.session.add(cart)
                 db.session.commit()
             
+            # Carry over anything added to the cart before logging in
+            if user.role in ['customer', 'admin']:
+                merge_guest_cart(user)
+            
             # Redirect based on role
             next_page = request.args.get('next')
             if next_page:
@@ -1,15 +1,75 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, make_response
 from flask_login import login_required, current_user
 from app import db
-from app.models import Book, Cart, CartItem, Order, OrderItem
+from app.models import Book, Cart, CartItem, Order, OrderItem, StockReservation
 from app.utils.decorators import customer_required
 from app.utils.email import send_order_confirmation
 from flask import current_app
 from app.utils.dynamo_repo import BookRepository, OrderRepository, CartRepository
+from app.utils.guest_cart import load_guest_cart, save_guest_cart, guest_cart_count
+from app.utils.ids import new_order_id
+from app.utils.sqlite_tuning import use_writer
+from app.utils.recommendations import upsell_books
+from app.utils.bestsellers import record_sales
+from datetime import datetime
 
 customer_bp = Blueprint('customer', __name__)
 
 
+@customer_bp.app_context_processor
+def inject_guest_cart():
+    """Expose the cookie cart size so the navbar badge works for guests"""
+    if current_user.is_authenticated:
+        return {}
+    return {'guest_cart_count': guest_cart_count()}
+
+
+def _guest_cart_items(guest_cart):
+    """Resolve cookie cart lines to books with a single read"""
+    use_aws = current_app.config.get('USE_AWS')
+    if use_aws:
+        books = {b['id']: b for b in BookRepository().get_many(guest_cart.keys())}
+    else:
+        ids = [int(book_id) for book_id in guest_cart if book_id.isdigit()]
+        books = {str(b.id): b for b in Book.query.filter(Book.id.in_(ids)).all()}
+    
+    cart_items = []
+    total = 0
+    for book_id, quantity in guest_cart.items():
+        book = books.get(book_id)
+        if not book:
+            continue
+        subtotal = (float(book.get('price', 0)) if use_aws else book.price) * quantity
+        cart_items.append({
+            'id': book_id,
+            'book': book,
+            'quantity': quantity,
+            'get_subtotal': lambda s=subtotal: s
+        })
+        total += subtotal
+    return cart_items, total
+
+
+def _hold_cart_stock(cart_items):
+    """Reserve stock for the cart lines for the checkout TTL; flash on shortfall"""
+    quantities = {item.book_id: item.quantity for item in cart_items}
+    short = StockReservation.reserve(current_user.id, quantities, current_app.config.get('RESERVATION_TTL', 900))
+    if short:
+        db.session.rollback()
+        titles = ', '.join(f'"{item.book.title}"' for item in cart_items if item.book_id in short)
+        flash(f'Sorry, not enough stock is available for {titles}.', 'warning')
+        return False
+    return True
+
+
+def _guest_cart_response(guest_cart):
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        response = jsonify({'success': True, 'cart_count': sum(guest_cart.values())})
+    else:
+        response = make_response(redirect(url_for('customer.cart')))
+    return save_guest_cart(response, guest_cart)
+
+
 @customer_bp.route('/dashboard')
 @login_required
 def dashboard():
@@ -18,14 +78,12 @@ def dashboard():
         orders_repo = OrderRepository()
         cart_repo = CartRepository()
         
-        all_orders = orders_repo.get_all()
-        recent_orders = sorted([o for o in all_orders if o.get('user_id') == str(current_user.id)], 
-                               key=lambda x: x.get('created_at', ''), reverse=True)[:5]
+        recent_orders = orders_repo.get_by_user(current_user.id, limit=5)
         
         cart_data = cart_repo.get_by_user(current_user.id)
-        cart_count = sum(item.get('quantity', 0) for item in cart_data.get('items', [])) if cart_data else 0
+        cart_count = int(cart_data.get('item_count', 0)) if cart_data else 0
     else:
-        recent_orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).limit(5).all()
+        recent_orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.order_number.desc()).limit(5).all()
         cart_count = 0
         if current_user.cart:
             cart_count = current_user.cart.get_item_count()
@@ -34,15 +92,16 @@ def dashboard():
 
 
 @customer_bp.route('/cart')
-@login_required
 def cart():
     """View shopping cart"""
-    if current_app.config.get('USE_AWS'):
+    if not current_user.is_authenticated:
+        cart_items, total = _guest_cart_items(load_guest_cart())
+    elif current_app.config.get('USE_AWS'):
         cart_repo = CartRepository()
         books_repo = BookRepository()
         cart_data = cart_repo.get_by_user(current_user.id)
         if not cart_data:
-            cart_data = cart_repo.save({'id': str(current_user.id), 'items': []})
+            cart_data = cart_repo.save_cart({'id': str(current_user.id), 'items': []})
         
         cart_items = []
         total = 0
@@ -64,16 +123,39 @@ def cart():
             db.session.commit()
         
         cart_items = current_user.cart.items.all() if current_user.cart else []
-        total = current_user.cart.get_total() if current_user.cart else 0
+        total = current_user.cart.subtotal if current_user.cart else 0
+    
+    books_in_cart = [item['book'] if isinstance(item, dict) else item.book for item in cart_items]
+    upsell = upsell_books([b['id'] if isinstance(b, dict) else b.id for b in books_in_cart]) if cart_items else []
         
-    return render_template('customer/cart.html', cart_items=cart_items, total=total)
+    return render_template('customer/cart.html', cart_items=cart_items, total=total, upsell=upsell)
 
 
 @customer_bp.route('/cart/add/<int:book_id>', methods=['POST'])
 @customer_bp.route('/cart/add/<book_id>', methods=['POST'])
-@login_required
 def add_to_cart(book_id):
     """Add book to cart"""
+    if not current_user.is_authenticated:
+        if current_app.config.get('USE_AWS'):
+            book = BookRepository().get_by_id(book_id)
+            in_stock = book and int(book.get('stock_quantity', 0)) > 0
+            title = book.get('title') if book else None
+        else:
+            book = Book.query.get(book_id)
+            in_stock = book and book.is_in_stock()
+            title = book.title if book else None
+        if not book:
+            from flask import abort
+            abort(404)
+        if not in_stock:
+            flash('Sorry, this book is out of stock.', 'warning')
+            return redirect(url_for('main.book_detail', book_id=book_id))
+        
+        guest_cart = load_guest_cart()
+        guest_cart[str(book_id)] = guest_cart.get(str(book_id), 0) + int(request.form.get('quantity', 1))
+        flash(f'"{title}" added to cart!', 'success')
+        return _guest_cart_response(guest_cart)
+    
     if current_app.config.get('USE_AWS'):
         books_repo = BookRepository()
         cart_repo = CartRepository()
@@ -101,10 +183,12 @@ def add_to_cart(book_id):
         if not found:
             cart_data['items'].append({'book_id': str(book_id), 'quantity': quantity})
             
-        cart_repo.save(cart_data)
+        cart_repo.save_cart(cart_data)
         flash(f'"{book.get("title")}" added to cart!', 'success')
-        cart_count = sum(i.get('quantity', 0) for i in cart_data['items'])
+        cart_count = cart_data['item_count']
     else:
+        # The cart is read and then rewritten; with a reader pool both happen on the writer
+        use_writer()
         book = Book.query.get_or_404(book_id)
         if not book.is_in_stock():
             flash('Sorry, this book is out of stock.', 'warning')
@@ -116,15 +200,10 @@ def add_to_cart(book_id):
             db.session.add(cart)
             db.session.commit()
         
-        cart_item = CartItem.query.filter_by(cart_id=current_user.cart.id, book_id=book_id).first()
-        if cart_item:
-            cart_item.quantity += quantity
-        else:
-            cart_item = CartItem(cart_id=current_user.cart.id, book_id=book_id, quantity=quantity)
-            db.session.add(cart_item)
+        current_user.cart.add_item(book, quantity)
         db.session.commit()
         flash(f'"{book.title}" added to cart!', 'success')
-        cart_count = current_user.cart.get_item_count()
+        cart_count = current_user.cart.item_count
     
     # Check if AJAX request
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -135,9 +214,17 @@ def add_to_cart(book_id):
 
 @customer_bp.route('/cart/update/<int:item_id>', methods=['POST'])
 @customer_bp.route('/cart/update/<item_id>', methods=['POST'])
-@login_required
 def update_cart_item(item_id):
     """Update cart item quantity"""
+    if not current_user.is_authenticated:
+        guest_cart = load_guest_cart()
+        quantity = int(request.form.get('quantity', 1))
+        if quantity > 0:
+            guest_cart[str(item_id)] = quantity
+        else:
+            guest_cart.pop(str(item_id), None)
+        return _guest_cart_response(guest_cart)
+    
     if current_app.config.get('USE_AWS'):
         cart_repo = CartRepository()
         cart_data = cart_repo.get_by_user(current_user.id)
@@ -154,17 +241,15 @@ def update_cart_item(item_id):
             else:
                 new_items.append(item)
         cart_data['items'] = new_items
-        cart_repo.save(cart_data)
+        cart_repo.save_cart(cart_data)
     else:
+        use_writer()
         cart_item = CartItem.query.get_or_404(item_id)
         if cart_item.cart.user_id != current_user.id:
             flash('Unauthorized action.', 'danger')
             return redirect(url_for('customer.cart'))
         quantity = int(request.form.get('quantity', 1))
-        if quantity <= 0:
-            db.session.delete(cart_item)
-        else:
-            cart_item.quantity = quantity
+        cart_item.cart.update_item(cart_item, quantity)
         db.session.commit()
         
     return redirect(url_for('customer.cart'))
@@ -172,21 +257,27 @@ def update_cart_item(item_id):
 
 @customer_bp.route('/cart/remove/<int:item_id>', methods=['POST'])
 @customer_bp.route('/cart/remove/<item_id>', methods=['POST'])
-@login_required
 def remove_from_cart(item_id):
     """Remove item from cart"""
+    if not current_user.is_authenticated:
+        guest_cart = load_guest_cart()
+        guest_cart.pop(str(item_id), None)
+        flash('Item removed from cart.', 'info')
+        return _guest_cart_response(guest_cart)
+    
     if current_app.config.get('USE_AWS'):
         cart_repo = CartRepository()
         cart_data = cart_repo.get_by_user(current_user.id)
         if cart_data:
             cart_data['items'] = [i for i in cart_data.get('items', []) if i['book_id'] != str(item_id)]
-            cart_repo.save(cart_data)
+            cart_repo.save_cart(cart_data)
     else:
+        use_writer()
         cart_item = CartItem.query.get_or_404(item_id)
         if cart_item.cart.user_id != current_user.id:
             flash('Unauthorized action.', 'danger')
             return redirect(url_for('customer.cart'))
-        db.session.delete(cart_item)
+        cart_item.cart.remove_item(cart_item)
         db.session.commit()
     
     flash('Item removed from cart.', 'info')
@@ -221,9 +312,20 @@ def checkout():
                 flash('Please enter a shipping address.', 'danger')
                 return render_template('customer/checkout.html', cart_items=cart_items, total=total)
                 
+            # Take stock with conditional updates, undoing earlier lines on a shortfall
+            taken = []
+            for i in cart_items:
+                if not books_repo.adjust_stock(i['book']['id'], -int(i['quantity']), sold=int(i['quantity'])):
+                    for book_id, quantity in taken:
+                        books_repo.adjust_stock(book_id, quantity, sold=-quantity)
+                    flash(f'Sorry, not enough stock is available for "{i["book"].get("title")}".', 'warning')
+                    return redirect(url_for('customer.cart'))
+                taken.append((i['book']['id'], int(i['quantity'])))
+            
+            order_id = new_order_id()
             order_data = {
-                'id': str(uuid.uuid4()) if 'uuid' in globals() else str(datetime.now().timestamp()), # Placeholder
-                'order_number': f"BB-{int(datetime.now().timestamp())}",
+                'id': order_id,
+                'order_number': f'ORD-{order_id}',
                 'user_id': str(current_user.id),
                 'shipping_address': shipping_address,
                 'total_price': str(total),
@@ -232,17 +334,26 @@ def checkout():
                 'items': [{'book_id': i['book']['id'], 'quantity': i['quantity'], 'price': str(i['price'])} for i in cart_items]
             }
             order_repo.save(order_data)
-            cart_repo.save({'id': str(current_user.id), 'items': []})
+            cart_repo.save_cart({'id': str(current_user.id), 'items': []})
+            record_sales([(i['book']['id'], i['book'].get('category_id'), i['quantity']) for i in cart_items])
             
             flash(f'Order placed successfully! Order number: {order_data["order_number"]}', 'success')
             return redirect(url_for('customer.orders'))
     else:
-        if not current_user.cart or current_user.cart.get_item_count() == 0:
+        # Stock, holds and the cart are read and then written; with a reader pool all of it happens on the writer
+        use_writer()
+        if not current_user.cart or current_user.cart.item_count == 0:
             flash('Your cart is empty.', 'warning')
             return redirect(url_for('main.books'))
         
         cart_items = current_user.cart.items.all()
-        total = current_user.cart.get_total()
+        total = current_user.cart.subtotal
+        
+        if request.method == 'GET':
+            # Hold the stock while the customer fills in the checkout form
+            if not _hold_cart_stock(cart_items):
+                return redirect(url_for('customer.cart'))
+            db.session.commit()
         
         if request.method == 'POST':
             shipping_address = request.form.get('shipping_address', '').strip()
@@ -253,6 +364,12 @@ def checkout():
                 flash('Please enter a shipping address.', 'danger')
                 return render_template('customer/checkout.html', cart_items=cart_items, total=total)
             
+            # Re-take the hold if it lapsed while the form was open
+            holds = StockReservation.holds_for(current_user.id)
+            if any(holds.get(item.book_id, 0) < item.quantity for item in cart_items):
+                if not _hold_cart_stock(cart_items):
+                    return redirect(url_for('customer.cart'))
+            
             order = Order(
                 order_number=Order.generate_order_number(),
                 user_id=current_user.id,
@@ -265,8 +382,13 @@ def checkout():
             for item in cart_items:
                 order_item = OrderItem(order=order, book_id=item.book_id, quantity=item.quantity, price=item.book.price)
                 db.session.add(order_item)
-                item.book.reduce_stock(item.quantity)
+                if not item.book.reduce_stock(item.quantity):
+                    db.session.rollback()
+                    flash(f'Sorry, "{item.book.title}" just went out of stock.', 'warning')
+                    return redirect(url_for('customer.cart'))
             order.calculate_total()
+            record_sales([(item.book_id, item.book.category_id, item.quantity) for item in cart_items])
+            StockReservation.release(current_user.id)
             current_user.cart.clear()
             db.session.commit()
             send_order_confirmation(order)
@@ -281,7 +403,7 @@ def checkout():
 def orders():
     """Order history"""
     page = request.args.get('page', 1, type=int)
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).paginate(page=page, per_page=10, error_out=False)
+    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.order_number.desc()).paginate(page=page, per_page=10, error_out=False)
     return render_template('customer/orders.html', orders=orders)
 
 
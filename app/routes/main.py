@@ -1,7 +1,12 @@
 from flask import Blueprint, render_template, request
-from app.models import Book, Category
+from app.models import Book
 from sqlalchemy import or_
-from app.utils.dynamo_repo import BookRepository, CategoryRepository
+from app.utils.dynamo_repo import BookRepository
+from app.utils.recommendations import related_books as get_related_books
+from app.utils.bestsellers import bestsellers
+from app.utils.catalog_snapshot import get_catalog
+from app.utils.catalog_arrays import page_items
+from app.utils.bitmaps import facet_counts, get_bitmaps
 from flask import current_app
 
 main_bp = Blueprint('main', __name__)
@@ -28,18 +33,23 @@ class MockPagination:
 @main_bp.route('/')
 def index():
     """Landing page"""
-    if current_app.config.get('USE_AWS'):
+    catalog = get_catalog()
+    if catalog is not None:
+        featured_books = catalog.newest(8)
+    elif current_app.config.get('USE_AWS'):
         books_repo = BookRepository()
-        cat_repo = CategoryRepository()
         all_books = books_repo.get_all()
         # Sort by created_at desc manually
         featured_books = sorted([b for b in all_books if b.get('is_active', True)], 
                                 key=lambda x: x.get('created_at', ''), reverse=True)[:8]
-        categories = cat_repo.get_all()
     else:
         featured_books = Book.query.filter_by(is_active=True).order_by(Book.created_at.desc()).limit(8).all()
-        categories = Category.query.all()
-    return render_template('main/index.html', featured_books=featured_books, categories=categories)
+    # This month's leaders, or all-time ones while sales are too sparse to fill the shelf
+    bestselling_books = bestsellers('30d', limit=8)
+    if len(bestselling_books) < 4:
+        bestselling_books = bestsellers('all', limit=8)
+    # Categories and their counts come from the reference-data cache (see reference_data.py)
+    return render_template('main/index.html', featured_books=featured_books, bestselling_books=bestselling_books)
 
 
 @main_bp.route('/books')
@@ -50,36 +60,28 @@ def books():
     
     category_id = request.args.get('category', type=int)
     sort_by = request.args.get('sort', 'newest')
+    in_stock = request.args.get('in_stock', type=int) == 1
+    genre = request.args.get('genre') or None
+    facets = None
     
-    if current_app.config.get('USE_AWS'):
+    catalog = get_catalog()
+    if catalog is not None:
+        items, total = catalog.page(sort_by, category_id, page, per_page, in_stock=in_stock, genre=genre)
+        books = MockPagination(items, page, per_page, total)
+        facets = catalog.facets(category_id, in_stock, genre)
+    elif current_app.config.get('USE_AWS'):
         books_repo = BookRepository()
-        cat_repo = CategoryRepository()
-        all_books = [b for b in books_repo.get_all() if b.get('is_active', True)]
-        
-        if category_id:
-            all_books = [b for b in all_books if b.get('category_id') == str(category_id)]
-        
-        # Sort
-        if sort_by == 'price_low':
-            all_books.sort(key=lambda x: float(x.get('price', 0)))
-        elif sort_by == 'price_high':
-            all_books.sort(key=lambda x: float(x.get('price', 0)), reverse=True)
-        elif sort_by == 'title':
-            all_books.sort(key=lambda x: x.get('title', '').lower())
-        else:
-            all_books.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-        total = len(all_books)
-        start = (page - 1) * per_page
-        end = start + per_page
-        items = all_books[start:end]
-        
+        # Filter, sort and cut the page with NumPy rather than Python sort keys
+        items, total = page_items(books_repo.get_all(), sort_by, category_id, page, per_page, in_stock, genre)
         books = MockPagination(items, page, per_page, total)
-        categories = cat_repo.get_all()
     else:
         query = Book.query.filter_by(is_active=True)
         if category_id:
             query = query.filter_by(category_id=category_id)
+        if in_stock:
+            query = query.filter(Book.stock_quantity > 0)
+        if genre:
+            query = query.filter_by(genre=genre)
         
         if sort_by == 'price_low':
             query = query.order_by(Book.price.asc())
@@ -87,17 +89,28 @@ def books():
             query = query.order_by(Book.price.desc())
         elif sort_by == 'title':
             query = query.order_by(Book.title.asc())
+        elif sort_by == 'bestselling':
+            query = query.order_by(Book.units_sold.desc())
         else:
             query = query.order_by(Book.created_at.desc())
-            
-        books = query.paginate(page=page, per_page=per_page, error_out=False)
-        categories = Category.query.all()
+        
+        bitmaps = get_bitmaps()
+        if bitmaps is not None:
+            # The total and the filter counts come from the bitmaps instead of COUNT queries
+            books = query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+            books.total = bitmaps.count(bitmaps.select(in_stock=in_stock or None, category_id=category_id,
+                                                       genre=genre))
+            facets = facet_counts(bitmaps, category_id, in_stock or None, genre)
+        else:
+            books = query.paginate(page=page, per_page=per_page, error_out=False)
     
     return render_template('main/books.html', 
                           books=books, 
-                          categories=categories, 
                           current_category=category_id,
-                          sort_by=sort_by)
+                          sort_by=sort_by,
+                          in_stock=in_stock,
+                          current_genre=genre,
+                          facets=facets)
 
 
 @main_bp.route('/books/<int:book_id>')
@@ -105,19 +118,26 @@ def books():
 def book_detail(book_id):
     """Book detail page"""
     if current_app.config.get('USE_AWS'):
-        book = BookRepository().get_by_id(book_id)
+        catalog = get_catalog()
+        # Books added since the last refresh are not in the snapshot yet
+        book = (catalog and catalog.get(book_id)) or BookRepository().get_by_id(book_id)
         if not book:
             from flask import abort
             abort(404)
-        all_books = BookRepository().get_all()
-        related_books = [b for b in all_books if b.get('category_id') == book.get('category_id') and b.get('id') != str(book_id) and b.get('is_active', True)][:4]
+        related_books = get_related_books(book)
+        if not related_books and catalog is not None:
+            related_books = catalog.in_category(book.get('category_id'), exclude_id=book_id)
+        elif not related_books:
+            related_books = BookRepository().get_some_by_category(book.get('category_id'), exclude_id=book_id)
     else:
         book = Book.query.get_or_404(book_id)
-        related_books = Book.query.filter(
-            Book.category_id == book.category_id,
-            Book.id != book.id,
-            Book.is_active == True
-        ).limit(4).all()
+        related_books = get_related_books(book)
+        if not related_books:
+            related_books = Book.query.filter(
+                Book.category_id == book.category_id,
+                Book.id != book.id,
+                Book.is_active == True
+            ).limit(4).all()
     return render_template('main/book_detail.html', book=book, related_books=related_books)
 
 
@@ -128,7 +148,11 @@ def search():
     page = request.args.get('page', 1, type=int)
     per_page = 12
     
-    if current_app.config.get('USE_AWS'):
+    catalog = get_catalog()
+    if catalog is not None:
+        items, total = catalog.search(query_text, page, per_page)
+        books = MockPagination(items, page, per_page, total)
+    elif current_app.config.get('USE_AWS'):
         books_repo = BookRepository()
         all_books = [b for b in books_repo.get_all() if b.get('is_active', True)]
         
@@ -1,11 +1,14 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from app.models import Book, Category, Order, OrderItem
+from app.models import Book, Order, OrderItem, Cart
 from app.utils.decorators import seller_required
 from datetime import datetime
 from flask import current_app
-from app.utils.dynamo_repo import BookRepository, CategoryRepository
+from app.utils.dynamo_repo import BookRepository
+from app.utils.catalog_import import CatalogImporter, IMPORT_FIELDS, detect_format
+from app.utils.content_similarity import refresh_similar
+from app.utils.catalog_snapshot import get_catalog
 
 seller_bp = Blueprint('seller', __name__)
 
@@ -16,8 +19,11 @@ seller_bp = Blueprint('seller', __name__)
 def dashboard():
     """Seller dashboard with statistics"""
     if current_app.config.get('USE_AWS'):
-        books_repo = BookRepository()
-        seller_books = [b for b in books_repo.get_all() if b.get('seller_id') == str(current_user.id)]
+        catalog = get_catalog()
+        if catalog is not None:
+            seller_books = catalog.for_seller(current_user.id)
+        else:
+            seller_books = [b for b in BookRepository().get_all() if b.get('seller_id') == str(current_user.id)]
         total_books = len(seller_books)
         total_stock = sum(int(book.get('stock_quantity', 0)) for book in seller_books)
         
@@ -83,8 +89,6 @@ def books():
 @seller_required
 def add_book():
     """Add a new book"""
-    categories = Category.query.all()
-    
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
         author = request.form.get('author', '').strip()
@@ -118,7 +122,7 @@ def add_book():
         if errors:
             for error in errors:
                 flash(error, 'danger')
-            return render_template('seller/add_book.html', categories=categories)
+            return render_template('seller/add_book.html')
         
         # Parse publication date
         publication_date = None
@@ -145,7 +149,7 @@ def add_book():
                 'is_active': True,
                 'created_at': datetime.utcnow().isoformat()
             }
-            BookRepository().save(book_data)
+            refresh_similar(BookRepository().save(book_data))
         else:
             book = Book(
                 title=title,
@@ -163,11 +167,32 @@ def add_book():
             )
             db.session.add(book)
             db.session.commit()
+            refresh_similar(book)
         
         flash(f'Book "{title}" added successfully!', 'success')
         return redirect(url_for('seller.books'))
     
-    return render_template('seller/add_book.html', categories=categories)
+    return render_template('seller/add_book.html')
+
+
+@seller_bp.route('/books/import', methods=['GET', 'POST'])
+@login_required
+@seller_required
+def import_books():
+    """Bulk import books from a CSV or JSONL upload"""
+    report = None
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSONL file to import.', 'danger')
+            return redirect(url_for('seller.import_books'))
+        
+        report = CatalogImporter(current_user.id).run(upload.stream, detect_format(upload.filename))
+        category = 'success' if not report.error_count else 'warning'
+        flash(f'Imported {report.imported} of {report.processed} rows ({report.error_count} errors).', category)
+    
+    return render_template('seller/import_books.html', report=report, fields=IMPORT_FIELDS)
 
 
 @seller_bp.route('/books/edit/<int:book_id>', methods=['GET', 'POST'])
@@ -181,9 +206,9 @@ def edit_book(book_id):
         flash('Unauthorized action.', 'danger')
         return redirect(url_for('seller.books'))
     
-    categories = Category.query.all()
-    
     if request.method == 'POST':
+        old_price = book.price
+        old_text = (book.title, book.author, book.genre, book.description)
         book.title = request.form.get('title', '').strip()
         book.author = request.form.get('author', '').strip()
         book.genre = request.form.get('genre', '').strip()
@@ -204,11 +229,19 @@ def edit_book(book_id):
             except ValueError:
                 pass
         
+        # Keep cached cart subtotals in step with the new price
+        if book.price != old_price:
+            Cart.refresh_for_book(book.id)
+        
         db.session.commit()
+        
+        if (book.title, book.author, book.genre, book.description) != old_text:
+            refresh_similar(book)
+        
         flash(f'Book "{book.title}" updated successfully!', 'success')
         return redirect(url_for('seller.books'))
     
-    return render_template('seller/edit_book.html', book=book, categories=categories)
+    return render_template('seller/edit_book.html', book=book)
 
 
 @seller_bp.route('/books/delete/<int:book_id>', methods=['POST'])
@@ -252,7 +285,7 @@ def orders():
     order_items = OrderItem.query.filter(OrderItem.book_id.in_(seller_book_ids)).all()
     order_ids = list(set(item.order_id for item in order_items))
     
-    orders = Order.query.filter(Order.id.in_(order_ids)).order_by(Order.created_at.desc()).paginate(page=page, per_page=10, error_out=False)
+    orders = Order.query.filter(Order.id.in_(order_ids)).order_by(Order.order_number.desc()).paginate(page=page, per_page=10, error_out=False)
     
     return render_template('seller/orders.html', orders=orders, seller_book_ids=seller_book_ids)
 
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import time
+from flask import current_app, g, request
+from flask_login import current_user
+
+# Form and query fields logged as sent: paging, catalog filters, search text, quantities and the book and
+# category details sellers and admins publish anyway. Any other field (passwords, emails, addresses, phone
+# numbers, notes, CSRF tokens, and whatever a new form adds) is logged by name only
+LOGGABLE_FIELDS = {'page', 'limit', 'cursor', 'fields', 'sort', 'view', 'q', 'search', 'category', 'category_id',
+                   'genre', 'in_stock', 'quantity', 'status', 'payment_method', 'role', 'next', 'title', 'author',
+                   'publisher', 'publication_date', 'isbn', 'price', 'stock', 'stock_quantity', 'description',
+                   'image_url', 'is_active', 'category_name'}
+REDACTED = '*'
+
+
+def _sanitize(values):
+    return {key: (value if key in LOGGABLE_FIELDS else REDACTED) for key, value in values.items()}
+
+
+class AccessLog:
+    """Append-only request trace log, one compact JSON object per line.
+    
+    Each record is written with a single O_APPEND write, so several
+    worker processes can share one file. Keys: t (unix time), m (method),
+    p (path), e (endpoint), q (query args), f (form fields, POST only),
+    r (role), s (pseudonymous session id), c (status), d (duration, ms).
+    """
+    
+    def __init__(self, path, secret):
+        self.path = path
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self._fd = None
+    
+    def _session_id(self):
+        if current_user.is_authenticated:
+            key = f'user:{current_user.id}'
+        else:
+            # Guests keep the session cookie (CSRF token, guest cart) across requests
+            cookie = request.cookies.get(current_app.config.get('SESSION_COOKIE_NAME', 'session'))
+            key = 'guest:' + (cookie or f'{request.remote_addr}|{request.user_agent}')
+        return hashlib.blake2b(key.encode(), key=self.secret[:64], digest_size=6).hexdigest()
+    
+    def record(self, response):
+        started = g.pop('access_log_started', None)
+        if started is None or request.endpoint in (None, 'static'):
+            return
+        entry = {
+            't': round(time.time(), 3),
+            'm': request.method,
+            'p': request.path,
+            'e': request.endpoint,
+            'r': current_user.role if current_user.is_authenticated else 'guest',
+            's': self._session_id(),
+            'c': response.status_code,
+            'd': round((time.perf_counter() - started) * 1000, 2),
+        }
+        if request.args:
+            entry['q'] = _sanitize(request.args.to_dict())
+        if request.method == 'POST' and request.form:
+            entry['f'] = _sanitize(request.form.to_dict())
+        self.write(entry)
+    
+    def write(self, entry):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        os.write(self._fd, (json.dumps(entry, separators=(',', ':')) + '\n').encode())
+
+
+def read_access_log(path):
+    """Yield records from an access log, skipping a torn final line"""
+    with open(path) as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def init_access_log(app):
+    """Trace every request to ACCESS_LOG_PATH when it is set"""
+    path = app.config.get('ACCESS_LOG_PATH')
+    if not path:
+        return None
+    access_log = AccessLog(path, app.config['SECRET_KEY'])
+    app.extensions['access_log'] = access_log
+    
+    @app.before_request
+    def start_access_log_timer():
+        g.access_log_started = time.perf_counter()
+    
+    @app.after_request
+    def write_access_log(response):
+        access_log.record(response)
+        return response
+    
+    return access_log
@@ -1,19 +1,23 @@
-import boto3
 from flask import current_app
-from botocore.exceptions import ClientError
 
 def get_boto3_session():
     """Create a boto3 session with configured credentials"""
-    return boto3.Session(
+    # Imported on first use so SQL-mode processes never load boto3
+    import boto3
+    session = boto3.Session(
         aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
         aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
         region_name=current_app.config.get('AWS_REGION')
     )
+    if current_app.config.get('QUERY_STATS'):
+        from app.utils.query_stats import count_query
+        session.events.register('before-call.dynamodb', count_query)
+    return session
 
 def get_dynamodb_resource():
-    """Get DynamoDB resource"""
+    """Get DynamoDB resource (AWS_ENDPOINT_URL points it at DynamoDB Local)"""
     session = get_boto3_session()
-    return session.resource('dynamodb')
+    return session.resource('dynamodb', endpoint_url=current_app.config.get('AWS_ENDPOINT_URL'))
 
 def get_sns_client():
     """Get SNS client"""
@@ -24,7 +28,8 @@ def send_sns_notification(subject, message):
     """Send SNS notification (replicated from app_aws.py)"""
     if not current_app.config.get('USE_AWS') or not current_app.config.get('SNS_TOPIC_ARN'):
         return False
-        
+    
+    from botocore.exceptions import ClientError
     try:
         sns = get_sns_client()
         sns.publish(
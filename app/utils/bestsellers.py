@@ -0,0 +1,247 @@
+import heapq
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from flask import current_app
+from app import db
+
+CHECKPOINT = 'bestsellers_day'
+# Trailing windows, in days, and the BookSales column each is counted in
+WINDOWS = {'7d': 7, '30d': 30}
+
+# Day the windows were last seen rolled forward to, so most requests skip the checkpoint read
+_rolled_day = None
+# AWS leaderboards add up a month of day buckets, so they are reused for a short while
+_aws_cache = {}
+
+
+def roll_windows(today=None):
+    """Subtract the day buckets that have left each trailing window since the last roll.
+    
+    Runs in the caller's transaction. The checkpoint is advanced with a
+    conditional UPDATE, so when several processes notice the new day at
+    once only one of them subtracts.
+    """
+    global _rolled_day
+    from app.models import BookSales, SalesBucket, Checkpoint
+    from app.utils.bulk import bulk_upsert
+    today = today or datetime.utcnow().date()
+    if _rolled_day == today:
+        return today
+    last = Checkpoint.get(CHECKPOINT)
+    if last is None:
+        bulk_upsert(Checkpoint, [{'name': CHECKPOINT, 'position': today.isoformat(), 'updated_at': datetime.utcnow()}],
+                    ['name'])
+        return today
+    last = date.fromisoformat(last)
+    if last >= today:
+        _rolled_day = today
+        return today
+    claimed = Checkpoint.query.filter_by(name=CHECKPOINT, position=last.isoformat()).update(
+        {Checkpoint.position: today.isoformat(), Checkpoint.updated_at: datetime.utcnow()}, synchronize_session=False)
+    if not claimed:
+        return today
+    
+    table = BookSales.__table__
+    for window, days in WINDOWS.items():
+        expired = db.session.query(SalesBucket.book_id, db.func.sum(SalesBucket.quantity)).filter(
+            SalesBucket.day > last - timedelta(days=days),
+            SalesBucket.day <= today - timedelta(days=days)
+        ).group_by(SalesBucket.book_id).all()
+        if expired:
+            column = table.c[f'sold_{window}']
+            db.session.execute(
+                table.update().where(table.c.book_id == db.bindparam('_book_id')).values(
+                    {column: column - db.bindparam('_quantity')}),
+                [{'_book_id': book_id, '_quantity': quantity} for book_id, quantity in expired]
+            )
+    SalesBucket.query.filter(SalesBucket.day <= today - timedelta(days=max(WINDOWS.values()))).delete(
+        synchronize_session=False)
+    return today
+
+
+def record_sales(lines, sold_at=None):
+    """Count `lines` of (book_id, category_id, quantity) as sold at `sold_at` (default now).
+    
+    Negative quantities take a sale back, e.g. when an order is cancelled.
+    SQL writes join the caller's transaction; DynamoDB writes go straight
+    to the BookSales table (units_sold is taken with the stock, see
+    BookRepository.adjust_stock).
+    """
+    sold_at = sold_at or datetime.utcnow()
+    day = sold_at.date()
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import SalesRepository
+        sales_repo = SalesRepository()
+        for book_id, category_id, quantity in lines:
+            sales_repo.record(day, book_id, category_id, int(quantity))
+        return
+    
+    from app.models import Book, BookSales, SalesBucket
+    from app.utils.bulk import bulk_upsert
+    today = roll_windows()
+    totals = Counter()
+    for book_id, _, quantity in lines:
+        totals[int(book_id)] += int(quantity)
+    totals = {book_id: quantity for book_id, quantity in totals.items() if quantity}
+    if not totals:
+        return
+    
+    books = Book.__table__
+    db.session.execute(
+        books.update().where(books.c.id == db.bindparam('_book_id')).values(
+            units_sold=books.c.units_sold + db.bindparam('_quantity')),
+        [{'_book_id': book_id, '_quantity': quantity} for book_id, quantity in totals.items()]
+    )
+    from app.utils.cdc import record_change
+    for book_id in totals:
+        record_change('book', 'update', book_id, ['units_sold', 'updated_at'])
+    age = (today - day).days
+    if age >= max(WINDOWS.values()):
+        return
+    now = datetime.utcnow()
+    bulk_upsert(BookSales, [dict({f'sold_{window}': quantity if age < days else 0 for window, days in WINDOWS.items()},
+                                 book_id=book_id, updated_at=now) for book_id, quantity in totals.items()],
+                ['book_id'], update_columns=['updated_at'], increment_columns=[f'sold_{w}' for w in WINDOWS])
+    bulk_upsert(SalesBucket, [{'book_id': book_id, 'day': day, 'quantity': quantity}
+                              for book_id, quantity in totals.items()],
+                ['book_id', 'day'], increment_columns=['quantity'])
+
+
+def bestsellers(window='30d', category_id=None, limit=8):
+    """Top `limit` active books by copies sold in `window` ('7d', '30d' or 'all'), optionally within a category"""
+    if current_app.config.get('USE_AWS'):
+        key = (window, str(category_id) if category_id else None, limit)
+        cached = _aws_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        books = _aws_bestsellers(window, key[1], limit)
+        _aws_cache[key] = (time.monotonic() + current_app.config.get('BESTSELLERS_CACHE_SECONDS', 60), books)
+        return books
+    
+    from app.models import Book, BookSales
+    if window == 'all':
+        query = Book.query.filter(Book.units_sold > 0).order_by(Book.units_sold.desc(), Book.id)
+    else:
+        if roll_windows() != _rolled_day:
+            # The windows may just have been rolled forward; keep that before reading them
+            db.session.commit()
+        column = getattr(BookSales, f'sold_{window}')
+        query = Book.query.join(BookSales, BookSales.book_id == Book.id).filter(column > 0).order_by(
+            column.desc(), Book.id)
+    query = query.filter(Book.is_active == True)
+    if category_id:
+        query = query.filter(Book.category_id == category_id)
+    return query.limit(limit).all()
+
+
+def _aws_bestsellers(window, category_id, limit):
+    from app.utils.dynamo_repo import BookRepository, SalesRepository
+    books_repo = BookRepository()
+    totals = Counter()
+    if window == 'all':
+        from app.utils.catalog_snapshot import get_catalog
+        catalog = get_catalog()
+        if catalog is not None:
+            return [book for book in catalog.page('bestselling', category_id, per_page=limit)[0] if book.units_sold]
+        scan = {'ProjectionExpression': 'id, units_sold, category_id, is_active'}
+        for item in books_repo.iter_all(**scan):
+            if item.get('units_sold') and item.get('is_active', True) and (
+                    not category_id or item.get('category_id') == category_id):
+                totals[item['id']] = int(item['units_sold'])
+    else:
+        sales_repo = SalesRepository()
+        today = datetime.utcnow().date()
+        for offset in range(WINDOWS[window]):
+            for bucket in sales_repo.get_day(today - timedelta(days=offset)):
+                if not category_id or bucket.get('category_id') == category_id:
+                    totals[bucket['book_id']] += int(bucket['quantity'])
+    # Over-fetch a little: some of the leaders may since have been deactivated
+    leaders = [book_id for book_id, n in heapq.nlargest(limit * 2, totals.items(), key=lambda pair: pair[1]) if n > 0]
+    found = {b['id']: b for b in books_repo.get_many(leaders) if b.get('is_active', True)}
+    return [found[book_id] for book_id in leaders if book_id in found][:limit]
+
+
+def rebuild_sales():
+    """Recount every counter from order history (for backfills and after manual fixes)"""
+    started = time.perf_counter()
+    if current_app.config.get('USE_AWS'):
+        stats = _rebuild_dynamo()
+    else:
+        stats = _rebuild_sql()
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def _rebuild_sql():
+    global _rolled_day
+    from app.models import Book, BookSales, SalesBucket, Order, OrderItem, Checkpoint
+    today = datetime.utcnow().date()
+    since = today - timedelta(days=max(WINDOWS.values()) - 1)
+    sold = Order.status != 'cancelled'
+    all_time = db.session.query(OrderItem.book_id, db.func.sum(OrderItem.quantity)).join(Order).filter(
+        sold).group_by(OrderItem.book_id).all()
+    day = db.func.date(Order.created_at)
+    recent = db.session.query(OrderItem.book_id, day, db.func.sum(OrderItem.quantity)).join(Order).filter(
+        sold, Order.created_at >= datetime.combine(since, datetime.min.time())).group_by(OrderItem.book_id, day).all()
+    
+    books = Book.__table__
+    db.session.execute(books.update().values(units_sold=0))
+    if all_time:
+        db.session.execute(
+            books.update().where(books.c.id == db.bindparam('_book_id')).values(units_sold=db.bindparam('_quantity')),
+            [{'_book_id': book_id, '_quantity': quantity} for book_id, quantity in all_time]
+        )
+    SalesBucket.query.delete(synchronize_session=False)
+    BookSales.query.delete(synchronize_session=False)
+    windows = {}
+    buckets = []
+    for book_id, bucket_day, quantity in recent:
+        bucket_day = date.fromisoformat(str(bucket_day))
+        buckets.append({'book_id': book_id, 'day': bucket_day, 'quantity': quantity})
+        counts = windows.setdefault(book_id, dict.fromkeys(WINDOWS, 0))
+        for window, days in WINDOWS.items():
+            if (today - bucket_day).days < days:
+                counts[window] += quantity
+    if buckets:
+        db.session.execute(SalesBucket.__table__.insert(), buckets)
+    now = datetime.utcnow()
+    if windows:
+        db.session.execute(BookSales.__table__.insert(), [
+            dict({f'sold_{window}': n for window, n in counts.items()}, book_id=book_id, updated_at=now)
+            for book_id, counts in windows.items()])
+    Checkpoint.set(CHECKPOINT, today.isoformat())
+    db.session.commit()
+    _rolled_day = None
+    return {'books': len(all_time), 'recent': len(windows)}
+
+
+def _rebuild_dynamo():
+    from app.utils.dynamo_repo import BookRepository, OrderRepository, SalesRepository
+    books_repo = BookRepository()
+    sales_repo = SalesRepository()
+    categories = {item['id']: item.get('category_id') for item in books_repo.iter_all(
+        ProjectionExpression='id, category_id')}
+    since = (datetime.utcnow() - timedelta(days=SalesRepository.RETENTION_DAYS)).isoformat()
+    all_time, buckets = Counter(), Counter()
+    scan = {'ProjectionExpression': '#status, created_at, #items',
+            'ExpressionAttributeNames': {'#status': 'status', '#items': 'items'}}
+    for order in OrderRepository().iter_all(**scan):
+        if order.get('status') == 'cancelled':
+            continue
+        for item in order.get('items', []):
+            book_id = str(item['book_id'])
+            all_time[book_id] += int(item['quantity'])
+            if order.get('created_at', '') >= since:
+                buckets[(order['created_at'][:10], book_id)] += int(item['quantity'])
+    
+    for book_id in categories:
+        books_repo.table.update_item(Key={'id': book_id}, UpdateExpression='SET units_sold = :n',
+                                     ExpressionAttributeValues={':n': all_time.get(book_id, 0)})
+    with sales_repo.table.batch_writer(overwrite_by_pkeys=['day', 'book_id']) as batch:
+        for (day, book_id), quantity in buckets.items():
+            expires = ((date.fromisoformat(day) - SalesRepository.EPOCH).days + SalesRepository.RETENTION_DAYS) * 86400
+            batch.put_item(Item={'day': day, 'book_id': book_id, 'category_id': str(categories.get(book_id) or ''),
+                                 'quantity': quantity, 'expires_at': expires})
+    _aws_cache.clear()
+    return {'books': len(all_time), 'recent': len({book_id for _, book_id in buckets})}
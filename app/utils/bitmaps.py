@@ -0,0 +1,231 @@
+import threading
+import time
+from datetime import timedelta
+import numpy as np
+from flask import current_app, has_app_context
+from app.utils.cdc import subscribe
+from app.utils.invalidation import Watcher
+
+# Predicates indexed for every book; 'all' is every live book, so negations stay inside the catalog
+PREDICATES = ('all', 'active', 'in_stock', 'category', 'genre')
+# Soonest a bus invalidation from another worker triggers a delta refresh after the last one
+BUS_REFRESH_INTERVAL = 1
+# Delta refreshes re-read this far behind the newest updated_at seen (writers' clocks and commit order)
+DELTA_OVERLAP = timedelta(seconds=5)
+
+
+def predicate_keys(is_active, stock_quantity, category_id, genre):
+    """The (predicate, value) bitmaps a book with these values belongs to"""
+    keys = [('all', True)]
+    if is_active:
+        keys.append(('active', True))
+    if int(stock_quantity or 0) > 0:
+        keys.append(('in_stock', True))
+    if category_id:
+        keys.append(('category', str(category_id)))
+    if genre:
+        keys.append(('genre', genre))
+    return keys
+
+
+def book_keys(book):
+    """predicate_keys of a model, row, BookRecord or DynamoDB item"""
+    get = book.get if hasattr(book, 'get') else lambda field, default=None: getattr(book, field, default)
+    return predicate_keys(get('is_active', True), get('stock_quantity'), get('category_id'), get('genre'))
+
+
+def from_ordinals(ordinals, size):
+    mask = np.zeros(size, dtype=bool)
+    mask[ordinals] = True
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+class BitmapIndex:
+    """Python big-int bitsets over book ordinals, one per predicate value.
+    
+    Bit i of ('category', '3') is set when the book with ordinal i is in
+    category 3. Filters are ANDs and ORs of whole bitmaps and counts are
+    popcounts, so neither touches book data. What an ordinal means is the
+    owner's business: the position in a catalog snapshot, or the book id
+    itself in SQL mode.
+    """
+    
+    def __init__(self, bitmaps=None):
+        self.bitmaps = dict(bitmaps or {})
+    
+    @classmethod
+    def build(cls, books):
+        """Index `books`, an iterable of (ordinal, keys) where keys come from predicate_keys/book_keys"""
+        ordinals = {}
+        size = 0
+        for ordinal, keys in books:
+            size = max(size, ordinal + 1)
+            for key in keys:
+                ordinals.setdefault(key, []).append(ordinal)
+        return cls({key: from_ordinals(values, size) for key, values in ordinals.items()})
+    
+    def copy(self):
+        return BitmapIndex(self.bitmaps)
+    
+    def set(self, ordinal, book):
+        """Move an ordinal to the bitmaps of a book's current values (a change event)"""
+        self.clear(ordinal)
+        bit = 1 << ordinal
+        for key in book_keys(book):
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bit
+    
+    def clear(self, ordinal):
+        """Drop an ordinal from every bitmap (a deleted book)"""
+        bit = 1 << ordinal
+        for key, bits in list(self.bitmaps.items()):
+            if bits & bit:
+                bits &= ~bit
+                if bits:
+                    self.bitmaps[key] = bits
+                else:
+                    del self.bitmaps[key]
+    
+    def get(self, predicate, value=True):
+        return self.bitmaps.get((predicate, value), 0)
+    
+    def any_of(self, predicate, values):
+        """OR of a predicate's bitmaps for several values"""
+        bits = 0
+        for value in values:
+            bits |= self.get(predicate, value)
+        return bits
+    
+    def select(self, active=True, in_stock=None, category_id=None, genre=None):
+        """Bitmap of the books matching every filter given (None skips it; category_id may be a list)"""
+        bits = self.get('all')
+        for predicate, wanted in (('active', active), ('in_stock', in_stock)):
+            if wanted is True:
+                bits &= self.get(predicate)
+            elif wanted is False:
+                bits &= ~self.get(predicate)
+        if category_id:
+            ids = category_id if isinstance(category_id, (list, tuple, set)) else [category_id]
+            bits &= self.any_of('category', [str(c) for c in ids])
+        if genre:
+            bits &= self.get('genre', genre)
+        return bits
+    
+    def count(self, bits):
+        return bits.bit_count()
+    
+    def facets(self, predicate, bits):
+        """{value: how many of `bits` have it} for one predicate, leaving out empty values"""
+        counts = {value: (bits & values).bit_count() for (name, value), values in self.bitmaps.items()
+                  if name == predicate}
+        return {value: n for value, n in counts.items() if n}
+    
+    def mask(self, bits, size):
+        """A bitmap as a NumPy boolean array over ordinals 0..size-1"""
+        raw = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(raw, count=size, bitorder='little').view(bool)
+    
+    def nbytes(self):
+        return sum((bits.bit_length() + 7) // 8 for bits in self.bitmaps.values())
+
+
+def facet_counts(index, category_id=None, in_stock=None, genre=None):
+    """Counts for the catalog's filter controls; each facet is counted under the other filters only"""
+    return {
+        'category': index.facets('category', index.select(in_stock=in_stock, genre=genre)),
+        'genre': index.facets('genre', index.select(in_stock=in_stock, category_id=category_id)),
+        'in_stock': index.count(index.select(in_stock=True, category_id=category_id, genre=genre)),
+    }
+
+
+class BookBitmaps:
+    """SQL-mode bitmap index of the books table, with book ids as ordinals.
+    
+    Kept current from updated_at deltas at most every BITMAP_REFRESH_INTERVAL
+    seconds, or within a second of a book invalidation on the bus, and reloaded in full every CATALOG_FULL_RELOAD_INTERVAL (hard
+    deletes only show up then). Deltas are applied in place: a reader racing
+    one may count a book under its old and new values for that instant.
+    """
+    
+    def __init__(self, app):
+        self.refresh_interval = app.config.get('BITMAP_REFRESH_INTERVAL', 5)
+        self.full_reload_interval = app.config.get('CATALOG_FULL_RELOAD_INTERVAL', 600)
+        self.index = None
+        self.high_water = None
+        self.checked_at = 0
+        self.loaded_at = 0
+        self.watch = Watcher('book')
+        self._lock = threading.Lock()
+    
+    def on_change(self, change):
+        """Apply a book change committed in this process; other processes' changes arrive with the next delta"""
+        index = self.index
+        if index is None:
+            return
+        if change.op == 'delete':
+            index.clear(int(change.key))
+        elif change.op == 'insert':
+            index.set(int(change.key), change.values)
+        else:
+            # Updates may carry only the changed columns; the next read re-reads the row
+            self.checked_at = 0
+    
+    def _rows(self, since=None):
+        from app import db
+        from app.models import Book
+        query = db.session.query(Book.id, Book.is_active, Book.stock_quantity, Book.category_id, Book.genre,
+                                 Book.updated_at)
+        if since is not None:
+            query = query.filter(Book.updated_at >= since - DELTA_OVERLAP)
+        return query.all()
+    
+    def _fresh(self, now):
+        age = now - self.checked_at
+        return age < self.refresh_interval and (age < BUS_REFRESH_INTERVAL or not self.watch.changed())
+    
+    def current(self):
+        now = time.monotonic()
+        if self.index is not None and self._fresh(now):
+            return self.index
+        if not self._lock.acquire(blocking=self.index is None):
+            # Another thread is refreshing; the current bitmaps are at most one interval old
+            return self.index
+        try:
+            if self.index is not None and self._fresh(time.monotonic()):
+                return self.index
+            self.watch.mark()
+            if self.index is None or now - self.loaded_at >= self.full_reload_interval:
+                rows = self._rows()
+                self.index = BitmapIndex.build((row[0], predicate_keys(*row[1:5])) for row in rows)
+                self.loaded_at = now
+            else:
+                rows = self._rows(self.high_water)
+                for row in rows:
+                    self.index.set(row.id, row)
+            stamps = [row.updated_at for row in rows if row.updated_at]
+            if self.high_water is not None:
+                stamps.append(self.high_water)
+            self.high_water = max(stamps, default=None)
+            self.checked_at = now
+            return self.index
+        finally:
+            self._lock.release()
+
+
+def _book_changed(change):
+    service = current_app.extensions.get('book_bitmaps') if has_app_context() else None
+    if service is not None and change.source == 'sql':
+        service.on_change(change)
+
+
+subscribe('book', _book_changed)
+
+
+def get_bitmaps():
+    """This process's SQL-mode book bitmaps, or None in AWS mode (the catalog snapshot has its own) or when disabled"""
+    app = current_app._get_current_object()
+    if app.config.get('USE_AWS') or not app.config.get('BITMAP_INDEX', True):
+        return None
+    service = app.extensions.get('book_bitmaps')
+    if service is None:
+        service = app.extensions.setdefault('book_bitmaps', BookBitmaps(app))
+    return service.current()
@@ -0,0 +1,63 @@
+from app import db
+
+
+def bulk_upsert(model, rows, conflict_columns, update_columns=(), increment_columns=(), where=None):
+    """Insert rows in one statement, resolving unique-key conflicts in the database.
+    
+    On conflict, `update_columns` take the incoming value and
+    `increment_columns` add the incoming value to the stored one. `where`,
+    a function of (table, incoming row columns) returning a condition,
+    limits the update to stored rows that meet it; the others are left
+    as they are. Uses INSERT ... ON CONFLICT on SQLite/PostgreSQL and ON
+    DUPLICATE KEY UPDATE on MySQL; other dialects fall back to a
+    row-by-row merge.
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        set_ = {col: stmt.excluded[col] for col in update_columns}
+        set_.update({col: table.c[col] + stmt.excluded[col] for col in increment_columns})
+        if set_:
+            stmt = stmt.on_conflict_do_update(index_elements=list(conflict_columns), set_=set_,
+                                              where=where(table, stmt.excluded) if where is not None else None)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(conflict_columns))
+        db.session.execute(stmt, rows)
+    elif dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        set_ = {col: stmt.inserted[col] for col in update_columns}
+        set_.update({col: table.c[col] + stmt.inserted[col] for col in increment_columns})
+        if where is not None:
+            # No WHERE on this form: every assignment keeps the stored value unless the row qualifies
+            condition = where(table, stmt.inserted)
+            set_ = {col: db.func.if_(condition, value, table.c[col]) for col, value in set_.items()}
+        # MySQL needs at least one assignment; a no-op keeps duplicate rows untouched
+        if not set_:
+            first = list(conflict_columns)[0]
+            set_ = {first: table.c[first]}
+        db.session.execute(stmt.on_duplicate_key_update(**set_), rows)
+    else:
+        for row in rows:
+            criteria = {col: row[col] for col in conflict_columns}
+            existing = model.query.filter_by(**criteria).first()
+            if existing is None:
+                db.session.add(model(**row))
+                continue
+            if where is not None:
+                incoming = {col: db.literal(value, table.c[col].type) for col, value in row.items()}
+                if not model.query.filter_by(**criteria).filter(where(table, incoming)).count():
+                    continue
+            for col in update_columns:
+                setattr(existing, col, row[col])
+            for col in increment_columns:
+                setattr(existing, col, getattr(existing, col) + row[col])
+    return len(rows)
@@ -0,0 +1,153 @@
+from functools import cached_property
+import numpy as np
+
+# Listing orders and whether their key sorts descending
+ORDERS = {'newest': True, 'price_low': False, 'price_high': True, 'title': False, 'bestselling': True}
+
+
+def _timestamps(values):
+    """ISO timestamps as int64 microseconds (missing ones sort oldest)"""
+    values = [value or '1970-01-01' for value in values]
+    try:
+        return np.array(values, dtype='datetime64[us]').astype(np.int64)
+    except ValueError:
+        # Offsets or odd formats: rank the strings instead, ISO order is time order
+        return np.unique(np.array(values, dtype=object), return_inverse=True)[1].astype(np.int64)
+
+
+class CatalogColumns:
+    """Sort and filter keys of a list of books as parallel NumPy arrays.
+    
+    Accepts DynamoDB items or BookRecords (anything with .get). Each column
+    is extracted the first time it is used, so a one-off page only pays for
+    the keys it sorts and filters on. Prices are converted to floats once
+    here rather than in every sort key, and categories are coded as small
+    integers (-1 for none) so filters are vectorized comparisons.
+    """
+    
+    def __init__(self, books):
+        self._books = books
+    
+    def _column(self, field, convert, dtype):
+        return np.fromiter((convert(b.get(field)) for b in self._books), dtype=dtype, count=len(self._books))
+    
+    @cached_property
+    def price(self):
+        return self._column('price', lambda v: float(v or 0), np.float64)
+    
+    @cached_property
+    def stock(self):
+        return self._column('stock_quantity', lambda v: int(v or 0), np.int64)
+    
+    @cached_property
+    def units_sold(self):
+        return self._column('units_sold', lambda v: int(v or 0), np.int64)
+    
+    @cached_property
+    def active(self):
+        return np.fromiter((bool(b.get('is_active', True)) for b in self._books), dtype=bool, count=len(self._books))
+    
+    @cached_property
+    def created(self):
+        return _timestamps([b.get('created_at') for b in self._books])
+    
+    @cached_property
+    def category_ids(self):
+        return sorted({str(b.get('category_id')) for b in self._books if b.get('category_id')})
+    
+    @cached_property
+    def category(self):
+        codes = {category_id: code for code, category_id in enumerate(self.category_ids)}
+        return self._column('category_id', lambda c: codes[str(c)] if c else -1, np.int32)
+    
+    @cached_property
+    def title_rank(self):
+        # Strings sort faster in Python than as a NumPy object array; only the ranks are kept
+        titles = [(b.get('title') or '').lower() for b in self._books]
+        rank = np.empty(len(titles), dtype=np.int64)
+        rank[sorted(range(len(titles)), key=titles.__getitem__)] = np.arange(len(titles))
+        return rank
+    
+    def __len__(self):
+        return len(self._books)
+    
+    def category_code(self, category_id):
+        """Code of a category id, or None when no book is in it"""
+        try:
+            return self.category_ids.index(str(category_id))
+        except ValueError:
+            return None
+    
+    def mask(self, category_id=None, in_stock=False, active=True, genre=None):
+        """Boolean mask of the books matching every given filter"""
+        mask = self.active.copy() if active else np.ones(len(self), dtype=bool)
+        if category_id and 'category' not in vars(self):
+            # One comparison pass is cheaper than coding every category for a single filter
+            category_id = str(category_id)
+            mask &= self._column('category_id', lambda c: str(c) == category_id, bool)
+        elif category_id:
+            code = self.category_code(category_id)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.category == code
+        if in_stock:
+            mask &= self.stock > 0
+        if genre:
+            mask &= self._column('genre', lambda value: value == genre, bool)
+        return mask
+    
+    def key(self, sort):
+        """Ascending numeric sort key for a listing order (descending orders are negated)"""
+        if sort in ('price_low', 'price_high'):
+            key = self.price
+        elif sort == 'title':
+            key = self.title_rank
+        elif sort == 'bestselling':
+            key = self.units_sold
+        else:
+            key = self.created
+        return -key if ORDERS.get(sort, True) else key
+    
+    def order(self, sort):
+        """Full permutation of every book in a listing order (ties keep list order)"""
+        return np.argsort(self.key(sort), kind='stable')
+    
+    def nbytes(self):
+        """Bytes held by the columns extracted so far"""
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+    
+    def top(self, sort, mask, stop):
+        """Ordinals of the first `stop` matching books in a listing order, and how many match.
+        
+        A partition finds the `stop`-th key without sorting the rest (the
+        argpartition idea, keeping ties), so an early page only sorts its
+        own candidates.
+        """
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        total = len(rows)
+        key = self.key(sort)[rows]
+        if 0 < stop < total:
+            kth = np.partition(key, stop - 1)[stop - 1]
+            keep = key <= kth
+            rows, key = rows[keep], key[keep]
+        return rows[np.lexsort((rows, key))][:stop], total
+
+
+def group(order, codes):
+    """Split a permutation by code, keeping its order within each group: {code: ordinals}"""
+    grouped = order[np.argsort(codes[order], kind='stable')]
+    bounds = np.flatnonzero(np.diff(codes[grouped])) + 1
+    return {int(codes[rows[0]]): rows for rows in np.split(grouped, bounds) if len(rows)}
+
+
+def page_items(books, sort='newest', category_id=None, page=1, per_page=12, in_stock=False, genre=None):
+    """(items, total) for one page of a list of DynamoDB items, filtered and sorted with NumPy.
+    
+    Sort keys are only extracted for the books that pass the filters.
+    """
+    selected = np.flatnonzero(CatalogColumns(books).mask(category_id, in_stock, genre=genre))
+    if len(selected) < len(books):
+        books = [books[i] for i in selected.tolist()]
+    start = max(page - 1, 0) * per_page
+    rows, total = CatalogColumns(books).top(sort, None, start + per_page)
+    return [books[i] for i in rows[start:].tolist()], total
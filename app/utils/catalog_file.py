@@ -0,0 +1,282 @@
+import inspect
+import json
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate
+import numpy as np
+
+from app.utils.bitmaps import BitmapIndex, facet_counts
+from app.utils.catalog_snapshot import FIELDS, SORTS, BookRecord, CatalogSnapshot
+
+MAGIC = b'BBCAT\x00\x01\x00'
+PREAMBLE = struct.Struct('<8sQQ')  # magic, header offset, header length
+CURRENT = 'CURRENT'
+# Fixed-width columns; every other field goes into a string heap with an offsets column
+NUMERIC = {'price': 'd', 'stock_quantity': 'q', 'units_sold': 'q', 'is_active': 'b'}
+STRINGS = tuple(field for field in FIELDS if field not in NUMERIC)
+# What callers of get_catalog() use; MappedCatalog must take exactly the arguments CatalogSnapshot does
+READ_API = ('get', 'get_many', 'page', 'newest', 'facets', 'in_category', 'for_seller', 'search', 'stats')
+
+
+def _heap(values):
+    """(utf-8 bytes of all values, int64 offsets with one extra end entry)"""
+    encoded = [(value or '').encode() for value in values]
+    return b''.join(encoded), array('q', accumulate(map(len, encoded), initial=0)).tobytes()
+
+
+def _grouped(groups):
+    """Concatenate ordinal arrays, returning the bytes and each group's [start, end) range"""
+    keys = sorted(groups)
+    ends = np.cumsum([len(groups[key]) for key in keys]).tolist()
+    ranges = {key: [end - len(groups[key]), end] for key, end in zip(keys, ends)}
+    merged = np.concatenate([groups[key] for key in keys]) if keys else np.empty(0)
+    return merged.astype(np.int64).tobytes(), ranges
+
+
+def write_catalog(snapshot, directory, keep=2):
+    """Serialize a CatalogSnapshot into a new version file and point CURRENT at it atomically.
+    
+    Layout: a fixed preamble, 8-byte aligned sections (numeric columns,
+    string heaps with offsets, presorted ordinal indexes, the lowercased
+    search text in newest order, predicate bitmaps) and a JSON header at the end naming each
+    section's position. Readers map it read-only, so the pages are shared
+    by every worker on the host.
+    """
+    records = snapshot.records
+    sections = []
+    for field, code in NUMERIC.items():
+        sections.append((field, array(code, (getattr(record, field) for record in records)).tobytes()))
+    for field in STRINGS:
+        heap, offsets = _heap(getattr(record, field) for record in records)
+        sections += [('str:' + field, heap), ('off:' + field, offsets)]
+    category_ranges = None
+    for sort in SORTS:
+        sections.append(('idx:' + sort, snapshot.indexes[(sort, None)].astype(np.int64).tobytes()))
+        grouped, category_ranges = _grouped({category_id: index for (name, category_id), index
+                                             in snapshot.indexes.items() if name == sort and category_id})
+        sections.append(('cat:' + sort, grouped))
+    by_seller, seller_ranges = _grouped({seller_id: index for seller_id, index in snapshot.by_seller.items()
+                                         if seller_id})
+    sections.append(('seller', by_seller))
+    sections.append(('ids', array('q', sorted(range(len(records)), key=lambda i: records[i].id)).tobytes()))
+    # NUL-separated so a search can never match across two books
+    newest = snapshot.indexes[('newest', None)]
+    heap, offsets = _heap(snapshot.search_text[i] + '\x00' for i in newest)
+    sections += [('search', heap), ('off:search', offsets)]
+    # Bitmaps by position; the header maps each (predicate, value) to its section
+    bitmaps = []
+    for position, (key, bits) in enumerate(snapshot.bitmaps.bitmaps.items()):
+        bitmaps.append([*key, f'bits:{position}'])
+        sections.append((f'bits:{position}', bits.to_bytes((len(records) + 7) // 8, 'little')))
+    
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'catalog-{version}.bin')
+    positions = {}
+    with open(path + '.tmp', 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, 0, 0))
+        for name, data in sections:
+            f.write(b'\x00' * (-f.tell() % 8))
+            positions[name] = [f.tell(), len(data)]
+            f.write(data)
+        header = json.dumps({
+            'version': version,
+            'books': len(records),
+            'active': len(newest),
+            'high_water': snapshot.high_water,
+            'loaded_at': snapshot.loaded_at,
+            'categories': snapshot.categories,
+            'category_ranges': category_ranges or {},
+            'seller_ranges': seller_ranges,
+            'bitmaps': bitmaps,
+            'sections': positions,
+        }, default=str).encode()
+        header_offset = f.tell()
+        f.write(header)
+        f.seek(0)
+        f.write(PREAMBLE.pack(MAGIC, header_offset, len(header)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    pointer = os.path.join(directory, CURRENT + '.tmp')
+    with open(pointer, 'w') as f:
+        f.write(os.path.basename(path))
+    os.replace(pointer, os.path.join(directory, CURRENT))
+    # Workers still mapping an older version keep its pages after the unlink
+    versions = sorted(name for name in os.listdir(directory) if name.startswith('catalog-') and name.endswith('.bin'))
+    for name in versions[:-keep]:
+        os.remove(os.path.join(directory, name))
+    return path
+
+
+def current_version(directory):
+    """File name CURRENT points at, or None before the first write"""
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class MappedCatalog:
+    """Read-only view of a catalog file with the same read API as CatalogSnapshot.
+    
+    Nothing is copied out of the mapping until a page is materialised, so
+    N workers share one copy of the catalog through the page cache.
+    """
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_offset, header_length = PREAMBLE.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot file')
+        self.path = path
+        self.header = json.loads(self._mm[header_offset:header_offset + header_length])
+        self.categories = self.header['categories']
+        self.high_water = self.header['high_water']
+        self.loaded_at = self.header['loaded_at']
+        self._category_ranges = self.header['category_ranges']
+        self._seller_ranges = self.header['seller_ranges']
+        view = memoryview(self._mm)
+        sections = {name: view[offset:offset + length] for name, (offset, length) in self.header['sections'].items()}
+        self._columns = {field: sections[field].cast(code) for field, code in NUMERIC.items()}
+        self._heaps = {field: sections['str:' + field] for field in STRINGS}
+        self._offsets = {field: sections['off:' + field].cast('q') for field in STRINGS}
+        # Ordinal arrays are NumPy views straight onto the mapping: slicing and masking copy nothing shared
+        self._indexes = {sort: np.frombuffer(sections['idx:' + sort], np.int64) for sort in SORTS}
+        self._by_category = {sort: np.frombuffer(sections['cat:' + sort], np.int64) for sort in SORTS}
+        self._by_seller = np.frombuffer(sections['seller'], np.int64)
+        # Bitmaps are small (a bit per book), so each worker keeps them as ints
+        self.bitmaps = BitmapIndex({(predicate, value): int.from_bytes(sections[name], 'little')
+                                    for predicate, value, name in self.header['bitmaps']})
+        self._ids = sections['ids'].cast('q')
+        self._search_start = self.header['sections']['search'][0]
+        self._search_end = self._search_start + self.header['sections']['search'][1]
+        self._search_offsets = sections['off:search'].cast('q')
+    
+    def __len__(self):
+        return self.header['books']
+    
+    def _string(self, field, row):
+        offsets = self._offsets[field]
+        return str(self._heaps[field][offsets[row]:offsets[row + 1]], 'utf-8') or None
+    
+    def record(self, row):
+        """Materialise one row as a BookRecord"""
+        item = {field: self._string(field, row) for field in STRINGS}
+        item.update({field: column[row] for field, column in self._columns.items()})
+        return BookRecord(item)
+    
+    def get(self, book_id):
+        book_id = str(book_id)
+        ids = self._ids
+        low, high = 0, len(ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string('id', ids[middle]) < book_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(ids) and self._string('id', ids[low]) == book_id:
+            return self.record(ids[low])
+        return None
+    
+    def get_many(self, book_ids):
+        return [record for record in map(self.get, book_ids) if record is not None]
+    
+    def _index(self, sort, category_id):
+        if not category_id:
+            return self._indexes[sort]
+        start, end = self._category_ranges.get(str(category_id), (0, 0))
+        return self._by_category[sort][start:end]
+    
+    def page(self, sort='newest', category_id=None, page=1, per_page=12, in_stock=False, genre=None, offset=None):
+        """(books, total) for one page of active books in a listing order; `offset` overrides `page`"""
+        descending = sort == 'price_high'
+        if descending:
+            sort = 'price_low'
+        elif sort not in SORTS:
+            sort = 'newest'
+        index = self._index(sort, category_id)
+        if in_stock or genre:
+            wanted = self.bitmaps.select(in_stock=in_stock or None, genre=genre)
+            index = index[self.bitmaps.mask(wanted, len(self))[index]]
+        total = len(index)
+        start = max(page - 1, 0) * per_page if offset is None else offset
+        if descending:
+            rows = reversed(index[max(total - start - per_page, 0):max(total - start, 0)])
+        else:
+            rows = index[start:start + per_page]
+        return [self.record(int(row)) for row in rows], total
+    
+    def newest(self, limit):
+        return self.page('newest', per_page=limit)[0]
+    
+    def facets(self, category_id=None, in_stock=False, genre=None):
+        return facet_counts(self.bitmaps, category_id, in_stock or None, genre)
+    
+    def in_category(self, category_id, exclude_id=None, limit=4):
+        books = []
+        for row in self._index('newest', category_id).tolist():
+            if self._string('id', row) != str(exclude_id):
+                books.append(self.record(row))
+                if len(books) == limit:
+                    break
+        return books
+    
+    def for_seller(self, seller_id):
+        """All of a seller's books, inactive ones included, newest first"""
+        start, end = self._seller_ranges.get(str(seller_id), (0, 0))
+        return [self.record(row) for row in self._by_seller[start:end].tolist()]
+    
+    def search(self, text, page=1, per_page=12, offset=None):
+        """(books, total) of active books whose title, author, description or genre contains `text`.
+        
+        Runs mmap.find over the shared search text, which is laid out in
+        newest-first order, so matches come out already sorted.
+        """
+        needle = text.lower().encode()
+        if not needle:
+            return self.page('newest', page=page, per_page=per_page, offset=offset)
+        offsets = self._search_offsets
+        base, end = self._search_start, self._search_end
+        matches = []
+        position = base
+        while True:
+            hit = self._mm.find(needle, position, end)
+            if hit < 0:
+                break
+            match = bisect_right(offsets, hit - base) - 1
+            matches.append(match)
+            position = base + offsets[match + 1]
+        start = max(page - 1, 0) * per_page if offset is None else offset
+        newest = self._indexes['newest']
+        return [self.record(int(newest[match])) for match in matches[start:start + per_page]], len(matches)
+    
+    def stats(self):
+        return {
+            'books': self.header['books'],
+            'active': self.header['active'],
+            'file_mb': round(os.path.getsize(self.path) / 2 ** 20, 1),
+            'version': self.header['version'],
+            'high_water': self.high_water,
+            'age_s': round(time.time() - self.loaded_at, 1),
+        }
+
+
+def _check_read_api():
+    """Fail at import, rather than with a TypeError in a request, when the two catalogs' read APIs drift apart"""
+    for name in READ_API:
+        mapped = inspect.signature(getattr(MappedCatalog, name))
+        snapshot = inspect.signature(getattr(CatalogSnapshot, name))
+        if mapped != snapshot:
+            raise TypeError(f'MappedCatalog.{name}{mapped} does not match CatalogSnapshot.{name}{snapshot}')
+
+
+_check_read_api()
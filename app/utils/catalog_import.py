@@ -0,0 +1,281 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from flask import current_app
+from app import db
+
+IMPORT_FIELDS = ['title', 'author', 'genre', 'publisher', 'publication_date', 'isbn', 'price',
+                 'stock_quantity', 'description', 'image_url', 'category']
+
+# Columns an import may overwrite on an existing book (matched by ISBN)
+UPDATE_COLUMNS = ['title', 'author', 'genre', 'publisher', 'publication_date', 'price', 'stock_quantity',
+                  'description', 'image_url', 'category_id', 'is_active', 'updated_at']
+
+
+class ImportReport:
+    """Outcome of an import: row counts plus per-row errors (line number, message)"""
+    
+    def __init__(self, max_errors=1000):
+        self.processed = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.max_errors = max_errors
+    
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
+    
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors]
+        }
+
+
+def detect_format(filename):
+    return 'jsonl' if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def iter_rows(stream, fmt='csv'):
+    """Yield (line number, raw dict) from a binary or text stream without reading it all"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, {'__error__': f'Invalid JSON: {e}'}
+                continue
+            yield line_no, row if isinstance(row, dict) else {'__error__': 'Expected a JSON object'}
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _text(raw, key, limit=None):
+    value = raw.get(key)
+    value = '' if value is None else str(value).strip()
+    return value[:limit] if limit else value
+
+
+def validate_row(raw, categories):
+    """Return (clean row, None) or (None, error message) for one raw record"""
+    if '__error__' in raw:
+        return None, raw['__error__']
+    title = _text(raw, 'title', 200)
+    author = _text(raw, 'author', 150)
+    if not title:
+        return None, 'Title is required.'
+    if not author:
+        return None, 'Author is required.'
+    try:
+        price = Decimal(_text(raw, 'price') or '0')
+    except InvalidOperation:
+        return None, 'Price must be a number.'
+    if price <= 0:
+        return None, 'Price must be greater than 0.'
+    try:
+        stock_quantity = int(_text(raw, 'stock_quantity') or 0)
+    except ValueError:
+        return None, 'Stock quantity must be a whole number.'
+    if stock_quantity < 0:
+        return None, 'Stock quantity cannot be negative.'
+    isbn = _text(raw, 'isbn')
+    if len(isbn) > 20:
+        return None, 'ISBN must be at most 20 characters.'
+    publication_date = None
+    if _text(raw, 'publication_date'):
+        try:
+            publication_date = datetime.strptime(_text(raw, 'publication_date'), '%Y-%m-%d').date()
+        except ValueError:
+            return None, 'Publication date must be YYYY-MM-DD.'
+    category = _text(raw, 'category') or _text(raw, 'category_id')
+    category_id = None
+    if category:
+        category_id = categories.get(category.lower())
+        if category_id is None:
+            return None, f'Unknown category "{category}".'
+    return {
+        'title': title,
+        'author': author,
+        'genre': _text(raw, 'genre', 100) or None,
+        'publisher': _text(raw, 'publisher', 150) or None,
+        'publication_date': publication_date,
+        'isbn': isbn or None,
+        'price': price,
+        'stock_quantity': stock_quantity,
+        'description': _text(raw, 'description') or None,
+        'image_url': _text(raw, 'image_url', 500) or None,
+        'category_id': category_id,
+    }, None
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CatalogImporter:
+    """Stream a seller's CSV/JSONL catalog into the books store in chunks.
+    
+    Each chunk is validated in memory and written with one bulk upsert
+    (SQL) or a DynamoDB batch_writer. Rows whose ISBN already belongs to
+    the seller update that book; ISBNs owned by another seller are left
+    alone and reported as errors.
+    """
+    
+    def __init__(self, seller_id, chunk_size=None):
+        self.seller_id = seller_id
+        self.chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', 1000)
+        self.use_aws = current_app.config.get('USE_AWS')
+        self._isbn_index = None
+    
+    def run(self, stream, fmt='csv'):
+        report = ImportReport()
+        categories = self._load_categories()
+        seen_isbns = set()
+        for chunk in _chunks(iter_rows(stream, fmt), self.chunk_size):
+            valid = []
+            for line_no, raw in chunk:
+                report.processed += 1
+                row, error = validate_row(raw, categories)
+                if error:
+                    report.add_error(line_no, error)
+                elif row['isbn'] and row['isbn'] in seen_isbns:
+                    report.add_error(line_no, f'Duplicate ISBN {row["isbn"]} in this file.')
+                else:
+                    if row['isbn']:
+                        seen_isbns.add(row['isbn'])
+                    valid.append((line_no, row))
+            if valid:
+                report.imported += self._write_chunk(valid, report)
+        return report
+    
+    def _load_categories(self):
+        if self.use_aws:
+            from app.utils.dynamo_repo import CategoryRepository
+            items = [(c['id'], c.get('category_name', '')) for c in CategoryRepository().get_all()]
+        else:
+            from app.models import Category
+            items = db.session.query(Category.id, Category.category_name).all()
+        categories = {}
+        for category_id, name in items:
+            categories[str(category_id).lower()] = category_id
+            categories[name.lower()] = category_id
+        return categories
+    
+    def _write_chunk(self, valid, report):
+        if self.use_aws:
+            return self._write_chunk_dynamo(valid, report)
+        return self._write_chunk_sql(valid, report)
+    
+    def _write_chunk_sql(self, valid, report):
+        from app.models import Book, Cart
+        from app.utils.bulk import bulk_upsert
+        from app.utils.cdc import record_change
+        now = datetime.utcnow()
+        with_isbn, without_isbn = [], []
+        for line_no, row in valid:
+            row.update(price=float(row['price']), seller_id=self.seller_id, is_active=True,
+                       created_at=now, updated_at=now)
+            (with_isbn if row['isbn'] else without_isbn).append((line_no, row))
+        isbns = [row['isbn'] for _, row in with_isbn]
+        # Prices before the upsert, so the carts holding repriced books can be refreshed after it
+        old_prices = dict(db.session.query(Book.isbn, Book.price).filter(
+            Book.isbn.in_(isbns), Book.seller_id == self.seller_id)) if isbns else {}
+        # Only the seller's own books are updated, even when another seller's book with the same ISBN appears
+        # between reading the catalog and this statement; rows left alone that way are reported below
+        bulk_upsert(Book, [row for _, row in with_isbn], ['isbn'], update_columns=UPDATE_COLUMNS,
+                    where=lambda table, incoming: table.c.seller_id == incoming['seller_id'])
+        # Neither statement goes through the session, so their changes are recorded for CDC here
+        if without_isbn:
+            rows = [row for _, row in without_isbn]
+            if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+                ids = db.session.execute(Book.__table__.insert().returning(Book.__table__.c.id,
+                                                                           sort_by_parameter_order=True),
+                                         rows).scalars().all()
+                for book_id, row in zip(ids, rows):
+                    record_change('book', 'insert', book_id, ['id', *row], dict(row, id=book_id))
+            else:
+                # No RETURNING for many rows (MySQL): a flush reports the new ids and changes itself
+                db.session.add_all(Book(**row) for row in rows)
+                db.session.flush()
+        stored = {}
+        if isbns:
+            for book_id, isbn, seller_id, created_at, updated_at in db.session.query(
+                    Book.id, Book.isbn, Book.seller_id, Book.created_at, Book.updated_at).filter(Book.isbn.in_(isbns)):
+                stored[isbn] = (book_id, seller_id, created_at == updated_at)
+        written = len(without_isbn)
+        repriced = []
+        for line_no, row in with_isbn:
+            book_id, owner, inserted = stored.get(row['isbn'], (None, None, False))
+            if owner != self.seller_id:
+                report.add_error(line_no, f'ISBN {row["isbn"]} already exists.')
+                continue
+            written += 1
+            # created_at is not among UPDATE_COLUMNS, so it still matches updated_at only on rows just inserted
+            if inserted:
+                record_change('book', 'insert', book_id, ['id', *row], dict(row, id=book_id))
+            else:
+                record_change('book', 'update', book_id, UPDATE_COLUMNS,
+                              {column: row[column] for column in UPDATE_COLUMNS})
+                if old_prices.get(row['isbn']) != row['price']:
+                    repriced.append(book_id)
+        # Cart summaries price their lines; like edit_book, refresh them in the same transaction
+        Cart.refresh_for_books(repriced)
+        db.session.commit()
+        return written
+    
+    def _write_chunk_dynamo(self, valid, report):
+        import uuid
+        from app.utils.cdc import publish_item_change
+        from app.utils.dynamo_repo import BookRepository
+        books_repo = BookRepository()
+        if self._isbn_index is None:
+            self._isbn_index = books_repo.get_isbn_index()
+        now = datetime.utcnow().isoformat()
+        written = 0
+        changes = []
+        with books_repo.table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+            for line_no, row in valid:
+                existing = self._isbn_index.get(row['isbn']) if row['isbn'] else None
+                if existing and existing['seller_id'] != str(self.seller_id):
+                    report.add_error(line_no, f'ISBN {row["isbn"]} already exists.')
+                    continue
+                book_id = existing['id'] if existing else str(uuid.uuid4())
+                item = {key: value for key, value in row.items() if value is not None}
+                item.update({
+                    'id': book_id,
+                    'price': str(row['price']),
+                    'publication_date': row['publication_date'].isoformat() if row['publication_date'] else None,
+                    'category_id': str(row['category_id']) if row['category_id'] else None,
+                    'seller_id': str(self.seller_id),
+                    'is_active': True,
+                    'created_at': existing['created_at'] if existing else now,
+                    'updated_at': now
+                })
+                batch.put_item(Item={key: value for key, value in books_repo.stamp(item).items() if value is not None})
+                changes.append(('update' if existing else 'insert', book_id, item))
+                if row['isbn']:
+                    self._isbn_index[row['isbn']] = {'id': book_id, 'seller_id': str(self.seller_id),
+                                                     'created_at': item['created_at']}
+                written += 1
+        # Published once the batch has been flushed, like the repository's own writes
+        for op, book_id, item in changes:
+            publish_item_change('book', op, book_id, item)
+        return written
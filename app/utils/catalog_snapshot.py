@@ -0,0 +1,411 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from app.utils.bitmaps import BitmapIndex, book_keys, facet_counts
+from app.utils.catalog_arrays import CatalogColumns, group
+from app.utils.invalidation import Watcher
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared snapshot, every worker keeps its own
+    fcntl = None
+
+# Attributes copied out of each Books item; anything else stays in DynamoDB
+FIELDS = ('id', 'title', 'author', 'genre', 'publisher', 'publication_date', 'isbn', 'price', 'stock_quantity',
+          'units_sold', 'description', 'image_url', 'category_id', 'seller_id', 'is_active', 'created_at',
+          'updated_at')
+# Low-cardinality strings, stored once per process however many books share them
+INTERNED = frozenset(('author', 'genre', 'publisher', 'category_id', 'seller_id'))
+# Listing orders kept presorted; price_high reads price_low backwards
+SORTS = ('newest', 'price_low', 'title', 'bestselling')
+# Delta queries re-read this far behind the newest updated_at seen, to cover slightly skewed writer clocks
+DELTA_OVERLAP = timedelta(seconds=5)
+
+
+class BookRecord:
+    """One catalog book, readable like the DynamoDB item it came from (attributes, .get() and [])"""
+    __slots__ = FIELDS
+    
+    def __init__(self, item):
+        for field in FIELDS:
+            value = item.get(field)
+            if value is not None and field in INTERNED:
+                value = sys.intern(str(value))
+            setattr(self, field, value)
+        self.id = str(item['id'])
+        self.price = float(item.get('price') or 0)
+        self.stock_quantity = int(item.get('stock_quantity') or 0)
+        self.units_sold = int(item.get('units_sold') or 0)
+        self.is_active = bool(item.get('is_active', True))
+    
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+    
+    def is_in_stock(self):
+        return self.stock_quantity > 0
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+    
+    def __repr__(self):
+        return f'<BookRecord {self.id}>'
+
+
+def _search_text(record):
+    if not record.is_active:
+        return ''
+    return '\n'.join(value or '' for value in (record.title, record.author, record.description, record.genre)).lower()
+
+
+def _record_size(record, text):
+    """Bytes held by one record that no other record shares (interned strings are counted once, separately)"""
+    size = sys.getsizeof(record) + sys.getsizeof(text)
+    for field in FIELDS:
+        if field not in INTERNED:
+            size += sys.getsizeof(getattr(record, field))
+    return size
+
+
+class CatalogSnapshot:
+    """Immutable in-memory copy of the Books table with presorted listing indexes.
+    
+    Records live in one list addressed by ordinal, with their sort and
+    filter keys as NumPy columns (see CatalogColumns). Every listing order
+    is a permutation of ordinals, kept per category as well, so a catalog
+    page is a slice and extra filters are a mask over it. Refreshes build
+    a new snapshot (reusing unchanged records) that replaces this one in a
+    single assignment, so readers never need a lock.
+    """
+    
+    def __init__(self, records, categories, record_bytes=None, bitmaps=None):
+        self.records = records
+        self.categories = categories
+        self.positions = {record.id: i for i, record in enumerate(records)}
+        self.search_text = [_search_text(record) for record in records]
+        self.high_water = max((record.updated_at or '' for record in records), default='')
+        self.loaded_at = time.time()
+        self._build_indexes()
+        self.bitmaps = bitmaps if bitmaps is not None else BitmapIndex.build((i, book_keys(record)) for i, record in enumerate(records))
+        if record_bytes is None:
+            record_bytes = sum(_record_size(r, t) for r, t in zip(self.records, self.search_text))
+        self.record_bytes = record_bytes
+        self.memory_bytes = record_bytes + self._shared_bytes()
+    
+    @classmethod
+    def build(cls, items, categories):
+        return cls([BookRecord(item) for item in items], categories)
+    
+    def apply(self, items, categories=None):
+        """A new snapshot with `items` (changed Books items) inserted or replaced, and new categories if given"""
+        records = list(self.records)
+        record_bytes = self.record_bytes
+        # The bitmaps are updated per change rather than rebuilt
+        bitmaps = self.bitmaps.copy()
+        added = {}
+        for item in items:
+            record = BookRecord(item)
+            position = self.positions.get(record.id, added.get(record.id))
+            if position is None:
+                position = added[record.id] = len(records)
+                records.append(record)
+            else:
+                record_bytes -= _record_size(records[position], _search_text(records[position]))
+                records[position] = record
+            record_bytes += _record_size(record, _search_text(record))
+            bitmaps.set(position, record)
+        return CatalogSnapshot(records, categories if categories is not None else self.categories,
+                               record_bytes=record_bytes, bitmaps=bitmaps)
+    
+    def _build_indexes(self):
+        columns = self.columns = CatalogColumns(self.records)
+        category_ids = columns.category_ids
+        self.indexes = {}
+        for sort in SORTS:
+            order = columns.order(sort)
+            order = order[columns.active[order]]
+            self.indexes[(sort, None)] = order
+            for code, ordinals in group(order, columns.category).items():
+                if code >= 0:
+                    self.indexes[(sort, category_ids[code])] = ordinals
+        seller_ids = sorted({record.seller_id for record in self.records}, key=str)
+        codes = {seller_id: code for code, seller_id in enumerate(seller_ids)}
+        sellers = np.array([codes[record.seller_id] for record in self.records], dtype=np.int64)
+        self.by_seller = {seller_ids[code]: ordinals for code, ordinals
+                          in group(columns.order('newest'), sellers).items()}
+    
+    def _shared_bytes(self):
+        size = sys.getsizeof(self.records) + sys.getsizeof(self.positions) + sys.getsizeof(self.search_text)
+        size += sum(index.nbytes for index in self.indexes.values())
+        size += sum(index.nbytes for index in self.by_seller.values()) + self.columns.nbytes() + self.bitmaps.nbytes()
+        interned = {}
+        for record in self.records:
+            for field in INTERNED:
+                value = getattr(record, field)
+                if value is not None:
+                    interned[id(value)] = value
+        return size + sum(sys.getsizeof(value) for value in interned.values())
+    
+    def __len__(self):
+        return len(self.records)
+    
+    def get(self, book_id):
+        position = self.positions.get(str(book_id))
+        return None if position is None else self.records[position]
+    
+    def get_many(self, book_ids):
+        return [record for record in map(self.get, book_ids) if record is not None]
+    
+    def page(self, sort='newest', category_id=None, page=1, per_page=12, in_stock=False, genre=None, offset=None):
+        """(books, total) for one page of active books in a listing order; `offset` overrides `page`"""
+        descending = sort == 'price_high'
+        if descending:
+            sort = 'price_low'
+        elif sort not in SORTS:
+            sort = 'newest'
+        index = self.indexes.get((sort, str(category_id) if category_id else None), np.empty(0, np.int64))
+        if in_stock or genre:
+            # The category order is precomputed; other filters are a bitmap mask over it
+            wanted = self.bitmaps.select(in_stock=in_stock or None, genre=genre)
+            index = index[self.bitmaps.mask(wanted, len(self.records))[index]]
+        total = len(index)
+        start = max(page - 1, 0) * per_page if offset is None else offset
+        if descending:
+            ordinals = reversed(index[max(total - start - per_page, 0):max(total - start, 0)])
+        else:
+            ordinals = index[start:start + per_page]
+        return [self.records[i] for i in ordinals], total
+    
+    def newest(self, limit):
+        return self.page('newest', per_page=limit)[0]
+    
+    def facets(self, category_id=None, in_stock=False, genre=None):
+        return facet_counts(self.bitmaps, category_id, in_stock or None, genre)
+    
+    def in_category(self, category_id, exclude_id=None, limit=4):
+        books = []
+        for i in self.indexes.get(('newest', str(category_id)), np.empty(0, np.int64)).tolist():
+            if self.records[i].id != str(exclude_id):
+                books.append(self.records[i])
+                if len(books) == limit:
+                    break
+        return books
+    
+    def for_seller(self, seller_id):
+        """All of a seller's books, inactive ones included, newest first"""
+        return [self.records[i] for i in self.by_seller.get(str(seller_id), np.empty(0, np.int64)).tolist()]
+    
+    def search(self, text, page=1, per_page=12, offset=None):
+        """(books, total) of active books whose title, author, description or genre contains `text`"""
+        needle = text.lower()
+        search_text = self.search_text
+        matches = [i for i in self.indexes[('newest', None)].tolist() if needle in search_text[i]]
+        start = max(page - 1, 0) * per_page if offset is None else offset
+        return [self.records[i] for i in matches[start:start + per_page]], len(matches)
+    
+    def stats(self):
+        return {
+            'books': len(self.records),
+            'active': len(self.indexes[('newest', None)]),
+            'memory_mb': round(self.memory_bytes / 2 ** 20, 1),
+            'high_water': self.high_water,
+            'age_s': round(time.time() - self.loaded_at, 1),
+        }
+
+
+class CatalogService:
+    """Owns a process's catalog snapshot: loads it on first use, then keeps it fresh in the background.
+    
+    In shared mode (CATALOG_SNAPSHOT_SHARED) the workers on a host elect
+    one writer through a file lock. The writer keeps the in-memory snapshot
+    and publishes it as a versioned file after every change, and every
+    worker, the writer included, serves reads from a read-only mapping of
+    the newest file.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.snapshot = None
+        self.max_bytes = app.config.get('CATALOG_SNAPSHOT_MAX_MB', 256) * 2 ** 20
+        self.refresh_interval = app.config.get('CATALOG_REFRESH_INTERVAL', 5)
+        self.full_reload_interval = app.config.get('CATALOG_FULL_RELOAD_INTERVAL', 600)
+        self.last_full_load = 0
+        # When the last load or refresh started; later ones only ask for books changed after it
+        self.synced_at = None
+        self.shared = bool(app.config.get('CATALOG_SNAPSHOT_SHARED')) and fcntl is not None
+        self.directory = app.config.get('CATALOG_SNAPSHOT_DIR') or os.path.join(app.instance_path, 'catalog_snapshot')
+        self.mapped = None
+        self._mapped_version = None
+        self._checked_at = 0
+        self._writer_lock = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        # Category changes made by any worker on the host; book changes are found through updated_at
+        self.category_watch = Watcher('category', app)
+    
+    def current(self):
+        if self.shared:
+            self._start_refresher()
+            self.check_mapped()
+            return self.mapped
+        if self.snapshot is None and time.time() - self.last_full_load >= self.full_reload_interval:
+            with self._lock:
+                if self.snapshot is None and time.time() - self.last_full_load >= self.full_reload_interval:
+                    self.load()
+        self._start_refresher()
+        return self.snapshot
+    
+    def _start_refresher(self):
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = CatalogRefresher(self)
+                    self._refresher.start()
+    
+    def check_mapped(self, force=False):
+        """Map the newest catalog file if CURRENT has moved (looked at no more than once a second)"""
+        from app.utils.catalog_file import MappedCatalog, current_version
+        now = time.monotonic()
+        if not force and now - self._checked_at < 1:
+            return
+        self._checked_at = now
+        version = current_version(self.directory)
+        if version and version != self._mapped_version:
+            # Requests holding the old mapping finish on it; it is unmapped once they let go
+            self.mapped = MappedCatalog(os.path.join(self.directory, version))
+            self._mapped_version = version
+    
+    def claim_writer(self):
+        """True once this process holds the host's writer lock (kept until the process exits)"""
+        if self._writer_lock is None:
+            os.makedirs(self.directory, exist_ok=True)
+            handle = open(os.path.join(self.directory, 'writer.lock'), 'w')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                return False
+            self._writer_lock = handle
+            logging.info(f'Process {os.getpid()} is writing the shared catalog snapshot')
+        return True
+    
+    def publish(self):
+        from app.utils.catalog_file import write_catalog
+        started = time.perf_counter()
+        path = write_catalog(self.snapshot, self.directory)
+        logging.info(f'Catalog snapshot written to {path} in {time.perf_counter() - started:.2f}s')
+    
+    def load(self):
+        """Full reload; also how deleted books drop out, since delta queries cannot see deletions"""
+        from app.utils.dynamo_repo import BookRepository, CategoryRepository
+        started = time.perf_counter()
+        self.last_full_load = time.time()
+        self.category_watch.mark()
+        synced_at = datetime.utcnow()
+        snapshot = CatalogSnapshot.build(BookRepository().iter_all(), CategoryRepository().get_all())
+        self.synced_at = synced_at
+        self._install(snapshot, 'loaded', started)
+    
+    def refresh(self):
+        """Fold in the books changed since the last load or refresh"""
+        from app.utils.dynamo_repo import BookRepository, CategoryRepository
+        snapshot = self.snapshot
+        if snapshot is None and time.time() - self.last_full_load < self.full_reload_interval:
+            # Over budget: only the scheduled full reload tries again, not every tick or wake-up
+            return
+        if snapshot is None or not snapshot.high_water:
+            return self.load()
+        started = time.perf_counter()
+        categories = None
+        if self.category_watch.changed():
+            self.category_watch.mark()
+            categories = CategoryRepository().get_all()
+        synced_at = datetime.utcnow()
+        since = max(datetime.fromisoformat(snapshot.high_water), self.synced_at or datetime.min) - DELTA_OVERLAP
+        changed = BookRepository().iter_updated_since(since.isoformat())
+        if changed is None:
+            # Refreshes have been failing for days; reloading reads less than querying every day since
+            return self.load()
+        self.synced_at = synced_at
+        fresh = [item for item in changed if (snapshot.get(item['id']) is None or
+                                              snapshot.get(item['id']).updated_at != item.get('updated_at'))]
+        if fresh or categories is not None:
+            self._install(snapshot.apply(fresh, categories), f'refreshed with {len(fresh)} changed books', started)
+    
+    def _install(self, snapshot, action, started):
+        elapsed = round(time.perf_counter() - started, 2)
+        if snapshot.memory_bytes > self.max_bytes:
+            # Over budget: serve from DynamoDB scans until the next full reload tries again
+            logging.warning(f'Catalog snapshot needs {snapshot.stats()["memory_mb"]} MB, over the '
+                            f'CATALOG_SNAPSHOT_MAX_MB budget; reading the Books table directly instead')
+            self.snapshot = None
+            return
+        self.snapshot = snapshot
+        logging.info(f'Catalog snapshot {action} in {elapsed}s: {snapshot.stats()}')
+
+
+class CatalogRefresher(threading.Thread):
+    """Background thread applying delta refreshes, with a periodic full reload.
+    
+    Refreshes run once per CATALOG_REFRESH_INTERVAL and never more often:
+    under checkout traffic the invalidation bus changes about every
+    second, and a refresh per change would keep the Books table busy for
+    little gain. Writes, seller edits included, show up within an interval.
+    """
+    
+    def __init__(self, service):
+        super().__init__(name='catalog-refresher', daemon=True)
+        self.service = service
+    
+    def run(self):
+        service = self.service
+        # Shared workers start at once: there may be no file to map yet
+        wait = not service.shared
+        while True:
+            if wait:
+                time.sleep(service.refresh_interval)
+            wait = True
+            with service.app.app_context():
+                try:
+                    if service.shared and not service.claim_writer():
+                        # Readers only re-map; the writer acts on the invalidations
+                        service.category_watch.mark()
+                        service.check_mapped(force=True)
+                        continue
+                    before = service.snapshot
+                    if time.time() - service.last_full_load >= service.full_reload_interval:
+                        service.load()
+                    else:
+                        service.refresh()
+                    if service.shared:
+                        if service.snapshot is not None and service.snapshot is not before:
+                            service.publish()
+                        service.check_mapped(force=True)
+                except Exception as e:
+                    logging.warning(f'Catalog snapshot refresh failed: {e}')
+
+
+def get_catalog():
+    """This process's catalog (snapshot or shared mapping) in AWS mode, or None (SQL mode, disabled, over budget or not yet written)"""
+    from flask import current_app
+    app = current_app._get_current_object()
+    if not app.config.get('USE_AWS') or not app.config.get('CATALOG_SNAPSHOT', True):
+        return None
+    service = app.extensions.get('catalog_snapshot')
+    if service is None:
+        service = app.extensions.setdefault('catalog_snapshot', CatalogService(app))
+    try:
+        return service.current()
+    except Exception as e:
+        logging.warning(f'Catalog snapshot unavailable: {e}')
+        return None
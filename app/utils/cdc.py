@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still single writes, just not locked
+    fcntl = None
+
+# Tables whose committed changes are published, and the entity name their events carry
+ENTITIES = {'books': 'book', 'categories': 'category', 'orders': 'order', 'order_items': 'order_item', 'carts': 'cart',
+            'cart_items': 'cart_item', 'users': 'user'}
+# Columns reported as changed without their values: credentials and the personal data of users and orders
+REDACTED = frozenset(('password', 'email', 'phone', 'address', 'shipping_address'))
+# Log segment files, named by the offset of their first byte
+SEGMENT_PREFIX = 'changes-'
+SEGMENT_SUFFIX = '.log'
+
+# entity (or '*') -> handlers called in-process for each committed change
+_subscribers = {}
+_listening = False
+
+
+class ChangeEvent:
+    """One committed change to a row or item.
+    
+    `changed` names the columns that changed (every column for an
+    insert, none for a delete) and `values` holds the new values of those
+    the writer knew; bulk UPDATEs only know which columns they touched.
+    """
+    __slots__ = ('entity', 'op', 'key', 'changed', 'values', 'source', 'at')
+    
+    def __init__(self, entity, op, key, changed=(), values=None, source='sql', at=None):
+        self.entity = entity
+        self.op = op
+        self.key = str(key)
+        self.changed = tuple(changed)
+        self.values = values or {}
+        self.source = source
+        self.at = at or datetime.utcnow().isoformat()
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.op} {self.entity} {self.key}>'
+
+
+def _plain(value):
+    """A JSON-safe copy of a column or attribute value"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, set):
+        return sorted(map(_plain, value))
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if isinstance(value, bytes):
+        return None
+    return value
+
+
+def _values(changed, get):
+    return {name: _plain(get(name)) for name in changed if name not in REDACTED}
+
+
+def subscribe(entity, handler):
+    """Call handler(event) after every committed change to `entity` ('*' for all) in this process"""
+    _subscribers.setdefault(entity, []).append(handler)
+
+
+def publish(events):
+    """Append events to the durable log, then hand them to in-process subscribers"""
+    if not events:
+        return
+    log = get_change_log() if has_app_context() else None
+    if log is not None:
+        try:
+            log.append(events)
+        except OSError as e:
+            logging.warning(f'Change log append failed: {e}')
+    for change in events:
+        for handler in _subscribers.get(change.entity, []) + _subscribers.get('*', []):
+            try:
+                handler(change)
+            except Exception as e:
+                logging.warning(f'Change handler {handler!r} failed on {change!r}: {e}')
+
+
+def record_change(entity, op, key, changed=(), values=None, session=None):
+    """Queue a change SQLAlchemy cannot see (bulk UPDATE/DELETE); it is published if the transaction commits"""
+    if not _listening:
+        return
+    from app import db
+    session = session or db.session()
+    values = _values(list(values), values.get) if values else None
+    session.info.setdefault('cdc_events', []).append(ChangeEvent(entity, op, key, changed, values))
+
+
+def publish_item_change(entity, op, key, item=None, changed=None):
+    """Publish a DynamoDB write straight away; there is no transaction to wait for"""
+    if not _listening:
+        return
+    if changed is None:
+        changed = list(item) if item else []
+    values = _values(changed, item.get) if item else {}
+    publish([ChangeEvent(entity, op, key, changed, values, source='dynamo')])
+
+
+def _collect(session, flush_context):
+    """after_flush: turn the flushed inserts, updates and deletes of tracked models into pending events"""
+    pending = session.info.setdefault('cdc_events', [])
+    for op, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            entity = ENTITIES.get(getattr(obj, '__tablename__', None))
+            if entity is None:
+                continue
+            state = inspect(obj)
+            mapper = state.mapper
+            if op == 'update':
+                changed = [attr.key for attr in mapper.column_attrs if state.attrs[attr.key].history.has_changes()]
+                if not changed:
+                    continue
+            elif op == 'insert':
+                changed = [attr.key for attr in mapper.column_attrs]
+            else:
+                changed = []
+            key = '/'.join(str(part) for part in mapper.primary_key_from_instance(obj))
+            pending.append(ChangeEvent(entity, op, key, changed, _values(changed, lambda name: getattr(obj, name))))
+
+
+def _committed(session):
+    events = session.info.pop('cdc_events', None)
+    if events:
+        publish(events)
+
+
+def _rolled_back(session):
+    session.info.pop('cdc_events', None)
+
+
+class ChangeLog:
+    """Durable append-only log of change events (JSON lines) with per-consumer offsets.
+    
+    An offset is the byte position of the next unread line, counted
+    across the log's segment files; the newest segment takes the appends
+    and rolls over once it reaches `segment_bytes`. Writers from every
+    process on the host append under an exclusive lock; a consumer reads
+    from its offset and commits the new one once it has handled a batch,
+    so delivery is at least once. A segment every consumer has read past
+    is deleted, and a consumer's first read starts at the oldest segment
+    left. Nothing is deleted while no consumer is registered.
+    """
+    
+    def __init__(self, directory, segment_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(os.path.join(directory, 'offsets'), exist_ok=True)
+        self._lock = threading.Lock()
+        legacy = os.path.join(directory, 'changes.log')
+        if os.path.exists(legacy) and not self._segments():
+            # A single-file log from before segments; its offsets stay valid as the first segment
+            try:
+                os.replace(legacy, self._segment_path(0))
+            except FileNotFoundError:
+                pass
+    
+    def _segment_path(self, start):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{start:020d}{SEGMENT_SUFFIX}')
+    
+    def _segments(self):
+        """Start offsets of the segments on disk, oldest first"""
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+    
+    def append(self, events):
+        data = ''.join(json.dumps(change.to_dict(), default=str) + '\n' for change in events).encode()
+        with self._lock:
+            while True:
+                starts = self._segments()
+                start = starts[-1] if starts else 0
+                with open(self._segment_path(start), 'ab') as f:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        if self._segments()[-1] != start:
+                            # Another process rolled over while this one waited for the lock
+                            continue
+                        f.write(data)
+                        f.flush()
+                        if f.tell() >= self.segment_bytes:
+                            open(self._segment_path(start + f.tell()), 'ab').close()
+                        return
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def end(self):
+        """Offset just past the last event written"""
+        starts = self._segments()
+        if not starts:
+            return 0
+        return starts[-1] + os.path.getsize(self._segment_path(starts[-1]))
+    
+    def read(self, offset=0, limit=1000):
+        """Up to `limit` (next_offset, event) pairs starting at `offset`"""
+        events = []
+        starts = self._segments()
+        for start, end in zip(starts, starts[1:] + [None]):
+            if end is not None and offset >= end:
+                continue
+            # Offsets before the oldest segment were deleted once every consumer had read past them
+            offset = max(offset, start)
+            try:
+                f = open(self._segment_path(start), 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset - start)
+                while len(events) < limit:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        # End of the segment, or a line still being written
+                        break
+                    offset += len(line)
+                    events.append((offset, ChangeEvent.from_dict(json.loads(line))))
+            if len(events) == limit or offset != end:
+                break
+        return events
+    
+    def _offset_path(self, consumer):
+        return os.path.join(self.directory, 'offsets', consumer)
+    
+    def _consumers(self):
+        return sorted(name for name in os.listdir(os.path.join(self.directory, 'offsets')) if not name.endswith('.tmp'))
+    
+    def offset(self, consumer):
+        try:
+            with open(self._offset_path(consumer)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+    
+    def commit(self, consumer, offset):
+        path = self._offset_path(consumer)
+        with open(path + '.tmp', 'w') as f:
+            f.write(str(offset))
+        os.replace(path + '.tmp', path)
+        self.truncate()
+    
+    def truncate(self):
+        """Delete the segments every consumer has read past; returns the bytes freed"""
+        consumers = self._consumers()
+        if not consumers:
+            return 0
+        low = min(self.offset(consumer) for consumer in consumers)
+        starts = self._segments()
+        freed = 0
+        # The newest segment always stays, for the appends
+        for start, end in zip(starts, starts[1:]):
+            if end > low:
+                break
+            try:
+                path = self._segment_path(start)
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+    
+    def consume(self, consumer, handler, limit=1000):
+        """Feed a consumer's unread events to handler(event) and commit its offset; returns how many were handled"""
+        batch = self.read(self.offset(consumer), limit)
+        for _, change in batch:
+            handler(change)
+        if batch:
+            self.commit(consumer, batch[-1][0])
+        return len(batch)
+    
+    def lag(self):
+        """{consumer: bytes of log it has not read yet}"""
+        end = self.end()
+        start = self._segments()[:1] or [0]
+        return {consumer: end - max(self.offset(consumer), start[0]) for consumer in self._consumers()}
+
+
+def get_change_log():
+    """The app's durable change log, or None when CDC_LOG is off"""
+    app = current_app._get_current_object()
+    if not app.config.get('CDC_LOG', True):
+        return None
+    log = app.extensions.get('change_log')
+    if log is None:
+        directory = app.config.get('CDC_LOG_DIR') or os.path.join(app.instance_path, 'cdc')
+        segment_bytes = app.config.get('CDC_LOG_SEGMENT_MB', 64) * 2 ** 20
+        log = app.extensions.setdefault('change_log', ChangeLog(directory, segment_bytes))
+    return log
+
+
+def init_cdc(app):
+    """Publish committed changes to tracked models (listeners are process-wide, so attached once)"""
+    global _listening
+    if not app.config.get('CDC_ENABLED', True) or _listening:
+        return
+    event.listen(Session, 'after_flush', _collect)
+    event.listen(Session, 'after_commit', _committed)
+    event.listen(Session, 'after_rollback', _rolled_back)
+    _listening = True
@@ -0,0 +1,49 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Bodies smaller than this are sent as they are; compressing them costs more than it saves
+MIN_SIZE = 500
+# Types worth compressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = frozenset(('text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+                                'application/javascript', 'application/json', 'application/x-ndjson',
+                                'application/xml', 'image/svg+xml'))
+
+
+def compress_response(response, min_size=MIN_SIZE, gzip_level=6, brotli_quality=5):
+    """Compress a buffered 2xx body with brotli or gzip when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or not 200 <= response.status_code < 300 or
+            response.status_code == 204 or 'Content-Encoding' in response.headers or
+            response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data, quality=brotli_quality))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=gzip_level))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_compression(app):
+    """Compress dynamic responses of at least COMPRESSION_MIN_SIZE bytes (static files have prebuilt variants)"""
+    if not app.config.get('COMPRESSION', True):
+        return
+    min_size = app.config.get('COMPRESSION_MIN_SIZE', MIN_SIZE)
+    gzip_level = app.config.get('COMPRESSION_LEVEL', 6)
+    brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', 5)
+    
+    @app.after_request
+    def compress(response):
+        return compress_response(response, min_size, gzip_level, brotli_quality)
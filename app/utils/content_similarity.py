@@ -0,0 +1,452 @@
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from app import db
+
+TOKEN = re.compile(r"[a-z0-9][a-z0-9'-]*[a-z0-9]")
+STOPWORDS = frozenset('''
+    about above after again against all also among an and any are around as at be because been before being
+    between both but by can could did does doing down during each even every few for from further had has have
+    having her here hers him his how however into its itself just more most much must never new not now off
+    once only other our out over own same she should some such than that the their them then there these they
+    this those through too under until upon very was were what when where which while who whom why will with
+    within without would you your
+'''.split())
+# Term weights per field; author and genre become single tokens so "Jane Smith" only matches Jane Smith
+TITLE_WEIGHT = 2.0
+AUTHOR_WEIGHT = 3.0
+GENRE_WEIGHT = 2.0
+MIN_SCORE = 0.05
+CURRENT = 'CURRENT'
+
+
+def book_terms(title, author, genre, description):
+    """Weighted term frequencies for one book"""
+    terms = Counter()
+    for word in TOKEN.findall((title or '').lower()):
+        if word not in STOPWORDS:
+            terms[word] += TITLE_WEIGHT
+    for word in TOKEN.findall((description or '').lower()):
+        if word not in STOPWORDS:
+            terms[word] += 1.0
+    if author:
+        terms['author:' + ' '.join(author.lower().split())] += AUTHOR_WEIGHT
+    if genre:
+        terms['genre:' + ' '.join(genre.lower().split())] += GENRE_WEIGHT
+    return terms
+
+
+def _fields(book):
+    if isinstance(book, dict):
+        return book.get('title'), book.get('author'), book.get('genre'), book.get('description')
+    return book.title, book.author, book.genre, book.description
+
+
+def vectorize(terms, vocab, idf, max_terms):
+    """Sparse L2-normalised TF-IDF vector as (term ids, weights), keeping the `max_terms` heaviest"""
+    ids, weights = [], []
+    for term, tf in terms.items():
+        term_id = vocab.get(term)
+        if term_id is not None:
+            ids.append(term_id)
+            weights.append((1 + math.log(tf)) * idf[term_id])
+    ids = np.array(ids, dtype=np.int32)
+    weights = np.array(weights, dtype=np.float32)
+    if len(ids) > max_terms:
+        keep = np.argpartition(-weights, max_terms)[:max_terms]
+        ids, weights = ids[keep], weights[keep]
+    norm = np.sqrt(np.dot(weights, weights))
+    return ids, (weights / norm if norm else weights)
+
+
+def _gather(col_ptr, col_rows, col_data, term_ids, weights):
+    """Expand query terms into (query position, doc row, partial score) through the postings"""
+    starts = col_ptr[term_ids]
+    lengths = col_ptr[term_ids + 1] - starts
+    owner = np.repeat(np.arange(len(term_ids)), lengths)
+    positions = starts[owner] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owner, col_rows[positions], weights[owner] * col_data[positions]
+
+
+def _top_per_row(rows, others, scores, k, n, offset=0):
+    """Keep the k best-scoring others per row, as {row + offset: others} (ties by lower other).
+    
+    Row, quantised score and other are packed into one int64 so a single
+    plain sort orders by row then descending score; cosine scores are at
+    most 1, so the score gets whatever bits the two ids leave over.
+    """
+    if not len(rows):
+        return {}
+    id_bits = int(n).bit_length()
+    score_bits = 62 - 2 * id_bits
+    scale = (1 << score_bits) - 1
+    quantised = scale - np.minimum(scores * scale, scale).astype(np.int64)
+    packed = np.sort((rows.astype(np.int64) << (score_bits + id_bits)) | (quantised << id_bits) | others)
+    rows = packed >> (score_bits + id_bits)
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    packed = packed[rank < k]
+    neighbours = {}
+    for row, other in zip(((packed >> (score_bits + id_bits)) + offset).tolist(),
+                          (packed & ((1 << id_bits) - 1)).tolist()):
+        neighbours.setdefault(row, []).append(other)
+    return neighbours
+
+
+class ContentIndex:
+    """TF-IDF model plus term -> book postings, memory-mapped from the last build"""
+    
+    def __init__(self, path, version):
+        self.version = version
+        with open(os.path.join(path, 'vocab.json')) as f:
+            meta = json.load(f)
+        self.vocab = {term: i for i, term in enumerate(meta['terms'])}
+        self.max_terms = meta['max_terms']
+        self.idf = np.load(os.path.join(path, 'idf.npy'))
+        self.doc_ids = np.load(os.path.join(path, 'doc_ids.npy'), mmap_mode='r')
+        self.col_ptr = np.load(os.path.join(path, 'col_ptr.npy'), mmap_mode='r')
+        self.col_rows = np.load(os.path.join(path, 'col_rows.npy'), mmap_mode='r')
+        self.col_data = np.load(os.path.join(path, 'col_data.npy'), mmap_mode='r')
+    
+    def vector(self, book):
+        return vectorize(book_terms(*_fields(book)), self.vocab, self.idf, self.max_terms)
+    
+    def rank(self, vector, k, exclude=()):
+        """[(id, score)] of the k indexed books closest to a vector, best first, leaving out the ids in `exclude`"""
+        term_ids, weights = vector
+        if not len(term_ids):
+            return []
+        _, rows, scores = _gather(self.col_ptr, self.col_rows, self.col_data, term_ids, weights)
+        rows, inverse = np.unique(rows, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        ranked = []
+        for row in np.argsort(-totals, kind='stable'):
+            if totals[row] < MIN_SCORE or len(ranked) == k:
+                break
+            doc_id = self.doc_ids[rows[row]].item()
+            if doc_id not in exclude:
+                ranked.append((doc_id, float(totals[row])))
+        return ranked
+    
+    def similar_to(self, book, k):
+        """Ids of the k catalog books closest to `book` (which need not be indexed yet)"""
+        return [doc_id for doc_id, _ in self.rank(self.vector(book), k, exclude={_book_id(book)})]
+
+
+def _book_id(book):
+    return str(book['id']) if isinstance(book, dict) else book.id
+
+
+def _cosine(a, b):
+    """Similarity of two vectors from vectorize()"""
+    _, in_a, in_b = np.intersect1d(a[0], b[0], assume_unique=True, return_indices=True)
+    return float(np.dot(a[1][in_a], b[1][in_b]))
+
+
+_loaded = {}
+
+
+def load_index():
+    """The current index, reloaded only when a build has published a new version"""
+    root = current_app.config.get('CONTENT_INDEX_DIR') or os.path.join(current_app.instance_path, 'content_index')
+    try:
+        with open(os.path.join(root, CURRENT)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    index = _loaded.get(root)
+    if index is None or index.version != version:
+        index = ContentIndex(os.path.join(root, version), version)
+        _loaded[root] = index
+    return index
+
+
+def save_similar(rows):
+    """Store {book_id: [similar ids]} without touching the co-purchase lists"""
+    now = datetime.utcnow()
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import RecommendationRepository
+        rec_repo = RecommendationRepository()
+        with rec_repo.table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+            for book_id, similar in rows.items():
+                batch.put_item(Item={'id': rec_repo.SIMILAR_PREFIX + str(book_id), 'similar': similar,
+                                     'updated_at': now.isoformat()})
+    else:
+        from app.models import BookRecommendation
+        from app.utils.bulk import bulk_upsert
+        bulk_upsert(BookRecommendation, [
+            {'book_id': book_id, 'also_bought': [], 'similar': similar, 'updated_at': now}
+            for book_id, similar in rows.items()
+        ], ['book_id'], update_columns=['similar', 'updated_at'])
+        db.session.commit()
+
+
+def _stored_similar(book_id):
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import RecommendationRepository
+        return list(RecommendationRepository().get_for_book(book_id)[1])
+    from app.models import BookRecommendation
+    recommendation = db.session.get(BookRecommendation, book_id)
+    return list(recommendation.similar) if recommendation else []
+
+
+def _active_books(book_ids):
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import BookRepository
+        return [book for book in BookRepository().get_many(book_ids) if book.get('is_active', True)]
+    from app.models import Book
+    return Book.query.filter(Book.id.in_(book_ids), Book.is_active == True).all() if book_ids else []
+
+
+def refresh_similar(book):
+    """Rescore a book after its text changed, together with the neighbours' lists it enters or leaves.
+    
+    The index keeps the text from the last build, so the book's indexed
+    row is left out of every ranking and its new text is scored directly.
+    Besides its own list, the lists of the books it is now close to and
+    of those in its previous list (the ones most likely to name it) are
+    recomputed. Books further away catch up on the next build.
+    """
+    try:
+        index = load_index()
+        if index is None:
+            return False
+        k = current_app.config.get('RECOMMENDATIONS_TOP_K', 10)
+        book_id = _book_id(book)
+        vector = index.vector(book)
+        ranked = index.rank(vector, k, exclude={book_id})
+        rows = {book_id: [doc_id for doc_id, _ in ranked]}
+        neighbours = list(dict.fromkeys([doc_id for doc_id, _ in ranked] + _stored_similar(book_id)))
+        for other in _active_books(neighbours):
+            other_id = _book_id(other)
+            other_vector = index.vector(other)
+            other_ranked = index.rank(other_vector, k, exclude={other_id, book_id})
+            score = _cosine(other_vector, vector)
+            if score >= MIN_SCORE:
+                other_ranked.append((book_id, score))
+                # Ties go to the lower id, as in the build; rounding keeps float noise from breaking them
+                other_ranked.sort(key=lambda pair: (-round(pair[1], 6), pair[0]))
+            rows[other_id] = [doc_id for doc_id, _ in other_ranked[:k]]
+        save_similar(rows)
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f'Could not refresh similar titles for book {book}: {e}')
+        return False
+
+
+class _Spill:
+    """A 1-D array appended to a file a chunk at a time and read back memory-mapped"""
+    
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self._file = open(path, 'wb')
+    
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.size += len(values)
+    
+    def array(self):
+        self._file.close()
+        if not self.size:
+            return np.empty(0, self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.size,))
+    
+    def save_npy(self, path):
+        """Write the array as a .npy file without loading it"""
+        self._file.close()
+        with open(path, 'wb') as out, open(self.path, 'rb') as data:
+            np.lib.format.write_array_header_1_0(out, {'descr': np.lib.format.dtype_to_descr(self.dtype),
+                                                       'fortran_order': False, 'shape': (self.size,)})
+            shutil.copyfileobj(data, out, 1 << 20)
+        os.remove(self.path)
+
+
+class ContentSimilarityBuilder:
+    """Build TF-IDF vectors for the active catalog and store every book's top-K similar titles.
+    
+    Two streaming passes read the catalog in chunks: one for document
+    frequencies, one for sparse vectors capped at `max_terms` terms per
+    book, appended to scratch files a chunk at a time. The term postings
+    are then filled in straight into the memory-mapped index files, and
+    similarities are scored in chunks of books through them (a sparse
+    matrix product done with NumPy gathers and bincount), each chunk
+    capped at `pair_budget` partial scores. Only the vocabulary and one
+    chunk's arrays are ever held in memory, however large the catalog.
+    """
+    
+    def __init__(self, top_k=None, chunk_size=5000, pair_budget=2_000_000, min_df=2, max_df=0.05, max_terms=32):
+        self.top_k = top_k or current_app.config.get('RECOMMENDATIONS_TOP_K', 10)
+        self.chunk_size = chunk_size
+        self.pair_budget = pair_budget
+        self.min_df = min_df
+        self.max_df = max_df
+        self.max_terms = max_terms
+        self.use_aws = current_app.config.get('USE_AWS')
+    
+    def _iter_books(self):
+        if self.use_aws:
+            from boto3.dynamodb.conditions import Attr
+            from app.utils.dynamo_repo import BookRepository
+            for item in BookRepository().iter_all(
+                    ProjectionExpression='id, title, author, genre, description',
+                    FilterExpression=Attr('is_active').ne(False)):
+                yield item['id'], item
+        else:
+            from app.models import Book
+            query = db.session.query(Book.id, Book.title, Book.author, Book.genre, Book.description).filter(
+                Book.is_active == True).order_by(Book.id).execution_options(yield_per=self.chunk_size)
+            for row in query:
+                yield row.id, {'title': row.title, 'author': row.author, 'genre': row.genre,
+                               'description': row.description}
+    
+    def run(self):
+        started = time.perf_counter()
+        df = Counter()
+        books = 0
+        id_width = 1
+        for book_id, book in self._iter_books():
+            df.update(book_terms(*_fields(book)).keys())
+            books += 1
+            id_width = max(id_width, len(str(book_id)))
+        ceiling = max(self.min_df, int(self.max_df * books))
+        terms = sorted(term for term, count in df.items() if self.min_df <= count <= ceiling)
+        vocab = {term: i for i, term in enumerate(terms)}
+        idf = np.array([math.log((1 + books) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+        del df
+        
+        root = current_app.config.get('CONTENT_INDEX_DIR') or os.path.join(current_app.instance_path, 'content_index')
+        version = datetime.utcnow().strftime('v%Y%m%d%H%M%S%f')
+        path = os.path.join(root, version)
+        os.makedirs(path)
+        try:
+            stats = self._build(path, terms, vocab, idf, np.dtype(f'<U{id_width}') if self.use_aws else np.int64)
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        self._publish(root, version)
+        return dict(stats, terms=len(terms), seconds=round(time.perf_counter() - started, 2))
+    
+    def _build(self, path, terms, vocab, idf, id_dtype):
+        # Row-major vectors, spilled to scratch files one chunk of books at a time
+        doc_ids = _Spill(os.path.join(path, 'doc_ids.part'), id_dtype)
+        indptr = _Spill(os.path.join(path, 'indptr.part'), np.int64)
+        indices = _Spill(os.path.join(path, 'indices.part'), np.int32)
+        data = _Spill(os.path.join(path, 'data.part'), np.float32)
+        term_counts = np.zeros(len(terms), dtype=np.int64)
+        indptr.append([0])
+        nnz = 0
+        chunk_ids, chunk_lengths, chunk_terms, chunk_weights = [], [], [], []
+        
+        def flush():
+            if chunk_terms:
+                term_ids = np.concatenate(chunk_terms)
+                indices.append(term_ids)
+                data.append(np.concatenate(chunk_weights))
+                term_counts[:] += np.bincount(term_ids, minlength=len(terms))
+            doc_ids.append(chunk_ids)
+            indptr.append(nnz - sum(chunk_lengths) + np.cumsum(chunk_lengths, dtype=np.int64))
+            del chunk_ids[:], chunk_lengths[:], chunk_terms[:], chunk_weights[:]
+        for book_id, book in self._iter_books():
+            if self.use_aws and len(book_id) > id_dtype.itemsize // 4:
+                continue  # added since the first pass; the next build includes it
+            term_ids, weights = vectorize(book_terms(*_fields(book)), vocab, idf, self.max_terms)
+            nnz += len(term_ids)
+            chunk_ids.append(book_id)
+            chunk_lengths.append(len(term_ids))
+            chunk_terms.append(term_ids)
+            chunk_weights.append(weights)
+            if len(chunk_ids) >= self.chunk_size:
+                flush()
+        flush()
+        indptr, indices, data = indptr.array(), indices.array(), data.array()
+        
+        # Term-major copy of the matrix, the postings list of every term, filled chunk by chunk in row order
+        col_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(term_counts, out=col_ptr[1:])
+        col_rows = np.lib.format.open_memmap(os.path.join(path, 'col_rows.npy'), 'w+', np.int32, (nnz,))
+        col_data = np.lib.format.open_memmap(os.path.join(path, 'col_data.npy'), 'w+', np.float32, (nnz,))
+        filled = col_ptr[:-1].copy()
+        n = len(indptr) - 1
+        for r0 in range(0, n, self.chunk_size):
+            r1 = min(r0 + self.chunk_size, n)
+            start, end = indptr[r0], indptr[r1]
+            if start == end:
+                continue
+            order = np.argsort(indices[start:end], kind='stable')
+            term_ids = np.asarray(indices[start:end])[order]
+            rows = np.repeat(np.arange(r0, r1, dtype=np.int32), np.diff(indptr[r0:r1 + 1]))[order]
+            firsts = np.flatnonzero(np.r_[True, term_ids[1:] != term_ids[:-1]])
+            counts = np.diff(np.r_[firsts, len(term_ids)])
+            positions = filled[term_ids] + np.arange(len(term_ids)) - np.repeat(firsts, counts)
+            col_rows[positions] = rows
+            col_data[positions] = np.asarray(data[start:end])[order]
+            filled[term_ids[firsts]] += counts
+        col_rows.flush()
+        col_data.flush()
+        
+        doc_id_array = doc_ids.array()
+        stored = self._score(doc_id_array, indptr, indices, data, col_ptr, col_rows, col_data)
+        del doc_id_array, indptr, indices, data, col_rows, col_data
+        doc_ids.save_npy(os.path.join(path, 'doc_ids.npy'))
+        for name in ('indptr.part', 'indices.part', 'data.part'):
+            os.remove(os.path.join(path, name))
+        with open(os.path.join(path, 'vocab.json'), 'w') as f:
+            json.dump({'terms': terms, 'max_terms': self.max_terms}, f)
+        np.save(os.path.join(path, 'idf.npy'), idf)
+        np.save(os.path.join(path, 'col_ptr.npy'), col_ptr)
+        return {'books': n, 'stored': stored}
+    
+    def _score(self, doc_ids, indptr, indices, data, col_ptr, col_rows, col_data):
+        n = len(doc_ids)
+        posting_lengths = np.diff(col_ptr)
+        stored = 0
+        r0 = 0
+        while r0 < n:
+            # Partial scores a row will produce, accumulated over the next chunk of rows
+            window = min(r0 + self.chunk_size, n)
+            start = indptr[r0]
+            cost = np.r_[0, np.cumsum(posting_lengths[indices[start:indptr[window]]])][indptr[r0:window + 1] - start]
+            r1 = r0 + int(np.searchsorted(cost, self.pair_budget, side='right')) - 1
+            r1 = min(max(r1, r0 + 1), window)
+            start, end = indptr[r0], indptr[r1]
+            query_rows = np.repeat(np.arange(r0, r1), np.diff(indptr[r0:r1 + 1]))
+            owner, rows, scores = _gather(col_ptr, col_rows, col_data, np.asarray(indices[start:end]),
+                                          np.asarray(data[start:end]))
+            a = query_rows[owner]
+            keep = rows != a
+            keys, inverse = np.unique((a[keep] - r0).astype(np.int64) * n + rows[keep], return_inverse=True)
+            totals = np.bincount(inverse, weights=scores[keep])
+            good = totals >= MIN_SCORE
+            rows_out = {doc_ids[row].item(): doc_ids[others].tolist()
+                        for row, others in _top_per_row(keys[good] // n, keys[good] % n, totals[good],
+                                                        self.top_k, n, r0).items()}
+            # Books with nothing similar enough get an empty list, replacing any stale one
+            for row in range(r0, r1):
+                rows_out.setdefault(doc_ids[row].item(), [])
+            save_similar(rows_out)
+            stored += len(rows_out)
+            r0 = r1
+        return stored
+    
+    def _publish(self, root, version):
+        """Point CURRENT at a finished index version atomically"""
+        pointer = os.path.join(root, CURRENT + '.tmp')
+        with open(pointer, 'w') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(root, CURRENT))
+        # Keep the previous version for processes that still have it mapped
+        versions = sorted(name for name in os.listdir(root) if name.startswith('v'))
+        for old in versions[:-2]:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
@@ -0,0 +1,171 @@
+import time
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from app import db
+
+CHECKPOINT = 'co_purchase'
+# Candidate counts kept per book in DynamoDB, where there is no pair table to fold new orders into
+DYNAMO_CANDIDATES = 100
+
+
+def co_purchase_pairs(orders, books):
+    """Return (book, other) arrays with one entry per ordered pair of distinct books in the same order.
+    
+    `orders` and `books` are parallel integer arrays. After sorting by
+    order, every pair sits a fixed offset apart inside its order's run,
+    so comparing the arrays against themselves shifted by 1, 2, ...
+    finds them all without a Python loop over orders.
+    """
+    if not len(orders):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    orders, books = np.unique(np.stack([orders, books]).astype(np.int64), axis=1)
+    left, right = [], []
+    for offset in range(1, len(orders)):
+        same = orders[:-offset] == orders[offset:]
+        if not same.any():
+            break
+        left.append(books[:-offset][same])
+        right.append(books[offset:][same])
+    if not left:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    a, b = np.concatenate(left), np.concatenate(right)
+    return np.concatenate([a, b]), np.concatenate([b, a])
+
+
+def count_pairs(a, b):
+    """Collapse pair arrays to unique (book, other, count) arrays"""
+    keys, counts = np.unique((a << 32) | b, return_counts=True)
+    return keys >> 32, keys & 0xFFFFFFFF, counts
+
+
+def top_k(a, b, counts, k):
+    """Map each book to its k most co-purchased others (ties by lower id)"""
+    if not len(a):
+        return {}
+    order = np.lexsort((b, -counts, a))
+    a, b = a[order], b[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+    rank = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+    a, b = a[rank < k], b[rank < k]
+    bounds = np.flatnonzero(a[1:] != a[:-1]) + 1
+    return {int(group[0]): others.tolist() for group, others in zip(np.split(a, bounds), np.split(b, bounds))}
+
+
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class CoPurchaseRecommender:
+    """Build and maintain "customers also bought" lists from order history.
+    
+    A full build counts co-purchases over every non-cancelled order with
+    NumPy and stores the top K per book. Incremental runs fold only the
+    orders placed since the last checkpoint into the stored counts and
+    rewrite the lists of the books they touch.
+    """
+    
+    def __init__(self, top_k=None, batch_size=5000):
+        self.top_k = top_k or current_app.config.get('RECOMMENDATIONS_TOP_K', 10)
+        self.batch_size = batch_size
+    
+    def run(self, full=False):
+        started = time.perf_counter()
+        if current_app.config.get('USE_AWS'):
+            stats = self._run_dynamo(full)
+        else:
+            stats = self._run_sql(full)
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        return stats
+    
+    def _run_sql(self, full):
+        from app.models import Order, OrderItem, BookRecommendation, CoPurchaseCount, Checkpoint
+        from app.utils.bulk import bulk_upsert
+        since = 0 if full else int(Checkpoint.get(CHECKPOINT, 0))
+        last = db.session.query(db.func.max(OrderItem.id)).scalar() or 0
+        if last <= since and not full:
+            return {'orders': 0, 'pairs': 0, 'books': 0}
+        rows = db.session.query(OrderItem.order_id, OrderItem.book_id).join(Order).filter(
+            Order.status != 'cancelled', OrderItem.id > since, OrderItem.id <= last).all()
+        items = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        a, b, counts = count_pairs(*co_purchase_pairs(items[:, 0], items[:, 1]))
+        pair_rows = [{'book_id': x, 'other_book_id': y, 'count': n}
+                     for x, y, n in zip(a.tolist(), b.tolist(), counts.tolist())]
+        now = datetime.utcnow()
+        
+        if full:
+            CoPurchaseCount.query.delete(synchronize_session=False)
+            BookRecommendation.query.update({BookRecommendation.also_bought: []}, synchronize_session=False)
+            for batch in _batches(pair_rows, self.batch_size):
+                db.session.execute(CoPurchaseCount.__table__.insert(), batch)
+            neighbours = top_k(a, b, counts, self.top_k)
+        else:
+            for batch in _batches(pair_rows, self.batch_size):
+                bulk_upsert(CoPurchaseCount, batch, ['book_id', 'other_book_id'], increment_columns=['count'])
+            # Re-rank only the books whose counts moved, from their stored totals
+            neighbours = {}
+            for batch in _batches(np.unique(a).tolist(), 500):
+                stored = np.array(db.session.query(
+                    CoPurchaseCount.book_id, CoPurchaseCount.other_book_id, CoPurchaseCount.count
+                ).filter(CoPurchaseCount.book_id.in_(batch)).all(), dtype=np.int64).reshape(-1, 3)
+                neighbours.update(top_k(stored[:, 0], stored[:, 1], stored[:, 2], self.top_k))
+        
+        rec_rows = [{'book_id': book_id, 'also_bought': others, 'similar': [], 'updated_at': now}
+                    for book_id, others in neighbours.items()]
+        for batch in _batches(rec_rows, self.batch_size):
+            bulk_upsert(BookRecommendation, batch, ['book_id'], update_columns=['also_bought', 'updated_at'])
+        Checkpoint.set(CHECKPOINT, last)
+        db.session.commit()
+        return {'orders': len(np.unique(items[:, 0])), 'pairs': len(pair_rows), 'books': len(rec_rows)}
+    
+    def _run_dynamo(self, full):
+        from boto3.dynamodb.conditions import Attr
+        from app.utils.dynamo_repo import OrderRepository, RecommendationRepository
+        rec_repo = RecommendationRepository()
+        since = None if full else rec_repo.get_checkpoint(CHECKPOINT)
+        scan = {'ProjectionExpression': 'order_number, #status, #items',
+                'ExpressionAttributeNames': {'#status': 'status', '#items': 'items'}}
+        if since:
+            scan['FilterExpression'] = Attr('order_number').gt(since)
+        
+        # DynamoDB ids are strings: number them so the arrays stay integer
+        codes, ids, order_codes, book_codes = {}, [], [], []
+        last = since or ''
+        for position, order in enumerate(OrderRepository().iter_all(**scan)):
+            last = max(last, order.get('order_number', ''))
+            if order.get('status') == 'cancelled':
+                continue
+            for item in order.get('items', []):
+                book_id = str(item['book_id'])
+                if book_id not in codes:
+                    codes[book_id] = len(ids)
+                    ids.append(book_id)
+                order_codes.append(position)
+                book_codes.append(codes[book_id])
+        a, b, counts = count_pairs(*co_purchase_pairs(np.array(order_codes, dtype=np.int64),
+                                                      np.array(book_codes, dtype=np.int64)))
+        
+        candidates = {}
+        for x, y, n in zip(a.tolist(), b.tolist(), counts.tolist()):
+            candidates.setdefault(ids[x], {})[ids[y]] = n
+        if not full and candidates:
+            for existing in rec_repo.get_many(candidates):
+                merged = candidates[existing['id']]
+                for other, n in existing.get('co_counts', {}).items():
+                    merged[other] = merged.get(other, 0) + int(n)
+        
+        now = datetime.utcnow().isoformat()
+        with rec_repo.table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+            if full:
+                # Checkpoints and other jobs' items have '#' in their ids
+                for item in rec_repo.iter_all(ProjectionExpression='id'):
+                    if '#' not in item['id']:
+                        batch.delete_item(Key={'id': item['id']})
+            for book_id, others in candidates.items():
+                ranked = sorted(others.items(), key=lambda pair: (-pair[1], pair[0]))[:DYNAMO_CANDIDATES]
+                batch.put_item(Item={'id': book_id, 'also_bought': [other for other, _ in ranked[:self.top_k]],
+                                     'co_counts': dict(ranked), 'updated_at': now})
+        if last:
+            rec_repo.set_checkpoint(CHECKPOINT, last)
+        return {'orders': len(set(order_codes)), 'pairs': len(a), 'books': len(candidates)}
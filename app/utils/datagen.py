@@ -0,0 +1,301 @@
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from itertools import accumulate
+from flask import current_app
+from werkzeug.security import generate_password_hash
+from app import db
+
+_ADJECTIVES = ['Silent', 'Crimson', 'Hidden', 'Last', 'Golden', 'Broken', 'Endless', 'Forgotten', 'Quiet',
+               'Distant', 'Burning', 'Lost', 'Secret', 'Wild', 'Little', 'Dark', 'Bright', 'Hollow']
+_NOUNS = ['River', 'Garden', 'Empire', 'Machine', 'Kingdom', 'Ocean', 'Library', 'Mountain', 'City',
+          'Signal', 'Harvest', 'Orchard', 'Winter', 'Lantern', 'Compass', 'Archive', 'Forest', 'Voyage']
+_FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farah', 'Gus', 'Hana', 'Ivan', 'Jade', 'Kofi',
+                'Lena', 'Mateo', 'Nia', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq', 'Uma', 'Yuki']
+_LAST_NAMES = ['Abbott', 'Banerjee', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Hughes',
+               'Ito', 'Johansson', 'Kim', 'Larsen', 'Mensah', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Singh']
+_GENRES = ['Literary', 'Mystery', 'Thriller', 'Romance', 'Fantasy', 'Sci-Fi', 'History', 'Biography',
+           'Business', 'Self-Help', 'Science', 'Poetry', 'Travel', 'Cooking']
+_STATUSES = ['delivered'] * 70 + ['shipped'] * 12 + ['confirmed'] * 10 + ['pending'] * 5 + ['cancelled'] * 3
+_PAYMENT_METHODS = ['cod', 'card', 'card', 'upi']
+
+
+class ZipfSampler:
+    """Draw indices 0..n-1 with P(rank k) ~ 1 / k**s, ranks shuffled by the caller's rng"""
+    
+    def __init__(self, n, s, rng):
+        ranks = list(range(n))
+        rng.shuffle(ranks)
+        weights = [0.0] * n
+        for rank, index in enumerate(ranks, start=1):
+            weights[index] = 1.0 / rank ** s
+        self.cum_weights = list(accumulate(weights))
+        self.total = self.cum_weights[-1]
+        self.n = n
+    
+    def sample(self, rng):
+        return min(bisect_left(self.cum_weights, rng.random() * self.total), self.n - 1)
+
+
+def _geometric(rng, p, cap):
+    """1 + number of failures before a success, capped; models cart/order sizes"""
+    k = 1
+    while k < cap and rng.random() > p:
+        k += 1
+    return k
+
+
+class _SqlWriter:
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        if db.session.get_bind().dialect.name == 'sqlite':
+            # Bulk load: trade durability for speed for the duration of the run
+            db.session.execute(db.text('PRAGMA synchronous=OFF'))
+            db.session.execute(db.text('PRAGMA journal_mode=MEMORY'))
+    
+    def next_id(self, model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    
+    def write(self, model, rows):
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+            db.session.commit()
+
+
+class _DynamoWriter:
+    def __init__(self, batch_size):
+        from app.utils.dynamo_repo import (UserRepository, BookRepository, OrderRepository,
+                                           CategoryRepository, CartRepository)
+        self.batch_size = batch_size
+        self.repos = {
+            'User': UserRepository(), 'Book': BookRepository(), 'Order': OrderRepository(),
+            'Category': CategoryRepository(), 'Cart': CartRepository()
+        }
+    
+    def next_id(self, model):
+        """One past the largest numeric id in the model's table, so a second run adds items instead of replacing them.
+        
+        Ids written by the app itself are uuids and are skipped; order
+        and cart lines live inside their parent item and need no ids.
+        """
+        repo = self.repos.get(model.__name__)
+        if repo is None:
+            return 1
+        ids = (item['id'] for item in repo.iter_all(ProjectionExpression='id'))
+        return max((int(item_id) for item_id in ids if item_id.isdigit()), default=0) + 1
+    
+    def write(self, model, rows):
+        repo = self.repos[model.__name__]
+        with repo.table.batch_writer() as batch:
+            for row in rows:
+                batch.put_item(Item=repo.stamp(row))
+
+
+class DatasetGenerator:
+    """Deterministic, production-shaped synthetic data for local benchmarks.
+    
+    Book popularity and customer activity follow Zipf distributions, a
+    few sellers own most of the catalog, and order/cart sizes are
+    geometric. The same seed and volumes always produce the same rows.
+    Rows are written with executemany inserts (SQL) or batch_writer
+    (DynamoDB) in `batch_size` batches.
+    """
+    
+    def __init__(self, seed=42, books=10000, users=2000, orders=20000, seller_ratio=0.02, cart_ratio=0.3,
+                 days=365, batch_size=5000, log=print):
+        self.rng = random.Random(seed)
+        self.books = books
+        self.users = users
+        self.orders = orders
+        self.sellers = max(1, int(users * seller_ratio))
+        self.customers = max(1, users - self.sellers)
+        self.cart_ratio = cart_ratio
+        self.days = days
+        self.batch_size = batch_size
+        self.log = log
+        self.use_aws = current_app.config.get('USE_AWS')
+        self.writer = _DynamoWriter(batch_size) if self.use_aws else _SqlWriter(batch_size)
+        self.end = datetime(2026, 1, 1)
+        self.start = self.end - timedelta(days=days)
+    
+    def _id(self, value):
+        return str(value) if self.use_aws else value
+    
+    def _ts(self, value):
+        return value.isoformat() if self.use_aws else value
+    
+    def _money(self, value):
+        return str(value) if self.use_aws else value
+    
+    def _batched(self, model, label, total, make_row):
+        started = time.perf_counter()
+        rows = []
+        for i in range(total):
+            rows.append(make_row(i))
+            if len(rows) >= self.batch_size:
+                self.writer.write(model, rows)
+                rows = []
+        self.writer.write(model, rows)
+        elapsed = time.perf_counter() - started
+        self.log(f'{label}: {total} rows in {elapsed:.1f}s')
+    
+    def run(self):
+        from app.models import User, Book, Category, Order, OrderItem, Cart, CartItem
+        rng = self.rng
+        password = generate_password_hash('password123')
+        
+        if self.use_aws:
+            from app.utils.dynamo_repo import CategoryRepository
+            category_ids = [c['id'] for c in CategoryRepository().get_all()] or [None]
+        else:
+            category_ids = [c for (c,) in db.session.query(Category.id).order_by(Category.id)] or [None]
+        category_sampler = ZipfSampler(len(category_ids), 1.0, rng)
+        
+        first_user = self.writer.next_id(User)
+        seller_ids = [first_user + i for i in range(self.sellers)]
+        customer_ids = [first_user + self.sellers + i for i in range(self.customers)]
+        
+        def make_user(i):
+            is_seller = i < self.sellers
+            row = {
+                'id': self._id(first_user + i),
+                'username': f'{"seller" if is_seller else "user"}{first_user + i}',
+                'email': f'{"seller" if is_seller else "user"}{first_user + i}@example.com',
+                'password': password,
+                'role': 'seller' if is_seller else 'customer',
+                'is_active': True,
+                'is_approved': True,
+                'created_at': self._ts(self.start + timedelta(seconds=rng.randrange(self.days * 86400))),
+            }
+            row['updated_at'] = row['created_at']
+            return row
+        self._batched(User, 'users', self.sellers + self.customers, make_user)
+        
+        # Heavy sellers: a handful own most of the catalog
+        seller_sampler = ZipfSampler(len(seller_ids), 1.2, rng)
+        first_book = self.writer.next_id(Book)
+        prices = []
+        
+        def make_book(i):
+            price = round(round(max(2.99, min(149.99, rng.lognormvariate(2.7, 0.45)))) - 0.01, 2)
+            prices.append(price)
+            title = f'The {rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)}'
+            if rng.random() < 0.4:
+                title += f' of {rng.choice(_NOUNS)}s'
+            row = {
+                'id': self._id(first_book + i),
+                'title': f'{title} {first_book + i}',
+                'author': f'{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}',
+                'genre': rng.choice(_GENRES),
+                'isbn': f'979{first_book + i:010d}',
+                'price': self._money(price),
+                'stock_quantity': 0 if rng.random() < 0.05 else rng.randint(1, 200),
+                'description': f'A {rng.choice(_GENRES).lower()} story about a {rng.choice(_ADJECTIVES).lower()} '
+                               f'{rng.choice(_NOUNS).lower()}.',
+                'is_active': rng.random() > 0.02,
+                'category_id': self._id(category_ids[category_sampler.sample(rng)]),
+                'seller_id': self._id(seller_ids[seller_sampler.sample(rng)]),
+                'created_at': self._ts(self.start + timedelta(seconds=rng.randrange(self.days * 86400))),
+            }
+            row['updated_at'] = row['created_at']
+            return row
+        self._batched(Book, 'books', self.books, make_book)
+        
+        # Bestsellers: book popularity is Zipfian; so is how often customers buy
+        book_sampler = ZipfSampler(self.books, 1.07, rng)
+        buyer_sampler = ZipfSampler(len(customer_ids), 0.8, rng)
+        self._write_orders(Order, OrderItem, first_book, prices, customer_ids, book_sampler, buyer_sampler)
+        self._write_carts(Cart, CartItem, first_book, prices, customer_ids, book_sampler)
+    
+    def _write_orders(self, Order, OrderItem, first_book, prices, customer_ids, book_sampler, buyer_sampler):
+        rng = self.rng
+        started = time.perf_counter()
+        first_order = self.writer.next_id(Order)
+        first_item = self.writer.next_id(OrderItem)
+        span = self.days * 86400 / max(1, self.orders)
+        orders, items = [], []
+        item_id = first_item
+        for i in range(self.orders):
+            # Orders arrive in time order so order numbers and ids sort together
+            created = self.start + timedelta(seconds=i * span + rng.random() * span)
+            lines = {}
+            for _ in range(_geometric(rng, 0.55, 10)):
+                book = book_sampler.sample(rng)
+                lines[book] = lines.get(book, 0) + (1 if rng.random() < 0.85 else rng.randint(2, 3))
+            order_id = first_order + i
+            total = round(sum(prices[book] * quantity for book, quantity in lines.items()), 2)
+            order = {
+                'id': self._id(order_id),
+                'order_number': f'ORD-{created:%Y%m%d%H%M%S}{created.microsecond // 1000:03d}-SYN{order_id:08d}',
+                'user_id': self._id(customer_ids[buyer_sampler.sample(rng)]),
+                'total_price': self._money(total),
+                'status': rng.choice(_STATUSES),
+                'payment_method': rng.choice(_PAYMENT_METHODS),
+                'shipping_address': f'{rng.randint(1, 999)} {rng.choice(_NOUNS)} Street',
+                'created_at': self._ts(created),
+            }
+            line_rows = [{'book_id': self._id(first_book + book), 'quantity': quantity,
+                          'price': self._money(prices[book])} for book, quantity in lines.items()]
+            if self.use_aws:
+                order['items'] = line_rows
+            else:
+                order['order_date'] = created
+                order['updated_at'] = created
+                for line in line_rows:
+                    line.update(id=item_id, order_id=order_id)
+                    item_id += 1
+                items.extend(line_rows)
+            orders.append(order)
+            if len(orders) >= self.batch_size:
+                self.writer.write(Order, orders)
+                if items:
+                    self.writer.write(OrderItem, items)
+                orders, items = [], []
+        self.writer.write(Order, orders)
+        if items:
+            self.writer.write(OrderItem, items)
+        self.log(f'orders: {self.orders} orders, {item_id - first_item} items in '
+                 f'{time.perf_counter() - started:.1f}s')
+    
+    def _write_carts(self, Cart, CartItem, first_book, prices, customer_ids, book_sampler):
+        rng = self.rng
+        started = time.perf_counter()
+        first_cart = self.writer.next_id(Cart)
+        item_id = self.writer.next_id(CartItem)
+        carts, items = [], []
+        count = 0
+        for user_id in customer_ids:
+            if rng.random() >= self.cart_ratio:
+                continue
+            lines = {}
+            for _ in range(_geometric(rng, 0.45, 15)):
+                book = book_sampler.sample(rng)
+                lines[book] = lines.get(book, 0) + 1
+            if self.use_aws:
+                # DynamoDB carts keep no subtotal (see CartRepository)
+                carts.append({
+                    'id': str(user_id),
+                    'items': [{'book_id': str(first_book + book), 'quantity': quantity}
+                              for book, quantity in lines.items()],
+                    'item_count': sum(lines.values()),
+                })
+            else:
+                subtotal = round(sum(prices[book] * quantity for book, quantity in lines.items()), 2)
+                cart_id = first_cart + count
+                carts.append({'id': cart_id, 'user_id': user_id, 'item_count': sum(lines.values()),
+                              'subtotal': subtotal, 'created_at': self.end, 'updated_at': self.end})
+                for book, quantity in lines.items():
+                    items.append({'id': item_id, 'cart_id': cart_id, 'book_id': first_book + book,
+                                  'quantity': quantity, 'added_at': self.end})
+                    item_id += 1
+            count += 1
+            if len(carts) >= self.batch_size:
+                self.writer.write(Cart, carts)
+                if items:
+                    self.writer.write(CartItem, items)
+                carts, items = [], []
+        self.writer.write(Cart, carts)
+        if items:
+            self.writer.write(CartItem, items)
+        self.log(f'carts: {count} carts in {time.perf_counter() - started:.1f}s')
@@ -1,10 +1,17 @@
 from flask import current_app
 from .aws_services import get_dynamodb_resource
-from boto3.dynamodb.conditions import Key, Attr
+from .cdc import publish_item_change
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
+
+# boto3 is imported inside the methods that need it, so SQL-mode processes never load it
 
 class DynamoRepository:
+    # Entity name of the change events save/delete publish (None: not tracked)
+    ENTITY = None
+    # Attribute holding the day of updated_at, which partitions the table's updated-since index (None: no index)
+    UPDATED_DAY = None
+    
     def __init__(self, table_name):
         self.table_name = table_name
         self.resource = None
@@ -18,70 +25,216 @@ class DynamoRepository:
         return self._table
 
     def get_all(self):
-        response = self.table.scan()
-        return response.get('Items', [])
+        return list(self.iter_all())
+    
+    def iter_all(self, **scan_kwargs):
+        """Yield every item, following LastEvaluatedKey across scan pages"""
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     def get_by_id(self, item_id):
         response = self.table.get_item(Key={'id': str(item_id)})
         return response.get('Item')
 
+    def get_many(self, item_ids):
+        """Fetch several items by id using BatchGetItem (100 keys per call)"""
+        keys = [{'id': str(item_id)} for item_id in dict.fromkeys(item_ids)]
+        items = []
+        for start in range(0, len(keys), 100):
+            request_items = {self.table_name: {'Keys': keys[start:start + 100]}}
+            while request_items:
+                response = self.table.meta.client.batch_get_item(RequestItems=request_items)
+                items.extend(response.get('Responses', {}).get(self.table_name, []))
+                request_items = response.get('UnprocessedKeys')
+        return items
+    
     def save(self, item_data):
+        inserted = 'id' not in item_data or 'created_at' not in item_data
         if 'id' not in item_data:
             item_data['id'] = str(uuid.uuid4())
         if 'created_at' not in item_data:
             item_data['created_at'] = datetime.utcnow().isoformat()
         item_data['updated_at'] = datetime.utcnow().isoformat()
+        self.stamp(item_data)
         
         self.table.put_item(Item=item_data)
+        if self.ENTITY:
+            publish_item_change(self.ENTITY, 'insert' if inserted else 'update', item_data['id'], item_data)
         return item_data
 
+    def stamp(self, item_data):
+        """Set the attributes derived from updated_at; for writers that put items without save()"""
+        if self.UPDATED_DAY and item_data.get('updated_at'):
+            item_data[self.UPDATED_DAY] = str(item_data['updated_at'])[:10]
+        return item_data
+    
     def delete(self, item_id):
         self.table.delete_item(Key={'id': str(item_id)})
+        if self.ENTITY:
+            publish_item_change(self.ENTITY, 'delete', item_id)
         return True
 
 class UserRepository(DynamoRepository):
+    ENTITY = 'user'
+    
     def __init__(self):
         table_name = current_app.config.get('DYNAMODB_USERS_TABLE', 'Users')
         super().__init__(table_name)
 
     def get_by_email(self, email):
+        from boto3.dynamodb.conditions import Attr
         response = self.table.scan(FilterExpression=Attr('email').eq(email))
         items = response.get('Items', [])
         return items[0] if items else None
 
     def get_by_username(self, username):
+        from boto3.dynamodb.conditions import Attr
         response = self.table.scan(FilterExpression=Attr('username').eq(username))
         items = response.get('Items', [])
         return items[0] if items else None
 
 class BookRepository(DynamoRepository):
+    ENTITY = 'book'
+    UPDATED_DAY = 'updated_day'
+    UPDATED_INDEX = 'updated_day-updated_at-index'
+    # Catch-ups reaching further back than this reload the catalog rather than query day by day
+    MAX_UPDATED_DAYS = 7
+    
     def __init__(self):
         table_name = current_app.config.get('DYNAMODB_BOOKS_TABLE', 'Books')
         super().__init__(table_name)
 
     def get_by_category(self, category_id):
+        from boto3.dynamodb.conditions import Attr
         response = self.table.scan(FilterExpression=Attr('category_id').eq(str(category_id)))
         return response.get('Items', [])
 
     def get_by_seller(self, seller_id):
+        from boto3.dynamodb.conditions import Attr
         response = self.table.scan(FilterExpression=Attr('seller_id').eq(str(seller_id)))
         return response.get('Items', [])
 
+    def get_some_by_category(self, category_id, exclude_id=None, limit=4, scan_limit=500):
+        """Up to `limit` active books in a category from one bounded scan page"""
+        from boto3.dynamodb.conditions import Attr
+        condition = Attr('category_id').eq(str(category_id)) & Attr('is_active').ne(False)
+        if exclude_id is not None:
+            condition = condition & Attr('id').ne(str(exclude_id))
+        response = self.table.scan(FilterExpression=condition, Limit=scan_limit)
+        return response.get('Items', [])[:limit]
+    
+    def get_isbn_index(self):
+        """Map isbn -> {id, seller_id, created_at} using a projected scan"""
+        index = {}
+        for item in self.iter_all(ProjectionExpression='id, isbn, seller_id, created_at'):
+            if item.get('isbn'):
+                index[item['isbn']] = item
+        return index
+    
+    def iter_updated_since(self, since):
+        """Books whose updated_at is after `since` (ISO format), or None if that reaches back over MAX_UPDATED_DAYS
+        
+        Queries the (updated_day, updated_at) index one day at a time, so
+        only changed books are read; tables created before the index
+        existed fall back to a filtered scan.
+        """
+        from boto3.dynamodb.conditions import Attr, Key
+        from botocore.exceptions import ClientError
+        day = date.fromisoformat(since[:10])
+        today = datetime.utcnow().date()
+        if (today - day).days > self.MAX_UPDATED_DAYS:
+            return None
+        items = []
+        try:
+            while day <= today:
+                params = {
+                    'IndexName': self.UPDATED_INDEX,
+                    'KeyConditionExpression': Key(self.UPDATED_DAY).eq(day.isoformat()) & Key('updated_at').gt(since)
+                }
+                while True:
+                    response = self.table.query(**params)
+                    items.extend(response.get('Items', []))
+                    if 'LastEvaluatedKey' not in response:
+                        break
+                    params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+                day += timedelta(days=1)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+            return list(self.iter_all(FilterExpression=Attr('updated_at').gt(since)))
+        return items
+    
+    def adjust_stock(self, book_id, delta, sold=0):
+        """Atomically add `delta` to stock, refusing to go below zero; `sold` is added to units_sold in the same write"""
+        from boto3.dynamodb.conditions import Attr
+        from botocore.exceptions import ClientError
+        # updated_at moves too, so catalog snapshots pick stock changes up in their delta queries
+        now = datetime.utcnow().isoformat()
+        update = 'SET stock_quantity = stock_quantity + :delta, updated_at = :now, updated_day = :day'
+        values = {':delta': delta, ':now': now, ':day': now[:10]}
+        if sold:
+            update += ' ADD units_sold :sold'
+            values[':sold'] = sold
+        try:
+            response = self.table.update_item(
+                Key={'id': str(book_id)},
+                UpdateExpression=update,
+                ConditionExpression=Attr('stock_quantity').gte(-delta),
+                ExpressionAttributeValues=values,
+                ReturnValues='UPDATED_NEW'
+            )
+            changed = ['stock_quantity', 'updated_at'] + (['units_sold'] if sold else [])
+            publish_item_change(self.ENTITY, 'update', book_id, response.get('Attributes'), changed)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
 class OrderRepository(DynamoRepository):
+    ENTITY = 'order'
+    
     def __init__(self):
         table_name = current_app.config.get('DYNAMODB_ORDERS_TABLE', 'Orders')
         super().__init__(table_name)
 
-    def get_by_user(self, user_id):
+    USER_INDEX = 'user_id-order_number-index'
+    
+    def get_by_user(self, user_id, limit=None):
+        """A user's orders, newest first, via the (user_id, order_number) index"""
+        from boto3.dynamodb.conditions import Key, Attr
+        from botocore.exceptions import ClientError
+        params = {
+            'IndexName': self.USER_INDEX,
+            'KeyConditionExpression': Key('user_id').eq(str(user_id)),
+            'ScanIndexForward': False
+        }
+        if limit:
+            params['Limit'] = limit
+        try:
+            return self.table.query(**params).get('Items', [])
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+        # Tables created before the index existed: scan and sort on the id
         response = self.table.scan(FilterExpression=Attr('user_id').eq(str(user_id)))
-        return response.get('Items', [])
+        items = sorted(response.get('Items', []), key=lambda x: x.get('order_number', ''), reverse=True)
+        return items[:limit] if limit else items
 
 class CategoryRepository(DynamoRepository):
+    ENTITY = 'category'
+    
     def __init__(self):
         table_name = current_app.config.get('DYNAMODB_CATEGORIES_TABLE', 'Categories')
         super().__init__(table_name)
 
 class CartRepository(DynamoRepository):
+    ENTITY = 'cart'
+    
     def __init__(self):
         # We'll use a Cart table or just store cart in Users. 
         # For this project, let's use a separate Carts table for clean replication.
@@ -91,3 +244,84 @@ class CartRepository(DynamoRepository):
     def get_by_user(self, user_id):
         response = self.table.get_item(Key={'id': str(user_id)})
         return response.get('Item')
+    
+    # Unlike SQL carts, no subtotal is stored: nothing finds the carts holding a repriced book without a
+    # scan, so the cart and checkout pages price the lines from the books they load anyway
+    STALE = ('subtotal',)
+    
+    @staticmethod
+    def summarize(items):
+        """Recompute item_count from the cart lines"""
+        return sum(int(item.get('quantity', 0)) for item in items)
+    
+    def save_cart(self, cart_data):
+        """Save a cart with its item_count refreshed in the same put"""
+        items = cart_data.get('items', [])
+        for attribute in self.STALE:
+            cart_data.pop(attribute, None)
+        for item in items:
+            item.pop('price', None)
+        cart_data['item_count'] = self.summarize(items)
+        return self.save(cart_data)
+    
+    def check_consistency(self, cart_data):
+        """Return True when the stored item_count matches the cart lines and no stale prices are kept"""
+        return (int(cart_data.get('item_count', 0)) == self.summarize(cart_data.get('items', [])) and
+                not any(attribute in cart_data for attribute in self.STALE) and
+                not any('price' in item for item in cart_data.get('items', [])))
+
+class RecommendationRepository(DynamoRepository):
+    """Precomputed per-book recommendation lists, plus the jobs' checkpoints"""
+    CHECKPOINT_PREFIX = '#checkpoint:'
+    # Content-similarity lists live beside the co-purchase item so each job can rewrite its own
+    SIMILAR_PREFIX = 'similar#'
+    
+    def __init__(self):
+        table_name = current_app.config.get('DYNAMODB_RECOMMENDATIONS_TABLE', 'Recommendations')
+        super().__init__(table_name)
+    
+    def get_for_book(self, book_id):
+        """(also_bought, similar) id lists for a book, fetched in one BatchGetItem"""
+        items = {item['id']: item for item in self.get_many([str(book_id), self.SIMILAR_PREFIX + str(book_id)])}
+        also_bought = items.get(str(book_id), {}).get('also_bought', [])
+        similar = items.get(self.SIMILAR_PREFIX + str(book_id), {}).get('similar', [])
+        return also_bought, similar
+    
+    def get_checkpoint(self, name, default=None):
+        item = self.get_by_id(self.CHECKPOINT_PREFIX + name)
+        return item['position'] if item else default
+    
+    def set_checkpoint(self, name, position):
+        self.table.put_item(Item={'id': self.CHECKPOINT_PREFIX + name, 'position': str(position),
+                                  'updated_at': datetime.utcnow().isoformat()})
+
+class SalesRepository(DynamoRepository):
+    """Copies sold per (day, book), so trailing-window bestsellers read a bounded set of days"""
+    # Buckets are dropped by DynamoDB's TTL once no window can need them
+    RETENTION_DAYS = 31
+    EPOCH = date(1970, 1, 1)
+    
+    def __init__(self):
+        table_name = current_app.config.get('DYNAMODB_SALES_TABLE', 'BookSales')
+        super().__init__(table_name)
+    
+    def record(self, day, book_id, category_id, quantity):
+        """Add `quantity` (negative to take a sale back) to the book's bucket for `day` (a date)"""
+        expires = ((day - self.EPOCH).days + self.RETENTION_DAYS) * 86400
+        self.table.update_item(
+            Key={'day': day.isoformat(), 'book_id': str(book_id)},
+            UpdateExpression='ADD quantity :quantity SET category_id = :category, expires_at = :expires',
+            ExpressionAttributeValues={':quantity': quantity, ':category': str(category_id or ''),
+                                       ':expires': expires}
+        )
+    
+    def get_day(self, day):
+        """Every bucket of one day, following LastEvaluatedKey"""
+        from boto3.dynamodb.conditions import Key
+        params = {'KeyConditionExpression': Key('day').eq(day.isoformat())}
+        while True:
+            response = self.table.query(**params)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
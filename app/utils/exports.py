@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from flask import Response, current_app, stream_with_context
+from app import db
+
+# Columns of each export, in order; passwords never leave the database
+ORDER_FIELDS = ('id', 'order_number', 'order_date', 'user_id', 'customer', 'status', 'total_price', 'payment_method',
+                'shipping_address')
+USER_FIELDS = ('id', 'username', 'email', 'role', 'is_active', 'is_approved', 'phone', 'address', 'created_at')
+# Rows fetched per database round trip, and bytes gathered before a chunk is sent
+BATCH_ROWS = 1000
+CHUNK_BYTES = 64 * 1024
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+# Leading characters that make spreadsheets read a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def iter_orders(status=None):
+    """Every order as a dict of ORDER_FIELDS, newest first in SQL mode (scan order in AWS mode)"""
+    if current_app.config.get('USE_AWS'):
+        yield from _iter_dynamo_orders(status)
+        return
+    from app.models import Order, User
+    query = (db.select(Order.id, Order.order_number, Order.order_date, Order.user_id,
+                       User.username.label('customer'), Order.status, Order.total_price, Order.payment_method,
+                       Order.shipping_address)
+             .join(User, User.id == Order.user_id)
+             .order_by(Order.order_number.desc()))
+    if status:
+        query = query.where(Order.status == status)
+    yield from _stream_rows(query)
+
+
+def _iter_dynamo_orders(status):
+    from boto3.dynamodb.conditions import Attr
+    from app.utils.dynamo_repo import OrderRepository, UserRepository
+    scan = {'FilterExpression': Attr('status').eq(status)} if status else {}
+    items = OrderRepository().iter_all(**scan)
+    while True:
+        batch = list(islice(items, 100))
+        if not batch:
+            return
+        # One BatchGetItem per 100 orders for the customer names
+        users = {user['id']: user.get('username') for user in
+                 UserRepository().get_many({item.get('user_id') for item in batch if item.get('user_id')})}
+        for item in batch:
+            row = {field: _plain(item.get(field)) for field in ORDER_FIELDS}
+            row['order_date'] = row['order_date'] or item.get('created_at')
+            row['customer'] = users.get(item.get('user_id'))
+            yield row
+
+
+def iter_users(role=None, search=None):
+    """Every user as a dict of USER_FIELDS, newest first in SQL mode (scan order in AWS mode)"""
+    if current_app.config.get('USE_AWS'):
+        from boto3.dynamodb.conditions import Attr
+        from app.utils.dynamo_repo import UserRepository
+        scan = {'FilterExpression': Attr('role').eq(role)} if role else {}
+        text = (search or '').lower()
+        for item in UserRepository().iter_all(**scan):
+            if text and text not in item.get('username', '').lower() and text not in item.get('email', '').lower():
+                continue
+            yield {field: _plain(item.get(field)) for field in USER_FIELDS}
+        return
+    from app.models import User
+    query = db.select(*(getattr(User, field) for field in USER_FIELDS)).order_by(User.created_at.desc())
+    if role:
+        query = query.where(User.role == role)
+    if search:
+        query = query.where(db.or_(User.username.ilike(f'%{search}%'), User.email.ilike(f'%{search}%')))
+    yield from _stream_rows(query)
+
+
+def _stream_rows(query):
+    """Column rows of a select as dicts, BATCH_ROWS at a time through a server-side cursor where the driver has one"""
+    result = db.session.execute(query.execution_options(yield_per=BATCH_ROWS))
+    try:
+        for row in result:
+            yield {key: _plain(value) for key, value in row._mapping.items()}
+    finally:
+        result.close()
+
+
+def _chunked(pieces):
+    """Join small strings into CHUNK_BYTES-ish chunks so each write to the client carries many rows"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_cell(value):
+    """Text a spreadsheet would run as a formula (user-supplied names, addresses), quoted with a leading '"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows, fields):
+    """A header line, then one CSV line per row, with formula-like text escaped"""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fields, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({key: _csv_cell(value) for key, value in row.items()})
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+def export_response(rows, fields, name, fmt):
+    """A streamed download of `rows`; nothing is read from the database until the client starts receiving"""
+    lines = csv_lines(rows, fields) if fmt == 'csv' else ndjson_lines(rows)
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    return Response(stream_with_context(_chunked(lines)), mimetype=FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{name}-{stamp}.{fmt}"',
+        # Tell proxies such as nginx to pass chunks through rather than buffer the whole export
+        'X-Accel-Buffering': 'no',
+    })
+
+
+class StreamedListing:
+    """Stands in for a Pagination when a listing template streams every row instead of one page"""
+    
+    def __init__(self, items):
+        self.items = items
+
+
+def stream_listing(template_name, **context):
+    """Render a template as it is iterated, so the first rows reach the browser before the last are read"""
+    app = current_app._get_current_object()
+    # Anything that writes the session (the CSRF token) must happen before the headers go out
+    if 'csrf_token' in app.jinja_env.globals:
+        app.jinja_env.globals['csrf_token']()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(256)
+    return Response(stream_with_context(stream), mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
@@ -0,0 +1,76 @@
+import os
+from flask import g
+from jinja2 import FileSystemBytecodeCache, Undefined, nodes
+from jinja2.ext import Extension
+from app.utils.invalidation import LocalCache
+
+# Stands in for the per-session CSRF token inside cached markup; swapped for the real one on every render
+CSRF_PLACEHOLDER = '\x00csrf-token\x00'
+
+
+class FragmentCacheExtension(Extension):
+    """`{% cache 'name', key, ... %}...{% endcache %}`: render a block once per key and reuse the markup.
+    
+    Keys should carry whatever the markup depends on (a book's id and
+    updated_at), so edits produce a new key rather than needing an
+    invalidation; a key part that is None or undefined skips the cache.
+    csrf_token() may be called inside a block. Nothing else that varies by
+    request or user belongs there unless it is part of the key.
+    """
+    tags = {'cache'}
+    
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+    
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+    
+    def _render(self, parts, caller):
+        store = self.environment.fragment_cache
+        if store is None or any(part is None or isinstance(part, Undefined) for part in parts):
+            return caller()
+        depth = g.get('fragment_depth', 0)
+        g.fragment_depth = depth + 1
+        try:
+            markup = store.get(tuple(map(str, parts)), caller)
+        finally:
+            g.fragment_depth = depth
+        if depth == 0 and CSRF_PLACEHOLDER in markup:
+            markup = markup.replace(CSRF_PLACEHOLDER, self.environment.globals['csrf_token']())
+        return markup
+
+
+def init_fragment_cache(app):
+    """Enable {% cache %} blocks and, unless disabled, keep compiled templates on disk for new workers"""
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    if app.config.get('FRAGMENT_CACHE', True):
+        # Entries are keyed by content, so only category renames (shown on cards) flush them all
+        env.fragment_cache = LocalCache('category', ttl=app.config.get('FRAGMENT_CACHE_SECONDS', 600),
+                                        max_entries=app.config.get('FRAGMENT_CACHE_ENTRIES', 5000), per_key=False)
+        generate = env.globals.get('csrf_token')
+        if generate is not None:
+            def csrf_token():
+                return CSRF_PLACEHOLDER if g.get('fragment_depth') else generate()
+            # Flask-WTF sets it both as a global and through a context processor; replace both
+            env.globals['csrf_token'] = csrf_token
+            app.context_processor(lambda: {'csrf_token': csrf_token})
+    if app.config.get('JINJA_BYTECODE_CACHE', True):
+        directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+        os.makedirs(directory, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_templates(app):
+    """Load every template once so its bytecode is on disk before workers start; returns how many"""
+    env = app.jinja_env
+    names = env.list_templates(extensions=('html',))
+    for name in names:
+        env.get_template(name)
+    return len(names)
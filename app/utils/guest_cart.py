@@ -0,0 +1,120 @@
+from datetime import datetime
+from flask import current_app, request, after_this_request
+from itsdangerous import URLSafeSerializer, BadSignature
+from app import db
+
+# Guest carts live entirely in a signed cookie as [[book_id, quantity], ...]
+# so anonymous browsing and cart-building never touch the database.
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='guest-cart')
+
+
+def _cookie_name():
+    return current_app.config.get('GUEST_CART_COOKIE', 'bb_guest_cart')
+
+
+def load_guest_cart():
+    """Return the guest cart from the request cookie as {book_id: quantity}"""
+    raw = request.cookies.get(_cookie_name())
+    if not raw:
+        return {}
+    try:
+        lines = _serializer().loads(raw)
+    except BadSignature:
+        return {}
+    cart = {}
+    for line in lines:
+        try:
+            book_id, quantity = str(line[0]), int(line[1])
+        except (TypeError, ValueError, IndexError):
+            continue
+        if quantity > 0:
+            cart[book_id] = quantity
+    return cart
+
+
+def save_guest_cart(response, cart):
+    """Write the guest cart back to the response cookie"""
+    if not cart:
+        clear_guest_cart(response)
+        return response
+    max_lines = current_app.config.get('GUEST_CART_MAX_LINES', 50)
+    lines = [[book_id, quantity] for book_id, quantity in cart.items() if quantity > 0][:max_lines]
+    response.set_cookie(
+        _cookie_name(),
+        _serializer().dumps(lines),
+        max_age=current_app.config.get('GUEST_CART_MAX_AGE', 30 * 24 * 3600),
+        httponly=True,
+        samesite='Lax'
+    )
+    return response
+
+
+def clear_guest_cart(response):
+    response.delete_cookie(_cookie_name())
+    return response
+
+
+def guest_cart_count():
+    return sum(load_guest_cart().values())
+
+
+def merge_guest_cart(user):
+    """Fold the guest cookie cart into the user's stored cart in one bulk upsert"""
+    guest_cart = load_guest_cart()
+    if not guest_cart:
+        return 0
+    
+    @after_this_request
+    def _clear_cookie(response):
+        return clear_guest_cart(response)
+    
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import BookRepository, CartRepository
+        cart_repo = CartRepository()
+        books = {b['id']: b for b in BookRepository().get_many(guest_cart.keys()) if b.get('is_active', True)}
+        cart_data = cart_repo.get_by_user(user.id) or {'id': str(user.id), 'items': []}
+        lines = {item['book_id']: item for item in cart_data.get('items', [])}
+        for book_id, quantity in guest_cart.items():
+            book = books.get(book_id)
+            if not book:
+                continue
+            line = lines.setdefault(book_id, {'book_id': book_id, 'quantity': 0})
+            line['quantity'] = int(line['quantity']) + quantity
+        cart_data['items'] = list(lines.values())
+        cart_repo.save_cart(cart_data)
+        return len(books)
+    
+    from app.models import Book, Cart, CartItem
+    from app.utils.bulk import bulk_upsert
+    from app.utils.sqlite_tuning import use_writer
+    use_writer()
+    cart = user.cart
+    if not cart:
+        cart = Cart(user_id=user.id)
+        db.session.add(cart)
+        db.session.flush()
+    book_ids = [int(book_id) for book_id in guest_cart if book_id.isdigit()]
+    valid_ids = {book_id for (book_id,) in db.session.query(Book.id).filter(
+        Book.id.in_(book_ids), Book.is_active == True)}
+    now = datetime.utcnow()
+    rows = [{'cart_id': cart.id, 'book_id': book_id, 'quantity': guest_cart[str(book_id)], 'added_at': now}
+            for book_id in book_ids if book_id in valid_ids]
+    bulk_upsert(CartItem, rows, ['cart_id', 'book_id'], increment_columns=['quantity'])
+    if rows:
+        from app.utils.cdc import record_change
+        # The upsert bypasses the session, so its changes are recorded for CDC here. Quantities are positive,
+        # so a line holding more than the guest's quantity already existed and was incremented
+        merged = {row['book_id']: row for row in rows}
+        for item_id, book_id, quantity in db.session.query(CartItem.id, CartItem.book_id, CartItem.quantity).filter(
+                CartItem.cart_id == cart.id, CartItem.book_id.in_(list(merged))):
+            if quantity > merged[book_id]['quantity']:
+                record_change('cart_item', 'update', item_id, ['quantity'], {'quantity': quantity})
+            else:
+                row = dict(merged[book_id], id=item_id)
+                record_change('cart_item', 'insert', item_id, list(row), row)
+    cart.check_consistency(fix=True)
+    db.session.commit()
+    return len(rows)
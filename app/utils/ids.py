@@ -0,0 +1,91 @@
+import hashlib
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+# Crockford base32: no I, L, O or U, and ASCII order matches numeric order
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def _base32(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+# With ORDER_ID_WORKER set, the worker id is that number followed by this many low bits of the pid
+# (Linux pids stay below 2 ** 22), so forked workers sharing the setting still get distinct ids
+PID_BITS = 22
+
+
+def _default_worker_id():
+    """40-bit worker id: explicit ORDER_ID_WORKER plus the pid, else derived from host and pid"""
+    configured = os.environ.get('ORDER_ID_WORKER')
+    if configured:
+        if not 0 <= int(configured) < 2 ** (40 - PID_BITS):
+            raise ValueError(f'ORDER_ID_WORKER must be between 0 and {2 ** (40 - PID_BITS) - 1}')
+        return int(configured) << PID_BITS | os.getpid() & (2 ** PID_BITS - 1)
+    seed = f'{socket.gethostname()}:{os.getpid()}:{time.time_ns()}'.encode() + os.urandom(8)
+    return int.from_bytes(hashlib.blake2b(seed, digest_size=5).digest(), 'big')
+
+
+class OrderIdGenerator:
+    """Monotonic, time-sortable ids without a database round-trip.
+    
+    Layout (snowflake-style, rendered as text so ids sort lexically):
+    `<UTC yyyymmddHHMMSS + milliseconds>-<worker, 8 chars><sequence, 3 chars>`.
+    The worker part separates processes and hosts, and the per-millisecond
+    sequence separates ids issued by threads of the same process.
+    """
+    SEQUENCE_BITS = 15
+    
+    def __init__(self, worker_id=None):
+        self._lock = threading.Lock()
+        self.reset(worker_id)
+    
+    def reset(self, worker_id=None):
+        with self._lock:
+            self.worker_id = _default_worker_id() if worker_id is None else worker_id
+            self._worker = _base32(self.worker_id, 8)
+            self._last_ms = 0
+            self._sequence = 0
+    
+    def _next(self):
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            # Never step backwards if the wall clock does
+            if now_ms <= self._last_ms:
+                now_ms = self._last_ms
+                self._sequence += 1
+                if self._sequence >= 1 << self.SEQUENCE_BITS:
+                    now_ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return now_ms, self._sequence
+    
+    def next_id(self):
+        now_ms, sequence = self._next()
+        stamp = datetime.fromtimestamp(now_ms // 1000, tz=timezone.utc).strftime('%Y%m%d%H%M%S')
+        return f'{stamp}{now_ms % 1000:03d}-{self._worker}{_base32(sequence, 3)}'
+
+
+_generator = OrderIdGenerator()
+
+# A forked worker must not reuse its parent's worker id or sequence
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_generator.reset)
+
+
+def new_order_id():
+    """Return a new sortable id, e.g. '20260101093015042-7K3M9QXA000'"""
+    return _generator.next_id()
+
+
+def new_order_number():
+    return f'ORD-{new_order_id()}'
@@ -0,0 +1,189 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from flask import current_app, has_app_context
+from app.utils.cdc import subscribe
+
+try:
+    import fcntl
+except ImportError:  # Windows: bumps are only serialized within the process
+    fcntl = None
+
+COUNTER = struct.Struct('<Q')
+
+
+class InvalidationBus:
+    """Host-wide cache invalidations as generation counters in a shared memory-mapped file.
+    
+    Every worker maps the same file. Invalidating bumps a counter; a cache
+    remembers the counters it saw when it filled an entry and drops the
+    entry once they move. Each name hashes to one of `slots` counters, so
+    a collision only costs a spurious reload. Publishing increments two
+    counters under a lock on their bytes of the file, and checking is a
+    plain read of the page cache, with no lock, syscall or listener
+    thread; a change is visible to every worker as soon as it is written.
+    
+    Three counters are kept per namespace: 'ns' is bumped by
+    namespace-wide invalidations, 'ns:key' by invalidations of one key, and
+    'ns*' by either, for watchers that only want to know something moved.
+    """
+    
+    def __init__(self, path, slots=4096):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        size = slots * COUNTER.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        except BaseException:
+            os.close(fd)
+            raise
+        # Kept open for the record locks _bump takes; forked workers share it, which those locks allow
+        self._fd = fd
+        self._lock = threading.Lock()
+        self.path = path
+        self.slots = slots
+    
+    def _offset(self, name):
+        return zlib.crc32(name.encode()) % self.slots * COUNTER.size
+    
+    def _read(self, name):
+        return COUNTER.unpack_from(self._mm, self._offset(name))[0]
+    
+    def _bump(self, name):
+        # Unlocked, two workers could both store n + 1 and one invalidation would be lost, or a worker that
+        # read n before others moved the counter on could store n + 1 again and revive entries stamped with it.
+        # Record locks are per process, so threads of one worker also queue on the thread lock
+        offset = self._offset(name)
+        with self._lock:
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, COUNTER.size, offset)
+            try:
+                COUNTER.pack_into(self._mm, offset, (COUNTER.unpack_from(self._mm, offset)[0] + 1) % 2 ** 64)
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, COUNTER.size, offset)
+    
+    def invalidate(self, namespace, key=None):
+        """Drop one key, or the whole namespace when key is None, from every worker's caches"""
+        self._bump(namespace if key is None else f'{namespace}:{key}')
+        self._bump(f'{namespace}*')
+    
+    def stamp(self, namespace, key=None):
+        """The counters an entry for `key` depends on; the entry is stale once they differ"""
+        if key is None:
+            return self._read(namespace)
+        return self._read(namespace), self._read(f'{namespace}:{key}')
+    
+    def generation(self, namespace):
+        """A counter that moves on every invalidation in the namespace"""
+        return self._read(f'{namespace}*')
+
+
+def get_bus(app=None):
+    """The host's invalidation bus, or None when INVALIDATION_BUS is off or the file cannot be mapped"""
+    app = app or current_app._get_current_object()
+    if not app.config.get('INVALIDATION_BUS', True):
+        return None
+    if 'invalidation_bus' not in app.extensions:
+        path = app.config.get('INVALIDATION_BUS_PATH') or os.path.join(app.instance_path, 'invalidation.bus')
+        try:
+            app.extensions['invalidation_bus'] = InvalidationBus(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f'Invalidation bus unavailable, caches fall back to their timeouts: {e}')
+            app.extensions['invalidation_bus'] = None
+    return app.extensions['invalidation_bus']
+
+
+def invalidate(namespace, key=None):
+    """Broadcast an invalidation to every worker on the host (a no-op without the bus)"""
+    bus = get_bus() if has_app_context() else None
+    if bus is not None:
+        bus.invalidate(namespace, key)
+
+
+class Watcher:
+    """Tells a background cache (snapshot, bitmaps) when anything in a namespace was invalidated.
+    
+    Call mark() just before reloading, so an invalidation that lands
+    during the reload is still reported by the next changed(). Pass `app`
+    to watch from a thread without an app context.
+    """
+    
+    def __init__(self, namespace, app=None):
+        self.namespace = namespace
+        self.app = app
+        self.seen = None
+    
+    def _generation(self):
+        bus = get_bus(self.app) if self.app is not None or has_app_context() else None
+        return bus.generation(self.namespace) if bus is not None else None
+    
+    def changed(self):
+        generation = self._generation()
+        if self.seen is None:
+            self.seen = generation
+        return generation != self.seen
+    
+    def mark(self):
+        self.seen = self._generation()
+
+
+class LocalCache:
+    """A per-process read-through cache whose entries are dropped by bus invalidations.
+    
+    With per_key, an entry only depends on its own key (one user, one
+    book); without it, any invalidation in the namespace drops every entry,
+    which suits lists and aggregates. Entries also expire after `ttl`
+    seconds, which bounds staleness for writes that bypass the bus (or when
+    it is off). The oldest entries are evicted past `max_entries`.
+    """
+    
+    def __init__(self, namespace, ttl=300, max_entries=10000, per_key=True):
+        self.namespace = namespace
+        self.per_key = per_key
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key, load):
+        bus = get_bus() if has_app_context() else None
+        # Stamped before loading, so a write racing the load invalidates what it returns
+        if bus is None:
+            stamp = None
+        elif self.per_key:
+            stamp = bus.stamp(self.namespace, key)
+        else:
+            stamp = bus.generation(self.namespace)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stamp and entry[1] > now:
+            return entry[2]
+        value = load()
+        with self._lock:
+            self._entries[key] = (stamp, now + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        return value
+    
+    def clear(self):
+        self._entries.clear()
+
+
+def _forward(change):
+    """Committed changes to tracked entities invalidate their keys on every worker"""
+    invalidate(change.entity, change.key)
+
+
+subscribe('*', _forward)
+
+
+def init_invalidation_bus(app):
+    """Map the bus at startup, so a preloading server shares the mapping with the workers it forks"""
+    get_bus(app)
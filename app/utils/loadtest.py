@@ -0,0 +1,509 @@
+import http.client
+import json
+import math
+import random
+import re
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from app.utils.datagen import ZipfSampler
+from app.utils.query_stats import QUERY_COUNT_HEADER
+
+CSRF_PATTERN = re.compile(r'name="csrf_token" value="([^"]+)"')
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LatencyHistogram:
+    """HDR-style latency histogram with fixed relative precision.
+    
+    Values (microseconds) are counted in log-linear buckets so memory
+    stays constant however many samples are recorded, while every bucket
+    is accurate to `significant_figures` digits.
+    """
+    
+    def __init__(self, significant_figures=3):
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+    
+    def _bucket(self, value):
+        shift = value.bit_length() - self.sub_bucket_bits
+        return value if shift <= 0 else (value >> shift) << shift
+    
+    def record(self, value):
+        value = max(0, int(value))
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+    
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, pct):
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(self.total * pct / 100))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return min(bucket, self.max)
+        return self.max
+    
+    def summary(self):
+        """Latency summary in milliseconds"""
+        result = {f'p{pct:g}': round(self.percentile(pct) / 1000, 3) for pct in PERCENTILES}
+        result['min'] = round((self.min or 0) / 1000, 3)
+        result['max'] = round(self.max / 1000, 3)
+        result['mean'] = round(self.sum / self.total / 1000, 3) if self.total else 0
+        return result
+
+
+class RouteStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.counted = 0
+    
+    def record(self, elapsed_us, ok, query_count):
+        self.latency.record(elapsed_us)
+        if not ok:
+            self.errors += 1
+        if query_count is not None:
+            self.counted += 1
+            self.queries += query_count
+            self.max_queries = max(self.max_queries, query_count)
+    
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.errors += other.errors
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.counted += other.counted
+    
+    def to_dict(self):
+        result = {'requests': self.latency.total, 'errors': self.errors, 'latency_ms': self.latency.summary()}
+        if self.counted:
+            result['queries'] = {'mean': round(self.queries / self.counted, 2), 'max': self.max_queries}
+        return result
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+    
+    @property
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+
+class HttpClient:
+    """Keep-alive HTTP client with its own cookie jar: one browser session"""
+    
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.cookies = {}
+        self.connection = None
+    
+    def request(self, method, path, data=None, headers=None):
+        body = urlencode(data) if data is not None else None
+        request_headers = dict(headers or {})
+        if self.cookies:
+            request_headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if body is not None:
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        # A kept-alive connection may have been closed by the server; GETs are safe to resend
+        attempts = 2 if method == 'GET' and self.connection is not None else 1
+        for attempt in range(attempts):
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, self.prefix + path, body=body, headers=request_headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt == attempts - 1:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self._store_cookie(header)
+        if response.will_close:
+            self.close()
+        return Response(response.status, response.headers, payload)
+    
+    def _store_cookie(self, header):
+        name, _, rest = header.partition('=')
+        value, _, attributes = rest.partition(';')
+        attributes = attributes.lower()
+        if 'max-age=0' in attributes or 'expires=thu, 01 jan 1970' in attributes:
+            self.cookies.pop(name.strip(), None)
+        else:
+            self.cookies[name.strip()] = value.strip()
+    
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class Session:
+    """A logged-in (or guest) browser session that records every request"""
+    
+    def __init__(self, user, client):
+        self.user = user
+        self.client = client
+        self.csrf_token = None
+    
+    def _send(self, label, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            response = self.client.request(method, path, data)
+        except (http.client.HTTPException, OSError):
+            self.user.record(label, (time.perf_counter() - started) * 1e6, False, None)
+            raise
+        elapsed = (time.perf_counter() - started) * 1e6
+        query_count = response.headers.get(QUERY_COUNT_HEADER)
+        self.user.record(label, elapsed, response.status < 400, int(query_count) if query_count else None)
+        if self.csrf_token is None and response.headers.get('Content-Type', '').startswith('text/html'):
+            match = CSRF_PATTERN.search(response.text)
+            if match:
+                self.csrf_token = match.group(1)
+        return response
+    
+    def get(self, label, path):
+        return self._send(label, 'GET', path)
+    
+    def post(self, label, path, data=None):
+        if self.csrf_token is None:
+            self.get('auth.login', '/auth/login')
+        form = dict(data or {})
+        form['csrf_token'] = self.csrf_token
+        return self._send(label, 'POST', path, form)
+    
+    def login(self, email, password):
+        self.get('auth.login', '/auth/login')
+        response = self.post('auth.login', '/auth/login', {'email': email, 'password': password})
+        if response.status != 302 or '/auth/login' in response.headers.get('Location', ''):
+            raise LoginFailed(f'Could not log in as {email}')
+
+
+class Dataset:
+    """Ids and accounts the journeys pick from, sampled from the target store"""
+    
+    def __init__(self, book_ids, category_ids, search_terms, customers, sellers, admins, password,
+                 admin_password, seller_books=None):
+        self.book_ids = book_ids
+        self.category_ids = category_ids
+        self.search_terms = search_terms
+        self.customers = customers
+        self.sellers = sellers
+        self.admins = admins
+        self.password = password
+        self.admin_password = admin_password
+        self.seller_books = seller_books or {}
+        self.book_sampler = ZipfSampler(len(book_ids), 1.07, random.Random(0)) if book_ids else None
+    
+    def to_dict(self):
+        return {'books': len(self.book_ids), 'categories': len(self.category_ids),
+                'customers': len(self.customers), 'sellers': len(self.sellers)}
+    
+    @classmethod
+    def sample(cls, app, books=5000, customers=500, sellers=50, password='password123', admin_password='admin123'):
+        with app.app_context():
+            if app.config.get('USE_AWS'):
+                return cls._sample_dynamo(books, customers, sellers, password, admin_password)
+            return cls._sample_sql(books, customers, sellers, password, admin_password)
+    
+    @classmethod
+    def _sample_sql(cls, books, customers, sellers, password, admin_password):
+        from app.models import Book, Category, User
+        book_rows = Book.query.with_entities(Book.id, Book.title, Book.seller_id).filter(
+            Book.is_active == True, Book.stock_quantity > 0).order_by(Book.id).limit(books).all()
+        users = lambda role, limit: [email for (email,) in User.query.with_entities(User.email).filter_by(
+            role=role, is_active=True, is_approved=True).order_by(User.id).limit(limit)]
+        seller_emails = users('seller', sellers)
+        seller_ids = dict(User.query.with_entities(User.id, User.email).filter(User.email.in_(seller_emails)).all())
+        seller_books = {}
+        for book_id, _, seller_id in book_rows:
+            if seller_id in seller_ids:
+                seller_books.setdefault(seller_ids[seller_id], []).append(book_id)
+        return cls(
+            book_ids=[book_id for book_id, _, _ in book_rows],
+            category_ids=[category_id for (category_id,) in Category.query.with_entities(Category.id)],
+            search_terms=_search_terms(title for _, title, _ in book_rows),
+            customers=users('customer', customers), sellers=seller_emails, admins=users('admin', 1),
+            password=password, admin_password=admin_password, seller_books=seller_books
+        )
+    
+    @classmethod
+    def _sample_dynamo(cls, books, customers, sellers, password, admin_password):
+        from itertools import islice
+        from app.utils.dynamo_repo import BookRepository, CategoryRepository, UserRepository
+        book_items = list(islice((b for b in BookRepository().iter_all()
+                                  if b.get('is_active', True) and int(b.get('stock_quantity', 0)) > 0), books))
+        accounts = {'customer': [], 'seller': [], 'admin': []}
+        limits = {'customer': customers, 'seller': sellers, 'admin': 1}
+        for user in UserRepository().iter_all():
+            role = user.get('role')
+            if role in accounts and len(accounts[role]) < limits[role] and user.get('is_active', True):
+                accounts[role].append(user['email'])
+        return cls(
+            book_ids=[b['id'] for b in book_items],
+            category_ids=[c['id'] for c in CategoryRepository().get_all()],
+            search_terms=_search_terms(b.get('title', '') for b in book_items),
+            customers=accounts['customer'], sellers=accounts['seller'], admins=accounts['admin'],
+            password=password, admin_password=admin_password
+        )
+
+
+def _search_terms(titles, limit=200):
+    terms = {}
+    for title in titles:
+        for word in title.split():
+            if len(word) > 3 and word.isalpha():
+                terms[word.lower()] = terms.get(word.lower(), 0) + 1
+    return sorted(terms, key=terms.get, reverse=True)[:limit] or ['book']
+
+
+# Journeys: each is one realistic visit, recorded per route label
+def browse(vu):
+    s = vu.session('guest')
+    s.get('main.index', '/')
+    s.get('main.books', f'/books?page={vu.rng.randint(1, 20)}')
+    if vu.dataset.category_ids:
+        s.get('main.books', f'/books?category={vu.rng.choice(vu.dataset.category_ids)}')
+
+
+def search(vu):
+    s = vu.session('guest')
+    s.get('main.search', '/search?' + urlencode({'q': vu.rng.choice(vu.dataset.search_terms)}))
+
+
+def detail(vu):
+    s = vu.session('guest')
+    for _ in range(vu.rng.randint(1, 3)):
+        s.get('main.book_detail', f'/books/{vu.pick_book()}')
+
+
+def cart(vu):
+    s = vu.session('customer')
+    book_id = vu.pick_book()
+    s.get('main.book_detail', f'/books/{book_id}')
+    s.post('customer.add_to_cart', f'/customer/cart/add/{book_id}', {'quantity': 1})
+    s.get('customer.cart', '/customer/cart')
+
+
+def checkout(vu):
+    s = vu.session('customer')
+    s.post('customer.add_to_cart', f'/customer/cart/add/{vu.pick_book()}', {'quantity': 1})
+    s.get('customer.checkout', '/customer/checkout')
+    s.post('customer.checkout', '/customer/checkout',
+           {'shipping_address': f'{vu.rng.randint(1, 999)} Benchmark Street', 'payment_method': 'cod'})
+    s.get('customer.orders', '/customer/orders')
+
+
+def seller(vu):
+    s = vu.session('seller')
+    s.get('seller.dashboard', '/seller/dashboard')
+    s.get('seller.inventory', '/seller/inventory')
+    own_books = vu.dataset.seller_books.get(vu.accounts['seller'])
+    if own_books:
+        s.post('seller.update_stock', f'/seller/inventory/update/{vu.rng.choice(own_books)}',
+               {'stock_quantity': vu.rng.randint(50, 200)})
+
+
+def admin(vu):
+    s = vu.session('admin')
+    s.get('admin.dashboard', '/admin/dashboard')
+    s.get('admin.orders', '/admin/orders')
+
+
+JOURNEYS = {'browse': browse, 'search': search, 'detail': detail, 'cart': cart, 'checkout': checkout,
+            'seller': seller, 'admin': admin}
+
+MIXES = {
+    'browse': {'browse': 40, 'search': 25, 'detail': 35},
+    'shopping': {'browse': 25, 'search': 15, 'detail': 30, 'cart': 20, 'checkout': 10},
+    'checkout': {'cart': 40, 'checkout': 60},
+    'full': {'browse': 20, 'search': 15, 'detail': 25, 'cart': 15, 'checkout': 8, 'seller': 10, 'admin': 7},
+}
+
+
+def parse_mix(value):
+    """A named mix, or weights like 'browse=5,checkout=1'"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in JOURNEYS:
+            raise ValueError(f'Unknown journey "{name.strip()}"; choose from {", ".join(JOURNEYS)}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class VirtualUser:
+    """One simulated visitor: picks journeys from the mix until the run ends"""
+    
+    def __init__(self, runner, index):
+        self.runner = runner
+        self.dataset = runner.dataset
+        self.rng = random.Random(runner.seed * 1000003 + index)
+        self.index = index
+        self.routes = {}
+        self.journeys = {}
+        self.sessions = {}
+        self.accounts = {}
+        self.recording = False
+    
+    def pick_book(self):
+        return self.dataset.book_ids[self.dataset.book_sampler.sample(self.rng)]
+    
+    def session(self, role):
+        if role not in self.sessions:
+            s = Session(self, HttpClient(self.runner.base_url))
+            if role != 'guest':
+                accounts = {'customer': self.dataset.customers, 'seller': self.dataset.sellers,
+                            'admin': self.dataset.admins}[role]
+                if not accounts:
+                    raise LoginFailed(f'No {role} accounts in the dataset')
+                self.accounts[role] = accounts[self.index % len(accounts)]
+                password = self.dataset.admin_password if role == 'admin' else self.dataset.password
+                s.login(self.accounts[role], password)
+            self.sessions[role] = s
+        return self.sessions[role]
+    
+    def record(self, label, elapsed_us, ok, query_count):
+        if self.recording:
+            self.routes.setdefault(label, RouteStats()).record(elapsed_us, ok, query_count)
+    
+    def run(self, names, weights, warmup_until, deadline):
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            self.recording = now >= warmup_until
+            name = self.rng.choices(names, weights)[0]
+            counts = self.journeys.setdefault(name, {'count': 0, 'errors': 0})
+            try:
+                JOURNEYS[name](self)
+                ok = True
+            except (LoginFailed, http.client.HTTPException, OSError) as e:
+                ok = False
+                self.runner.note_error(f'{name}: {e}')
+            if self.recording:
+                counts['count'] += 1
+                counts['errors'] += 0 if ok else 1
+        for s in self.sessions.values():
+            s.client.close()
+
+
+class LoadTest:
+    """Run a journey mix against `base_url` with `concurrency` virtual users"""
+    
+    def __init__(self, base_url, dataset, mix, concurrency=10, duration=30, warmup=5, seed=1):
+        self.base_url = base_url.rstrip('/')
+        self.dataset = dataset
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.warmup = warmup
+        self.seed = seed
+        self.errors = []
+        self._lock = threading.Lock()
+    
+    def note_error(self, message):
+        with self._lock:
+            if len(self.errors) < 20:
+                self.errors.append(message)
+    
+    def run(self):
+        users = [VirtualUser(self, i) for i in range(self.concurrency)]
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        warmup_until = time.monotonic() + self.warmup
+        deadline = warmup_until + self.duration
+        threads = [threading.Thread(target=vu.run, args=(names, weights, warmup_until, deadline), daemon=True)
+                   for vu in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self._report(users)
+    
+    def _report(self, users):
+        routes, journeys, overall = {}, {}, RouteStats()
+        for vu in users:
+            for label, stats in vu.routes.items():
+                routes.setdefault(label, RouteStats()).merge(stats)
+                overall.merge(stats)
+            for name, counts in vu.journeys.items():
+                merged = journeys.setdefault(name, {'count': 0, 'errors': 0})
+                merged['count'] += counts['count']
+                merged['errors'] += counts['errors']
+        summary = overall.to_dict()
+        summary['throughput_rps'] = round(overall.latency.total / self.duration, 2)
+        return {
+            'config': {'concurrency': self.concurrency, 'duration_s': self.duration, 'warmup_s': self.warmup,
+                       'mix': self.mix, 'seed': self.seed, 'dataset': self.dataset.to_dict()},
+            'summary': summary,
+            'routes': {label: routes[label].to_dict() for label in sorted(routes)},
+            'journeys': journeys,
+            'sample_errors': self.errors,
+        }
+
+
+def compare_results(baseline, current, threshold=10.0):
+    """Return (label, metric, old, new, change %) for every regression beyond `threshold` percent"""
+    regressions = []
+    
+    def check(label, metric, old, new, higher_is_worse=True):
+        if not old:
+            return
+        change = (new - old) / old * 100
+        if (change if higher_is_worse else -change) > threshold:
+            regressions.append((label, metric, old, new, round(change, 1)))
+    
+    check('overall', 'throughput_rps', baseline['summary']['throughput_rps'],
+          current['summary']['throughput_rps'], higher_is_worse=False)
+    for label, old in baseline['routes'].items():
+        new = current['routes'].get(label)
+        if not new:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            check(label, metric, old['latency_ms'][metric], new['latency_ms'][metric])
+        if 'queries' in old and 'queries' in new:
+            check(label, 'queries', old['queries']['mean'], new['queries']['mean'])
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,347 @@
+import json
+import logging
+import mmap
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import numpy as np
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wsgi import ClosingIterator
+
+logger = logging.getLogger(__name__)
+
+WORKER_CLASSES = ('sync', 'threaded')
+# One row per worker slot, in memory the master maps before forking so every worker sees every row
+SLOT_DTYPE = np.dtype([('pid', 'i8'), ('generation', 'i8'), ('ready', 'i8'), ('started', 'f8'), ('requests', 'i8'),
+                       ('active', 'i8'), ('errors', 'i8'), ('busy_ms', 'f8'), ('last_request', 'f8')])
+# Seconds a worker waits for a connection before checking whether it should stop
+POLL_INTERVAL = 1
+
+
+class WorkerStats:
+    """Per-worker counters in an anonymous shared mapping; each worker only writes its own row"""
+    
+    def __init__(self, slots):
+        self._map = mmap.mmap(-1, slots * SLOT_DTYPE.itemsize)
+        self.rows = np.ndarray((slots,), SLOT_DTYPE, buffer=self._map)
+        self.rows[:] = 0
+        self._lock = threading.Lock()
+    
+    def free_slot(self):
+        empty = np.flatnonzero(self.rows['pid'] == 0)
+        return int(empty[0]) if len(empty) else None
+    
+    def claim(self, slot, pid, generation):
+        self.rows[slot] = (pid, generation, 0, time.time(), 0, 0, 0, 0.0, 0.0)
+    
+    def mark_ready(self, slot):
+        self.rows['ready'][slot] = 1
+    
+    def ready(self, slot):
+        return bool(self.rows['ready'][slot])
+    
+    def release(self, slot):
+        self.rows[slot] = 0
+    
+    def begin(self, slot):
+        with self._lock:
+            self.rows['active'][slot] += 1
+        return time.perf_counter()
+    
+    def end(self, slot, started, failed):
+        with self._lock:
+            row = self.rows[slot]
+            row['active'] -= 1
+            row['requests'] += 1
+            row['errors'] += failed
+            row['busy_ms'] += (time.perf_counter() - started) * 1000
+            row['last_request'] = time.time()
+    
+    def active(self, slot):
+        return int(self.rows['active'][slot])
+    
+    def report(self):
+        now = time.time()
+        workers = []
+        for row in self.rows[self.rows['pid'] != 0].tolist():
+            pid, generation, ready, started, requests, active, errors, busy_ms, last_request = row
+            workers.append({
+                'pid': pid,
+                'generation': generation,
+                'ready': bool(ready),
+                'uptime_s': round(now - started, 1),
+                'requests': requests,
+                'active': active,
+                'errors': errors,
+                'mean_ms': round(busy_ms / requests, 2) if requests else None,
+                'idle_s': round(now - last_request, 1) if last_request else None,
+                'rss_mb': _rss_mb(pid),
+            })
+        return workers
+
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return round(int(f.read().split()[1]) * mmap.PAGESIZE / 2 ** 20, 1)
+    except (OSError, IndexError, ValueError):  # not Linux, or the worker just exited
+        return None
+
+
+class WorkerMetrics:
+    """WSGI middleware counting requests into the worker's row, and answering `path` with every row as JSON.
+    
+    The report is only served to loopback clients; anyone else gets the
+    application's own response for that path.
+    """
+    
+    def __init__(self, app, stats, slot, path, master_pid):
+        self.app = app
+        self.stats = stats
+        self.slot = slot
+        self.path = path
+        self.master_pid = master_pid
+    
+    def __call__(self, environ, start_response):
+        if (self.path and environ.get('PATH_INFO') == self.path and
+                environ.get('REMOTE_ADDR') in ('127.0.0.1', '::1')):
+            body = json.dumps({'master_pid': self.master_pid, 'workers': self.stats.report()}).encode()
+            start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                                      ('Cache-Control', 'no-store')])
+            return [body]
+        started = self.stats.begin(self.slot)
+        status = []
+        
+        def counting_start_response(code, headers, exc_info=None):
+            status.append(code)
+            return start_response(code, headers, exc_info)
+        try:
+            body = self.app(environ, counting_start_response)
+        except BaseException:
+            self.stats.end(self.slot, started, True)
+            raise
+        # Streamed bodies keep the request active until the last chunk is sent
+        return ClosingIterator(body, lambda: self.stats.end(self.slot, started, bool(status) and
+                                                            status[0].startswith('5')))
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Werkzeug's handler without a log line per request (ACCESS_LOG keeps a trace if one is wanted)"""
+    
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def reset_connections(app, close=True):
+    """Empty the database pools and the default boto3 session; each reopens on first use.
+    
+    The master closes its connections before forking; a worker passes
+    close=False so it only forgets any it inherited, leaving them alone.
+    """
+    from app import db
+    if not app.config.get('USE_AWS'):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=close)
+        reader = app.extensions.get('sqlite_reader')
+        if reader is not None:
+            reader.dispose(close=close)
+    boto3 = sys.modules.get('boto3')
+    if boto3 is not None:
+        # Repositories open their own sessions, but anything that used the default one gets a fresh one
+        boto3.DEFAULT_SESSION = None
+
+
+class PreforkServer:
+    """A master that binds once, optionally builds the app, and forks `workers` processes to serve it.
+    
+    Signals to the master: TERM or INT stop gracefully; HUP starts a new
+    generation of workers and then lets the old one finish its requests
+    and exit, without refusing a connection; TTIN and TTOU add or remove
+    a worker. With preload on, HUP reuses the master's copy of the code,
+    so a deploy needs preload off (every worker then runs the app factory
+    itself and picks up new code) or a restart.
+    """
+    
+    def __init__(self, factory, host='0.0.0.0', port=5000, workers=2, worker_class='sync', preload=True,
+                 graceful_timeout=30, metrics_path='/_server/metrics', backlog=2048):
+        if worker_class not in WORKER_CLASSES:
+            raise ValueError(f"worker_class must be one of {', '.join(WORKER_CLASSES)}")
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.workers = max(workers, 1)
+        self.threaded = worker_class == 'threaded'
+        self.preload = preload
+        self.graceful_timeout = graceful_timeout
+        self.metrics_path = metrics_path
+        self.backlog = backlog
+        self.app = None
+        self.socket = None
+        self.stats = None
+        self.generation = 0
+        self.children = {}  # pid -> (slot, generation)
+        self.master_pid = None
+        self.boot_failed = False
+        self._signals = []
+    
+    def bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        # Idle workers all wait on this socket; the ones that lose the race for a connection get EAGAIN
+        sock.setblocking(False)
+        self.port = sock.getsockname()[1]
+        self.socket = sock
+    
+    def run(self):
+        self.master_pid = os.getpid()
+        if self.socket is None:
+            self.bind()
+        if self.preload:
+            self.app = self.factory()
+            reset_connections(self.app)
+        # Room for a second generation while a reload overlaps the first, plus TTIN headroom
+        self.stats = WorkerStats(self.workers * 2 + 8)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._queue_signal)
+        logger.info('Master %s serving on %s:%s with %s %s workers (preload %s)', self.master_pid, self.host,
+                    self.port, self.workers, 'threaded' if self.threaded else 'sync', 'on' if self.preload else 'off')
+        try:
+            while True:
+                self._reap()
+                if self.boot_failed or not self._handle_signals():
+                    break
+                self._maintain()
+                time.sleep(0.2)
+        finally:
+            self._stop_all()
+            self.socket.close()
+    
+    def _queue_signal(self, signum, frame):
+        self._signals.append(signum)
+    
+    def _handle_signals(self):
+        """Act on queued signals; False once the master should stop"""
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                return False
+            if signum == signal.SIGHUP:
+                logger.info('Reloading: starting worker generation %s', self.generation + 1)
+                self.generation += 1
+            elif signum == signal.SIGTTIN:
+                self.workers += 1
+            elif signum == signal.SIGTTOU and self.workers > 1:
+                self.workers -= 1
+        return True
+    
+    def _current(self):
+        return sorted(pid for pid, (slot, generation) in self.children.items() if generation == self.generation)
+    
+    def _maintain(self):
+        current = self._current()
+        for _ in range(self.workers - len(current)):
+            self._spawn()
+        for pid in current[:max(len(current) - self.workers, 0)]:
+            self._signal(pid, signal.SIGTERM)
+        current = self._current()
+        if len(current) >= self.workers and all(self.stats.ready(self.children[pid][0]) for pid in current):
+            # The new generation is serving: the old one stops accepting and drains
+            for pid, (slot, generation) in list(self.children.items()):
+                if generation < self.generation:
+                    self._signal(pid, signal.SIGTERM)
+    
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+    
+    def _spawn(self):
+        slot = self.stats.free_slot()
+        if slot is None:
+            return
+        pid = os.fork()
+        if pid:
+            self.stats.claim(slot, pid, self.generation)
+            self.children[pid] = (slot, self.generation)
+            return
+        code = 0
+        try:
+            self._serve(slot)
+        except BaseException:
+            logger.exception('Worker %s failed', os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+    
+    def _reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            slot, generation = self.children.pop(pid, (None, None))
+            if slot is None:
+                continue
+            booted = self.stats.ready(slot)
+            self.stats.release(slot)
+            if generation != self.generation or not os.WIFEXITED(status) or not os.WEXITSTATUS(status):
+                continue
+            if booted:
+                logger.warning('Worker %s exited with status %s; replacing it', pid, os.WEXITSTATUS(status))
+                continue
+            older = [gen for slot, gen in self.children.values() if gen < generation]
+            if older:
+                # A reload whose workers cannot start (a bad deploy): keep serving with the previous generation
+                logger.error('Worker generation %s failed to boot; keeping generation %s', generation, max(older))
+                for other, (slot, gen) in self.children.items():
+                    if gen == generation:
+                        self._signal(other, signal.SIGTERM)
+                self.generation = max(older)
+            else:
+                logger.error('Worker %s failed to boot; stopping', pid)
+                self.boot_failed = True
+    
+    def _stop_all(self):
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout + POLL_INTERVAL
+        while self.children and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            self._signal(pid, signal.SIGKILL)
+        self._reap()
+    
+    def _serve(self, slot):
+        """A worker's life: serve until TERM (or the master dies), then let in-flight requests finish"""
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            # Ctrl-C reaches the whole process group; the master decides what happens
+            signal.signal(signum, signal.SIG_IGN)
+        if self.app is not None:
+            app = self.app
+            reset_connections(app, close=False)
+        else:
+            app = self.factory()
+        self.stats.claim(slot, os.getpid(), self.generation)
+        wsgi = WorkerMetrics(app, self.stats, slot, self.metrics_path, self.master_pid)
+        server = make_server(self.host, self.port, wsgi, threaded=self.threaded, request_handler=QuietRequestHandler,
+                             fd=self.socket.fileno())
+        server.timeout = POLL_INTERVAL
+        self.stats.mark_ready(slot)
+        while not stopping and os.getppid() == self.master_pid:
+            server.handle_request()
+        deadline = time.time() + self.graceful_timeout
+        while self.stats.active(slot) and time.time() < deadline:
+            time.sleep(0.05)
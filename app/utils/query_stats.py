@@ -0,0 +1,32 @@
+from flask import g, has_request_context
+from sqlalchemy import event
+from app import db
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+
+def count_query(*args, **kwargs):
+    """Count one SQL statement or DynamoDB call against the current request"""
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+
+def init_query_stats(app):
+    """Report per-request SQL statement / DynamoDB call counts in a response header.
+    
+    Enabled with QUERY_STATS; the benchmark suite reads the header to
+    attribute query counts to routes.
+    """
+    if not app.config.get('QUERY_STATS'):
+        return
+    if not app.config.get('USE_AWS'):
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count_query)
+        reader = app.extensions.get('sqlite_reader')
+        if reader is not None:
+            event.listen(reader, 'before_cursor_execute', count_query)
+    
+    @app.after_request
+    def add_query_count(response):
+        response.headers[QUERY_COUNT_HEADER] = str(g.get('query_count', 0))
+        return response
@@ -0,0 +1,49 @@
+from flask import current_app
+from app import db
+
+
+def recommendation_ids(book_id):
+    """(also_bought, similar) id lists for a book from its precomputed row (one key lookup)"""
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import RecommendationRepository
+        return RecommendationRepository().get_for_book(book_id)
+    from app.models import BookRecommendation
+    row = db.session.get(BookRecommendation, book_id)
+    return (row.also_bought, row.similar) if row else ([], [])
+
+
+def _active_books(ids, limit, exclude=()):
+    """Fetch books by id in the given order, skipping inactive and excluded ones"""
+    ids = [book_id for book_id in dict.fromkeys(ids) if book_id not in exclude]
+    if not ids:
+        return []
+    if current_app.config.get('USE_AWS'):
+        from app.utils.catalog_snapshot import get_catalog
+        from app.utils.dynamo_repo import BookRepository
+        catalog = get_catalog()
+        source = catalog.get_many if catalog is not None else BookRepository().get_many
+        found = {b['id']: b for b in source(ids[:limit * 3]) if b.get('is_active', True)}
+    else:
+        from app.models import Book
+        found = {b.id: b for b in Book.query.filter(Book.id.in_(ids[:limit * 3]), Book.is_active == True)}
+    return [found[book_id] for book_id in ids if book_id in found][:limit]
+
+
+def related_books(book, limit=4):
+    """Books bought together with `book`, topped up with similar titles for books with little sales history.
+    
+    Returns [] until `flask build-recommendations` has covered the book.
+    """
+    book_id = book['id'] if isinstance(book, dict) else book.id
+    also_bought, similar = recommendation_ids(book_id)
+    return _active_books(also_bought + similar, limit, exclude={book_id})
+
+
+def upsell_books(book_ids, limit=4):
+    """Suggestions for a cart: neighbours of its books, interleaved, that are not already in it"""
+    lists = []
+    for book_id in book_ids[:5]:
+        also_bought, similar = recommendation_ids(book_id)
+        lists.append(also_bought + similar)
+    interleaved = [ids[i] for i in range(max(map(len, lists), default=0)) for ids in lists if i < len(ids)]
+    return _active_books(interleaved, limit, exclude=set(book_ids))
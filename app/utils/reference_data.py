@@ -0,0 +1,76 @@
+from flask import current_app
+from app.utils.invalidation import LocalCache, invalidate
+
+
+def _cache(name):
+    return current_app.extensions['reference_data'][name]
+
+
+def _load_categories():
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import CategoryRepository
+        return CategoryRepository().get_all()
+    from app.models import Category
+    # Plain dicts: ORM instances would outlive the session that loaded them
+    return [{'id': category.id, 'category_name': category.category_name, 'description': category.description}
+            for category in Category.query.order_by(Category.id)]
+
+
+def get_categories():
+    """Every category (dicts with id, category_name and description), cached per process"""
+    from app.utils.catalog_snapshot import get_catalog
+    catalog = get_catalog()
+    if catalog is not None:
+        # The catalog snapshot already carries them and reloads them on invalidation
+        return catalog.categories
+    return _cache('categories').get('all', _load_categories)
+
+
+def _load_active_counts():
+    if current_app.config.get('USE_AWS'):
+        from app.utils.dynamo_repo import BookRepository
+        counts = {}
+        for book in BookRepository().iter_all():
+            if book.get('is_active', True) and book.get('category_id'):
+                counts[str(book['category_id'])] = counts.get(str(book['category_id']), 0) + 1
+        return counts
+    from app import db
+    from app.models import Book
+    rows = db.session.query(Book.category_id, db.func.count(Book.id)).filter(
+        Book.is_active == True, Book.category_id.isnot(None)).group_by(Book.category_id)
+    return {str(category_id): count for category_id, count in rows}
+
+
+def active_book_counts():
+    """{category id as a string: active books in it}"""
+    from app.utils.bitmaps import get_bitmaps
+    from app.utils.catalog_snapshot import get_catalog
+    index = get_bitmaps()
+    if index is None:
+        catalog = get_catalog()
+        index = catalog.bitmaps if catalog is not None else None
+    if index is not None:
+        # Popcounts over the bitmap index, which tracks book writes on its own
+        return index.facets('category', index.select())
+    # Book writes do not invalidate this fallback, so it is kept briefly
+    return _cache('active_counts').get('all', _load_active_counts)
+
+
+def invalidate_categories():
+    """Drop the cached categories and counts in every worker (call after a category write commits)"""
+    invalidate('category')
+    for cache in current_app.extensions['reference_data'].values():
+        cache.clear()
+
+
+def init_reference_data(app):
+    """Set up the caches and give every template `categories` and `active_counts()`; routes may pass their own"""
+    # Near-static lists most pages show; every worker drops them when a category changes anywhere on the host
+    app.extensions['reference_data'] = {
+        'categories': LocalCache('category', ttl=app.config.get('CATEGORY_CACHE_SECONDS', 300), per_key=False),
+        'active_counts': LocalCache('category', ttl=app.config.get('CATEGORY_COUNTS_SECONDS', 60), per_key=False),
+    }
+    
+    @app.context_processor
+    def inject_reference_data():
+        return {'categories': get_categories(), 'active_counts': active_book_counts}
@@ -0,0 +1,159 @@
+import http.client
+import queue
+import threading
+import time
+from urllib.parse import urlencode
+
+from app.utils.access_log import REDACTED, read_access_log
+from app.utils.loadtest import HttpClient, LatencyHistogram, LoginFailed, RouteStats, Session
+
+# Stand-ins for redacted form values the app needs to accept the request
+FORM_FILLERS = {'shipping_address': '1 Replay Street', 'address': '1 Replay Street', 'notes': '', 'remember': ''}
+
+
+class ReplayWorker(threading.Thread):
+    """Replays the requests of the recorded sessions hashed to it, in order"""
+    
+    def __init__(self, replayer, index):
+        super().__init__(name=f'replay-{index}', daemon=True)
+        self.replayer = replayer
+        self.queue = queue.Queue(maxsize=1000)
+        self.sessions = {}
+        self.routes = {}
+        self.lag = LatencyHistogram()
+        self.mismatches = 0
+        self.failed = 0
+    
+    def record(self, label, elapsed_us, ok, query_count):
+        self.routes.setdefault(label, RouteStats()).record(elapsed_us, ok, query_count)
+    
+    def session(self, entry):
+        session = self.sessions.get(entry['s'])
+        if session is None:
+            session = Session(self, HttpClient(self.replayer.base_url))
+            role = entry.get('r', 'guest')
+            if role != 'guest':
+                accounts = self.replayer.accounts.get(role)
+                if not accounts:
+                    raise LoginFailed(f'No {role} accounts to replay as')
+                # The same recorded session always maps to the same account
+                email, password = accounts[int(entry['s'], 16) % len(accounts)]
+                session.login(email, password)
+            self.sessions[entry['s']] = session
+        return session
+    
+    def replay(self, entry):
+        path = entry['p']
+        query = {key: value for key, value in entry.get('q', {}).items() if value != REDACTED}
+        if query:
+            path += '?' + urlencode(query)
+        session = self.session(entry)
+        if entry['m'] == 'POST':
+            form = {key: FORM_FILLERS.get(key, 'replay') if value == REDACTED else value
+                    for key, value in entry.get('f', {}).items() if key != 'csrf_token'}
+            response = session.post(entry['e'], path, form)
+        else:
+            response = session.get(entry['e'], path)
+        if response.status != entry.get('c'):
+            self.mismatches += 1
+    
+    def run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            due = self.replayer.due(entry)
+            if due is not None:
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.lag.record(max(0.0, time.monotonic() - due) * 1e6)
+            try:
+                self.replay(entry)
+            except (LoginFailed, http.client.HTTPException, OSError) as e:
+                self.failed += 1
+                self.replayer.note_error(f"{entry['m']} {entry['p']}: {e}")
+        for session in self.sessions.values():
+            session.client.close()
+
+
+class TrafficReplayer:
+    """Re-issue captured traffic at `speed` times the recorded rate (None = as fast as possible).
+    
+    Relative timing is kept by scheduling each request at its offset from
+    the first one, and session affinity by routing every request of a
+    recorded session to the same worker and HTTP session.
+    """
+    
+    def __init__(self, base_url, accounts, speed=1.0, workers=32, blueprints=None, limit=None):
+        self.base_url = base_url.rstrip('/')
+        self.accounts = accounts
+        self.speed = speed
+        self.workers = [ReplayWorker(self, i) for i in range(workers)]
+        self.blueprints = set(blueprints) if blueprints else None
+        self.limit = limit
+        self.skipped = 0
+        self.errors = []
+        self._lock = threading.Lock()
+        self._origin = None
+        self._started = None
+    
+    def note_error(self, message):
+        with self._lock:
+            if len(self.errors) < 20:
+                self.errors.append(message)
+    
+    def due(self, entry):
+        if not self.speed:
+            return None
+        return self._started + (entry['t'] - self._origin) / self.speed
+    
+    def wanted(self, entry):
+        endpoint = entry.get('e') or ''
+        # Logins happen once per replayed session, with accounts from the target's own data
+        if endpoint.startswith('auth.'):
+            return False
+        return self.blueprints is None or endpoint.split('.')[0] in self.blueprints
+    
+    def run(self, path):
+        for worker in self.workers:
+            worker.start()
+        self._started = time.monotonic()
+        sent = 0
+        for entry in read_access_log(path):
+            if self.limit and sent >= self.limit:
+                break
+            if not self.wanted(entry):
+                self.skipped += 1
+                continue
+            if self._origin is None:
+                self._origin = entry['t']
+            self.workers[int(entry['s'], 16) % len(self.workers)].queue.put(entry)
+            sent += 1
+        for worker in self.workers:
+            worker.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        elapsed = time.monotonic() - self._started
+        return self._report(sent, elapsed)
+    
+    def _report(self, sent, elapsed):
+        routes, overall, lag = {}, RouteStats(), LatencyHistogram()
+        mismatches = failed = 0
+        for worker in self.workers:
+            for label, stats in worker.routes.items():
+                routes.setdefault(label, RouteStats()).merge(stats)
+                overall.merge(stats)
+            lag.merge(worker.lag)
+            mismatches += worker.mismatches
+            failed += worker.failed
+        summary = overall.to_dict()
+        summary.update(replayed=sent, skipped=self.skipped, failed=failed, status_mismatches=mismatches,
+                       elapsed_s=round(elapsed, 2), throughput_rps=round(overall.latency.total / elapsed, 2))
+        if self.speed:
+            summary['schedule_lag_ms'] = lag.summary()
+        return {
+            'summary': summary,
+            'routes': {label: routes[label].to_dict() for label in sorted(routes)},
+            'sample_errors': self.errors,
+        }
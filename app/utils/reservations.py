@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process sweeps
+    fcntl = None
+
+_start_lock = threading.Lock()
+
+
+class ReservationSweeper(threading.Thread):
+    """Background thread that reclaims expired stock holds in batches.
+    
+    Every process serving the app runs one, but only the process holding
+    the host's sweeper lock sweeps; the others take over if it exits.
+    """
+    
+    def __init__(self, app, interval=60, batch_size=500):
+        super().__init__(name='reservation-sweeper', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock_path = os.path.join(app.instance_path, 'reservation_sweeper.lock')
+        self._lock_file = None
+        self._stop_event = threading.Event()
+    
+    def claim(self):
+        """True once this process holds the sweeper lock (kept until the process exits)"""
+        if fcntl is None or self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        handle = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        self._lock_file = handle
+        logging.info(f'Process {os.getpid()} is sweeping expired stock reservations')
+        return True
+    
+    def run(self):
+        from app import db
+        from app.models import StockReservation
+        while not self._stop_event.wait(self.interval):
+            if not self.claim():
+                continue
+            with self.app.app_context():
+                try:
+                    purged = StockReservation.purge_expired(self.batch_size)
+                    if purged:
+                        logging.info(f'Reclaimed {purged} expired stock reservations')
+                except Exception as e:
+                    db.session.rollback()
+                    logging.warning(f'Reservation sweep failed: {e}')
+                finally:
+                    db.session.remove()
+    
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_reservation_sweeper(app):
+    """Start the sweeper once per process"""
+    sweeper = app.extensions.get('reservation_sweeper')
+    if sweeper is None:
+        with _start_lock:
+            sweeper = app.extensions.get('reservation_sweeper')
+            if sweeper is None:
+                sweeper = ReservationSweeper(
+                    app,
+                    interval=app.config.get('RESERVATION_SWEEP_INTERVAL', 60),
+                    batch_size=app.config.get('RESERVATION_SWEEP_BATCH', 500)
+                )
+                app.extensions['reservation_sweeper'] = sweeper
+                sweeper.start()
+    return sweeper
+
+
+def init_reservation_sweeper(app):
+    """Start the sweeper with the first request a process handles, unless disabled in config.
+    
+    Starting it in create_app would leave a thread running in a
+    preloading server's master, which then forks its workers from a
+    process with a thread that may hold a lock. Only workers handle
+    requests, so each starts its own after the fork.
+    """
+    if app.testing or app.config.get('USE_AWS') or not app.config.get('RESERVATION_SWEEPER', True):
+        return
+    
+    @app.before_request
+    def _start_sweeper():
+        if 'reservation_sweeper' not in app.extensions:
+            start_reservation_sweeper(app)
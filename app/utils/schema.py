@@ -0,0 +1,105 @@
+import logging
+from sqlalchemy import inspect, literal
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _merge_duplicate_cart_lines(connection):
+    """Fold repeated (cart, book) lines into the oldest one so the unique index can be built"""
+    from app.models import CartItem
+    items = CartItem.__table__
+    duplicates = connection.execute(
+        db.select(items.c.cart_id, items.c.book_id, db.func.min(items.c.id), db.func.sum(items.c.quantity))
+        .group_by(items.c.cart_id, items.c.book_id).having(db.func.count() > 1)).all()
+    for cart_id, book_id, keep_id, quantity in duplicates:
+        connection.execute(items.update().where(items.c.id == keep_id).values(quantity=quantity))
+        connection.execute(items.delete().where(items.c.cart_id == cart_id, items.c.book_id == book_id,
+                                                items.c.id != keep_id))
+
+
+def _backfill_cart_summary(connection):
+    from app.models import Book, Cart, CartItem
+    carts, items, books = Cart.__table__, CartItem.__table__, Book.__table__
+    lines = items.c.cart_id == carts.c.id
+    connection.execute(carts.update().values(
+        item_count=db.select(db.func.coalesce(db.func.sum(items.c.quantity), 0)).where(lines).scalar_subquery(),
+        subtotal=db.select(db.func.round(db.func.coalesce(db.func.sum(items.c.quantity * books.c.price), 0.0), 2))
+        .select_from(items.join(books, books.c.id == items.c.book_id)).where(lines).scalar_subquery(),
+        updated_at=carts.c.updated_at))
+
+
+# Run before a missing index is built, e.g. to remove rows that would violate it
+BEFORE_INDEX = {'uq_cart_items_cart_book': _merge_duplicate_cart_lines}
+# Run once a table's new columns have been added, to fill them in for the rows already there
+BACKFILLS = {('carts', 'item_count'): _backfill_cart_summary, ('carts', 'subtotal'): _backfill_cart_summary}
+# Columns holding sales counters, recounted from order history by rebuild_sales() once the upgrade commits
+SALES_COUNTERS = {('books', 'units_sold')}
+
+
+def _column_ddl(column, dialect):
+    preparer = dialect.identifier_preparer
+    ddl = f'{preparer.quote(column.name)} {column.type.compile(dialect)}'
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += ' DEFAULT ' + str(literal(default, column.type).compile(dialect=dialect,
+                                                                        compile_kwargs={'literal_binds': True}))
+        if not column.nullable:
+            # Existing rows take the default, so NOT NULL can hold from the start
+            ddl += ' NOT NULL'
+    return ddl
+
+
+def upgrade_schema():
+    """Add the columns and indexes the models gained since a table was created; returns what changed.
+    
+    create_all() only creates missing tables, so a database made by an
+    earlier release is brought up to date here: new columns are added
+    (and backfilled where the rows already there need a value) and new
+    indexes and unique constraints are built. Nothing is dropped.
+    """
+    changes = []
+    recount_sales = False
+    with db.engine.begin() as connection:
+        dialect = connection.dialect
+        preparer = dialect.identifier_preparer
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            backfills = []
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                connection.exec_driver_sql(
+                    f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {_column_ddl(column, dialect)}')
+                changes.append(f'{table.name}.{column.name}')
+                backfill = BACKFILLS.get((table.name, column.name))
+                if backfill is not None and backfill not in backfills:
+                    backfills.append(backfill)
+                recount_sales = recount_sales or (table.name, column.name) in SALES_COUNTERS
+            for backfill in backfills:
+                backfill(connection)
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            indexes.update(constraint['name'] for constraint in inspector.get_unique_constraints(table.name))
+            wanted = [(index.name, index.unique, [column.name for column in index.columns]) for index in table.indexes]
+            wanted += [(constraint.name, True, [column.name for column in constraint.columns])
+                       for constraint in table.constraints
+                       if isinstance(constraint, db.UniqueConstraint) and isinstance(constraint.name, str)]
+            for name, unique, names in wanted:
+                if name in indexes:
+                    continue
+                if name in BEFORE_INDEX:
+                    BEFORE_INDEX[name](connection)
+                connection.exec_driver_sql(
+                    f"CREATE {'UNIQUE ' if unique else ''}INDEX {preparer.quote(name)} ON "
+                    f"{preparer.format_table(table)} ({', '.join(preparer.quote(n) for n in names)})")
+                changes.append(name)
+    if recount_sales:
+        from app.utils.bestsellers import rebuild_sales
+        rebuild_sales()
+    for change in changes:
+        logger.info('Schema upgraded: %s', change)
+    return changes
@@ -0,0 +1,126 @@
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+_listening = False
+
+
+def _enabled(app):
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    return (app.config.get('SQLITE_TUNING') and not app.config.get('USE_AWS') and url.get_backend_name() == 'sqlite'
+            and url.database not in (None, '', ':memory:'))
+
+
+def _pragmas(app):
+    return {
+        # WAL lets readers carry on while the writer commits; NORMAL only syncs at checkpoints, which WAL keeps safe
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(app.config.get('SQLITE_BUSY_TIMEOUT', 5) * 1000),
+        'mmap_size': app.config.get('SQLITE_MMAP_MB', 256) * 2 ** 20,
+        # Negative sizes are KiB rather than pages
+        'cache_size': -app.config.get('SQLITE_CACHE_MB', 16) * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+
+def _set_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    # busy_timeout first, so switching to WAL waits for another process instead of failing
+    for name in sorted(pragmas, key=lambda name: name != 'busy_timeout'):
+        cursor.execute(f'PRAGMA {name}={pragmas[name]}')
+    cursor.close()
+
+
+def sqlite_engine_options(app):
+    """SQLALCHEMY_ENGINE_OPTIONS for the writer: a single pooled connection that requests queue for"""
+    if not _enabled(app):
+        return
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options.update(poolclass=QueuePool, pool_size=1, max_overflow=0,
+                   pool_timeout=app.config.get('SQLITE_WRITE_TIMEOUT', 30))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def _init_writer(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        _set_pragmas(dbapi_connection, pragmas)
+        # pysqlite's own BEGIN is deferred and only sent before DML; begin below takes over
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(engine, 'begin')
+    def begin(connection):
+        # Take the write lock up front: a deferred transaction that reads and then writes can fail with
+        # "database is locked" without busy_timeout ever applying, when another process committed in between
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _init_reader(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def connect(dbapi_connection, connection_record):
+        _set_pragmas(dbapi_connection, dict(pragmas, query_only='ON'))
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs to the reader pool and everything else to the writer.
+    
+    A transaction moves to the writer, reads included, once it writes,
+    locks rows (with_for_update) or is marked with use_writer(). Code
+    that reads rows and then writes based on them (cart and checkout)
+    marks its transaction first, so the read happens under the write
+    lock; a read made on a reader beforehand would not be protected. The
+    next transaction starts on the readers again. Apps without a reader
+    pool get Flask-SQLAlchemy's usual choice.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        reader = current_app.extensions.get('sqlite_reader')
+        if bind is not None or reader is None:
+            return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+        if clause is None and not self._flushing:
+            # A bare get_bind() asks which database this is; either engine answers that
+            return super().get_bind(mapper, bind=bind, **kwargs)
+        if (not self._flushing and not self.info.get('sqlite_wrote') and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None):
+            return reader
+        self.info['sqlite_wrote'] = True
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_writer(session=None):
+    """Send the rest of the current transaction, reads included, to the writer (a no-op without a reader pool)"""
+    from app import db
+    (session or db.session()).info['sqlite_wrote'] = True
+
+
+def _transaction_ended(session, *args):
+    session.info.pop('sqlite_wrote', None)
+
+
+def init_sqlite(app):
+    """WAL, synchronous=NORMAL, mmap and cache pragmas, one writer connection and a pool of read-only readers.
+    
+    Enabled with SQLITE_TUNING for file databases; sqlite_engine_options()
+    must have shaped the writer's pool before db.init_app.
+    """
+    global _listening
+    if not _enabled(app):
+        return
+    from app import db
+    pragmas = _pragmas(app)
+    with app.app_context():
+        writer = db.engine
+    _init_writer(writer, pragmas)
+    reader = create_engine(writer.url, poolclass=QueuePool, pool_size=app.config.get('SQLITE_READERS', 4),
+                           max_overflow=0, pool_timeout=app.config.get('SQLITE_WRITE_TIMEOUT', 30))
+    _init_reader(reader, pragmas)
+    app.extensions['sqlite_reader'] = reader
+    if not _listening:
+        # Sessions are process-wide, so the class and its listeners are set up once
+        db.session.session_factory.class_ = RoutingSession
+        for name in ('after_commit', 'after_rollback', 'after_soft_rollback'):
+            event.listen(RoutingSession, name, _transaction_ended)
+        _listening = True
@@ -0,0 +1,46 @@
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Runs in a fresh interpreter, so every import is paid for; prints create_app's wall time in ms last
+PROBE = ('import sys, time; sys.path.insert(0, {root!r}); started = time.perf_counter(); '
+         'from app import create_app; create_app(); print(round((time.perf_counter() - started) * 1000, 1))')
+
+
+def parse_importtime(text):
+    """[(module, self ms, cumulative ms)] from the stderr of `python -X importtime`, in import order"""
+    modules = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return modules
+
+
+def profile_startup(runs=3, top=15, env=None):
+    """create_app timed in `runs` fresh interpreters, with an import-time summary of the last one"""
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(root=ROOT)], cwd=ROOT,
+                                env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.split()[-1]))
+    modules = parse_importtime(result.stderr)
+    packages = {}
+    for name, self_ms, _ in modules:
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + self_ms
+    return {
+        'startup_ms': statistics.median(timings),
+        'runs_ms': timings,
+        'import_ms': round(sum(self_ms for _, self_ms, _ in modules), 1),
+        'modules': len(modules),
+        'packages': {name: round(ms, 1) for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        'slowest': [{'module': name, 'self_ms': round(self_ms, 1), 'cumulative_ms': round(cumulative_ms, 1)}
+                    for name, self_ms, cumulative_ms in sorted(modules, key=lambda m: -m[2])[:top]],
+        'aws_loaded': any(name in ('boto3', 'botocore') for name, _, _ in modules),
+    }
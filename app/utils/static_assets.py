@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+from app.utils.compression import COMPRESSIBLE_TYPES, brotli
+
+# Fingerprinted copies, their .br/.gz variants and the manifest, under the static folder
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# A fingerprinted name changes with its content, so browsers may keep it for a year without asking again
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Client encodings tried in order, with the suffix of the prebuilt variant
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def build_assets(static_folder):
+    """Copy every static file into dist/ under a content-hashed name, plus .br/.gz variants; returns the manifest.
+    
+    Earlier builds are left in place, so pages rendered before a deploy
+    keep finding the files they name.
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [name for name in dirs if name != BUILD_DIR]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, ext = os.path.splitext(relative)
+            hashed = f'{BUILD_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            target = os.path.join(static_folder, *hashed.split('/'))
+            _write(target, data)
+            if mimetypes.guess_type(name)[0] in COMPRESSIBLE_TYPES:
+                # Built once at the highest levels, where on-the-fly compression could not afford them
+                _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(target + '.br', brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+    _write(os.path.join(static_folder, BUILD_DIR, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def send_static(filename):
+    """The static view: fingerprinted files are immutable and sent pre-compressed when the client allows"""
+    static_folder = current_app.static_folder
+    if not filename.startswith(BUILD_DIR + '/'):
+        return current_app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(safe_join(static_folder, filename + suffix) or ''):
+            response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(static_folder, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_static_assets(app):
+    """Point url_for('static', ...) at the fingerprinted copies when `flask build-assets` has made them"""
+    if not app.config.get('STATIC_FINGERPRINT', True) or app.static_folder is None:
+        return
+    path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        manifest = json.load(f)
+    app.extensions['static_manifest'] = manifest
+    app.view_functions['static'] = send_static
+    
+    @app.url_defaults
+    def fingerprint(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
@@ -8,7 +8,7 @@ def create_tables():
     region = os.environ.get('AWS_REGION', 'us-east-1')
     print(f"Initializing DynamoDB tables in region: {region}")
     
-    dynamodb = boto3.resource('dynamodb', region_name=region)
+    dynamodb = boto3.resource('dynamodb', region_name=region, endpoint_url=os.environ.get('AWS_ENDPOINT_URL'))
     
     tables = [
         {
@@ -19,7 +19,21 @@ def create_tables():
         {
             'TableName': os.environ.get('DYNAMODB_BOOKS_TABLE', 'Books'),
             'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
-            'AttributeDefinitions': [{'AttributeName': 'id', 'AttributeType': 'S'}]
+            'AttributeDefinitions': [
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'updated_day', 'AttributeType': 'S'},
+                {'AttributeName': 'updated_at', 'AttributeType': 'S'}
+            ],
+            # Books changed since a time, day by day; catalog snapshots read their deltas here instead of scanning
+            'GlobalSecondaryIndexes': [{
+                'IndexName': 'updated_day-updated_at-index',
+                'KeySchema': [
+                    {'AttributeName': 'updated_day', 'KeyType': 'HASH'},
+                    {'AttributeName': 'updated_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }]
         },
         {
             'TableName': os.environ.get('DYNAMODB_CATEGORIES_TABLE', 'Categories'),
@@ -29,25 +43,61 @@ def create_tables():
         {
             'TableName': os.environ.get('DYNAMODB_ORDERS_TABLE', 'Orders'),
             'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
-            'AttributeDefinitions': [{'AttributeName': 'id', 'AttributeType': 'S'}]
+            'AttributeDefinitions': [
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'user_id', 'AttributeType': 'S'},
+                {'AttributeName': 'order_number', 'AttributeType': 'S'}
+            ],
+            # Order numbers are time-sortable, so this serves "my orders, newest first"
+            'GlobalSecondaryIndexes': [{
+                'IndexName': 'user_id-order_number-index',
+                'KeySchema': [
+                    {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'order_number', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'},
+                'ProvisionedThroughput': {'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+            }]
         },
         {
             'TableName': os.environ.get('DYNAMODB_CARTS_TABLE', 'Carts'),
             'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
             'AttributeDefinitions': [{'AttributeName': 'id', 'AttributeType': 'S'}]
+        },
+        {
+            'TableName': os.environ.get('DYNAMODB_RECOMMENDATIONS_TABLE', 'Recommendations'),
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [{'AttributeName': 'id', 'AttributeType': 'S'}]
+        },
+        {
+            # Copies sold per day and book; bestseller windows query a bounded run of days
+            'TableName': os.environ.get('DYNAMODB_SALES_TABLE', 'BookSales'),
+            'KeySchema': [
+                {'AttributeName': 'day', 'KeyType': 'HASH'},
+                {'AttributeName': 'book_id', 'KeyType': 'RANGE'}
+            ],
+            'AttributeDefinitions': [
+                {'AttributeName': 'day', 'AttributeType': 'S'},
+                {'AttributeName': 'book_id', 'AttributeType': 'S'}
+            ],
+            'TimeToLiveAttribute': 'expires_at'
         }
     ]
     
     for table_config in tables:
+        ttl_attribute = table_config.pop('TimeToLiveAttribute', None)
         try:
             print(f"Creating table {table_config['TableName']}...")
             table = dynamodb.create_table(
-                TableName=table_config['TableName'],
-                KeySchema=table_config['KeySchema'],
-                AttributeDefinitions=table_config['AttributeDefinitions'],
-                ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+                ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+                **table_config
             )
             table.wait_until_exists()
+            if ttl_attribute:
+                dynamodb.meta.client.update_time_to_live(
+                    TableName=table_config['TableName'],
+                    TimeToLiveSpecification={'Enabled': True, 'AttributeName': ttl_attribute}
+                )
             print(f"Table {table_config['TableName']} created successfully.")
         except Exception as e:
             if 'ResourceInUseException' in str(e):
@@ -0,0 +1,167 @@
+"""End-to-end HTTP load test for BookBazaar
+
+Drives realistic journeys (browse, search, book detail, add to cart,
+checkout, seller inventory edits, admin dashboard) with concurrent virtual
+users and writes throughput, latency percentiles and per-route query
+counts to a JSON file. For example:
+
+    python seed_data.py --books 100000 --users 20000 --orders 500000
+    python benchmark.py --mix shopping --concurrency 16 --duration 60 --output before.json
+    python benchmark.py --mix shopping --concurrency 16 --duration 60 --output after.json --compare before.json
+
+By default the app is served in-process on a random port, threaded like
+run.py; --server prefork starts serve.py with --workers processes instead,
+so the two entry points can be compared. Pass --url to load an already
+running server (start it with QUERY_STATS=true to get query counts). --backend aws runs against DynamoDB Local, which must
+be reachable at AWS_ENDPOINT_URL.
+"""
+import argparse
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+sys.path.insert(0, '.')
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve_in_process(app):
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.port}'
+
+
+def serve_prefork(workers, worker_class, timeout=120):
+    """Start serve.py on a free port and wait until every worker is serving"""
+    import json
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                                '--worker-class', worker_class], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + timeout
+    while time.time() < deadline and process.poll() is None:
+        try:
+            with urllib.request.urlopen(base_url + '/_server/metrics', timeout=5) as response:
+                report = json.load(response)
+            if sum(worker['ready'] for worker in report['workers']) >= workers:
+                return process, base_url
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('serve.py did not start; run it by hand to see why')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['sql', 'aws'], default='sql')
+    parser.add_argument('--url', help='Load an already running server instead of serving in-process')
+    parser.add_argument('--server', choices=['in-process', 'prefork'], default='in-process',
+                        help='What serves the app when --url is not given')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='serve.py workers (prefork)')
+    parser.add_argument('--worker-class', choices=['sync', 'threaded'], default='sync', help='serve.py worker class')
+    parser.add_argument('--mix', default='shopping',
+                        help="browse, shopping, checkout, full, or weights like 'browse=5,checkout=1'")
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before the run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--password', default='password123', help='Password of the sampled customers and sellers')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='Report regressions against an earlier result file')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent')
+    args = parser.parse_args()
+    
+    os.environ['USE_AWS'] = 'true' if args.backend == 'aws' else 'false'
+    os.environ['QUERY_STATS'] = 'true'
+    if args.backend == 'aws' and not os.environ.get('AWS_ENDPOINT_URL'):
+        parser.error('--backend aws needs AWS_ENDPOINT_URL (e.g. DynamoDB Local) so real tables are not loaded')
+    
+    from app import create_app
+    from app.utils.loadtest import Dataset, LoadTest, compare_results, parse_mix, save_results
+    
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    app = create_app()
+    dataset = Dataset.sample(app, password=args.password, admin_password=args.admin_password)
+    if not dataset.book_ids:
+        parser.error('No books in stock to benchmark; run seed_data.py first')
+    
+    server = process = None
+    base_url = args.url
+    if not base_url and args.server == 'prefork':
+        process, base_url = serve_prefork(args.workers, args.worker_class)
+    elif not base_url:
+        server, base_url = serve_in_process(app)
+    
+    print(f'Running {args.mix} mix against {base_url} ({args.backend}): {args.concurrency} users, '
+          f'{args.warmup:g}s warm-up + {args.duration:g}s')
+    try:
+        results = LoadTest(base_url, dataset, mix, concurrency=args.concurrency, duration=args.duration,
+                           warmup=args.warmup, seed=args.seed).run()
+    finally:
+        if server is not None:
+            server.shutdown()
+        if process is not None:
+            process.terminate()
+            process.wait()
+    
+    results['meta'] = {
+        'commit': git_commit(),
+        'backend': args.backend,
+        'url': args.url or args.server,
+        'workers': f'{args.workers} {args.worker_class}' if not args.url and args.server == 'prefork' else None,
+        'started_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+    }
+    save_results(results, args.output)
+    
+    summary = results['summary']
+    print(f"{summary['requests']} requests, {summary['errors']} errors, {summary['throughput_rps']} req/s")
+    print(f"{'route':28} {'reqs':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for label, route in results['routes'].items():
+        latency = route['latency_ms']
+        queries = route.get('queries', {}).get('mean', '-')
+        print(f"{label:28} {route['requests']:>7} {latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} "
+              f"{queries:>8}")
+    for error in results['sample_errors']:
+        print(f'error: {error}')
+    print(f'Results written to {args.output}')
+    
+    if args.compare:
+        import json
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        for label, metric, old, new, change in regressions:
+            print(f'REGRESSION {label} {metric}: {old} -> {new} ({change:+}%)')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions over {args.threshold:g}% against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Replay captured BookBazaar traffic against a test instance
+
+Capture traffic by running the app with ACCESS_LOG_PATH set, then replay it
+at the recorded pace, faster, or as fast as the server allows:
+
+    ACCESS_LOG_PATH=access.log python run.py
+    python replay.py access.log --speed 10 --output replay.json
+
+Each recorded session is replayed by one HTTP session, logged in as an
+account of the same role from the target's data, and requests keep their
+relative timing (divided by --speed). By default the app is served
+in-process; pass --url to replay against a running server.
+"""
+import argparse
+import os
+import platform
+import sys
+from datetime import datetime
+sys.path.insert(0, '.')
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from benchmark import git_commit, serve_in_process
+
+
+def parse_speed(value):
+    if value == 'max':
+        return None
+    speed = float(value.rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('speed must be positive or "max"')
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', help='Access log written with ACCESS_LOG_PATH')
+    parser.add_argument('--url', help='Replay against an already running server instead of serving in-process')
+    parser.add_argument('--speed', type=parse_speed, default=1.0, help="1, 10 (or 10x), ... or 'max'")
+    parser.add_argument('--workers', type=int, default=32, help='Concurrent replay workers')
+    parser.add_argument('--blueprints', default='main,customer,seller',
+                        help="Comma-separated blueprints to replay, or 'all'")
+    parser.add_argument('--limit', type=int, help='Replay at most this many requests')
+    parser.add_argument('--password', default='password123', help='Password of the customer and seller accounts')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument('--output', default='replay-results.json')
+    args = parser.parse_args()
+    
+    os.environ['QUERY_STATS'] = 'true'
+    # Never append the replayed traffic to the log being replayed
+    os.environ.pop('ACCESS_LOG_PATH', None)
+    
+    from app import create_app
+    from app.utils.loadtest import Dataset, save_results
+    from app.utils.replay import TrafficReplayer
+    
+    app = create_app()
+    dataset = Dataset.sample(app, books=1, password=args.password, admin_password=args.admin_password)
+    accounts = {
+        'customer': [(email, args.password) for email in dataset.customers],
+        'seller': [(email, args.password) for email in dataset.sellers],
+        'admin': [(email, args.admin_password) for email in dataset.admins],
+    }
+    
+    server = None
+    base_url = args.url
+    if not base_url:
+        server, base_url = serve_in_process(app)
+    
+    blueprints = None if args.blueprints == 'all' else args.blueprints.split(',')
+    speed = f'{args.speed:g}x' if args.speed else 'max speed'
+    print(f'Replaying {args.log} against {base_url} at {speed} with {args.workers} workers')
+    try:
+        results = TrafficReplayer(base_url, accounts, speed=args.speed, workers=args.workers,
+                                  blueprints=blueprints, limit=args.limit).run(args.log)
+    finally:
+        if server is not None:
+            server.shutdown()
+    
+    results['meta'] = {
+        'commit': git_commit(),
+        'log': args.log,
+        'speed': args.speed or 'max',
+        'url': args.url or 'in-process',
+        'started_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+    }
+    save_results(results, args.output)
+    
+    summary = results['summary']
+    print(f"{summary['replayed']} replayed ({summary['skipped']} skipped, {summary['failed']} failed) in "
+          f"{summary['elapsed_s']}s, {summary['throughput_rps']} req/s, "
+          f"{summary['status_mismatches']} status codes differ from the recording")
+    if 'schedule_lag_ms' in summary:
+        print(f"Schedule lag p50 {summary['schedule_lag_ms']['p50']} ms, p99 {summary['schedule_lag_ms']['p99']} ms")
+    print(f"{'route':28} {'reqs':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for label, route in results['routes'].items():
+        latency = route['latency_ms']
+        queries = route.get('queries', {}).get('mean', '-')
+        print(f"{label:28} {route['requests']:>7} {latency['p50']:>9} {latency['p95']:>9} {latency['p99']:>9} "
+              f"{queries:>8}")
+    for error in results['sample_errors']:
+        print(f'error: {error}')
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
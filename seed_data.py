@@ -1,17 +1,24 @@
-"""Script to add sample books to the database"""
+"""Script to add sample books to the database
+
+Without arguments it adds a small hand-picked sample. Pass volumes to
+generate a large synthetic dataset instead, for example:
+
+    python seed_data.py --books 1000000 --users 200000 --orders 5000000 --seed 7
+"""
+import argparse
 import sys
 sys.path.insert(0, '.')
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from app import create_app, db
+from app import create_app, db, init_database
+from app.utils.datagen import DatasetGenerator
 from app.models import Book, Category, User
 from werkzeug.security import generate_password_hash
 
-app = create_app()
 
-with app.app_context():
+def seed_samples():
     # Create a sample seller
     seller = User.query.filter_by(email='seller@bookbazaar.com').first()
     if not seller:
@@ -64,3 +71,29 @@ with app.app_context():
     print("\nLogin credentials:")
     print("Admin: admin@bookbazaar.com / admin123")
     print("Seller: seller@bookbazaar.com / seller123")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed BookBazaar with sample or synthetic data.')
+    parser.add_argument('--books', type=int, help='Number of synthetic books to generate')
+    parser.add_argument('--users', type=int, default=2000, help='Synthetic users (about 2%% are sellers)')
+    parser.add_argument('--orders', type=int, default=20000, help='Synthetic orders')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; same seed, same dataset')
+    parser.add_argument('--days', type=int, default=365, help='Days of order history to spread orders over')
+    parser.add_argument('--cart-ratio', type=float, default=0.3, help='Share of customers with a cart')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+    args = parser.parse_args()
+    
+    app = create_app()
+    with app.app_context():
+        init_database()
+        if args.books:
+            DatasetGenerator(seed=args.seed, books=args.books, users=args.users, orders=args.orders,
+                             cart_ratio=args.cart_ratio, days=args.days, batch_size=args.batch_size).run()
+            print("\nSynthetic data generated. All synthetic users have the password 'password123'.")
+        else:
+            seed_samples()
+
+
+if __name__ == '__main__':
+    main()
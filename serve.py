@@ -0,0 +1,58 @@
+"""Serve BookBazaar in production with a pre-forking master
+
+The master binds the port, builds the app once (preload) and forks the
+workers, which share the listening socket. For example:
+
+    python serve.py --workers 4 --worker-class threaded --bind 0.0.0.0:5000
+    kill -HUP <master pid>     # zero-downtime reload: new workers first, then the old ones drain
+    curl http://127.0.0.1:5000/_server/metrics
+
+Defaults come from the SERVER_* settings in app/config.py. run.py is still
+the development server.
+"""
+import argparse
+import logging
+import sys
+sys.path.insert(0, '.')
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.config import Config
+from app.utils.prefork import WORKER_CLASSES, PreforkServer
+
+
+def create_app():
+    # Imported here so that with --no-preload only the workers load the application code
+    from app import create_app as factory
+    return factory()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bind', default=Config.SERVER_BIND, help='host:port to listen on')
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--worker-class', choices=WORKER_CLASSES, default=Config.SERVER_WORKER_CLASS,
+                        help='sync: one request at a time per worker; threaded: a thread per connection')
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction, default=Config.SERVER_PRELOAD,
+                        help='Build the app once in the master (--no-preload lets HUP pick up new code)')
+    parser.add_argument('--graceful-timeout', type=float, default=Config.SERVER_GRACEFUL_TIMEOUT,
+                        help='Seconds a stopping worker may spend finishing its requests')
+    parser.add_argument('--metrics-path', default=Config.SERVER_METRICS_PATH,
+                        help="Per-worker metrics for loopback clients ('' turns them off)")
+    args = parser.parse_args()
+    
+    host, _, port = args.bind.rpartition(':')
+    if not host or not port.isdigit():
+        parser.error('--bind must be host:port')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    server = PreforkServer(create_app, host=host.strip('[]'), port=int(port), workers=args.workers,
+                           worker_class=args.worker_class, preload=args.preload,
+                           graceful_timeout=args.graceful_timeout, metrics_path=args.metrics_path)
+    server.run()
+    if server.boot_failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()